@@ -1,19 +1,62 @@
 import logging
+import requests
 import telebot
 
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from telebot import apihelper
+
+from bot.ratelimit import telegram_bucket
 
 commands = settings.BOT_COMMANDS
 
-bot = telebot.TeleBot(
-    settings.BOT_TOKEN,
-    threaded=False,
-    skip_pending=True,
-)
+telegram_session = requests.Session()
+
+
+def rate_limited_request_sender(method, url, **kwargs):
+    """Отправляет запросы к Telegram Bot API с учетом общего лимита частоты"""
+    telegram_bucket.acquire()
+    response = telegram_session.request(method, url, **kwargs)
+    if response.status_code == 429:
+        # Telegram сообщает паузу в parameters.retry_after
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after')
+        except ValueError:
+            retry_after = None
+        telegram_bucket.penalize(retry_after)
+    else:
+        telegram_bucket.reward()
+    return response
+
+
+apihelper.CUSTOM_REQUEST_SENDER = rate_limited_request_sender
+
+def create_bot():
+    """Создает экземпляр бота; запросов к Telegram при этом не выполняется"""
+    return telebot.TeleBot(
+        settings.BOT_TOKEN,
+        threaded=False,
+        skip_pending=True,
+    )
+
+
+# Бот создается при первом обращении, поэтому импорт приложения (manage.py,
+# cron, обработчик очереди) не зависит от доступности Telegram
+bot = SimpleLazyObject(create_bot)
 
-bot.set_my_commands(commands)
 
-logging.info(f'@{bot.get_me().username} started')
+def setup_bot():
+    """
+    Регистрирует команды бота в Telegram и проверяет токен.
+    Выполняется при установке вебхука (view set_webhook, команда setup_bot).
+    
+    Returns:
+        str: Имя пользователя бота
+    """
+    bot.set_my_commands(commands)
+    username = bot.get_me().username
+    logging.info(f'@{username} started')
+    return username
 
 logger = telebot.logger
 logger.setLevel(logging.INFO)
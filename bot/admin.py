@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, AvitoAccount, UserAvitoAccount, AvitoAccountDailyStats
+from .models import User, AvitoAccount, UserAvitoAccount, AvitoAccountDailyStats, AvitoAccountMonthlyStats, ExpenseResetHistory, TelegramUpdateJob
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('user_name',)  # Удалены недопустимые поля
@@ -30,7 +30,29 @@ class AvitoAccountDailyStatsAdmin(admin.ModelAdmin):
     date_hierarchy = 'date'
     ordering = ('-date',)
 
+class AvitoAccountMonthlyStatsAdmin(admin.ModelAdmin):
+    list_display = ('avito_account', 'month', 'days', 'total_calls', 'total_chats', 'views', 'contacts', 'daily_expense')
+    list_filter = ('avito_account',)
+    search_fields = ('avito_account__name',)
+    date_hierarchy = 'month'
+    ordering = ('-month',)
+
+class ExpenseResetHistoryAdmin(admin.ModelAdmin):
+    list_display = ('avito_account', 'period', 'amount', 'reset_at')
+    list_filter = ('period', 'avito_account')
+    search_fields = ('avito_account__name',)
+    date_hierarchy = 'reset_at'
+
+class TelegramUpdateJobAdmin(admin.ModelAdmin):
+    list_display = ('update_id', 'status', 'attempts', 'created_at', 'started_at')
+    list_filter = ('status',)
+    search_fields = ('update_id',)
+    ordering = ('-id',)
+
 admin.site.register(User, UserAdmin)
 admin.site.register(AvitoAccount, AvitoAccountAdmin)
 admin.site.register(UserAvitoAccount, UserAvitoAccountAdmin)
 admin.site.register(AvitoAccountDailyStats, AvitoAccountDailyStatsAdmin)
+admin.site.register(AvitoAccountMonthlyStats, AvitoAccountMonthlyStatsAdmin)
+admin.site.register(ExpenseResetHistory, ExpenseResetHistoryAdmin)
+admin.site.register(TelegramUpdateJob, TelegramUpdateJobAdmin)
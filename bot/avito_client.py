@@ -0,0 +1,277 @@
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from bot.ratelimit import avito_bucket, get_client_bucket
+
+logger = logging.getLogger(__name__)
+
+AVITO_API_URL = 'https://api.avito.ru'
+AVITO_TOKEN_URL = f'{AVITO_API_URL}/token'
+
+# Коды ответа, при которых запрос повторяется с экспоненциальной задержкой.
+# 429 повторяется отдельно, через ограничитель частоты (см. AvitoClient.request)
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+def parse_retry_after(value):
+    """Возвращает задержку из заголовка Retry-After в секундах (число секунд или HTTP-дата)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AvitoClient:
+    """
+    Общий HTTP-клиент для API Авито.
+
+    Держит одну requests.Session с пулом keep-alive соединений, поэтому
+    повторные запросы к api.avito.ru не платят за новое TCP+TLS рукопожатие.
+    Запросы с кодами 5xx и обрывы соединения повторяются с экспоненциальной
+    задержкой. Частота запросов ограничивается общим лимитом процесса и
+    лимитом client_id, которому принадлежит токен; ответ 429 замедляет
+    ограничитель (с учетом Retry-After), и запрос повторяется. На ответ 401
+    токен client_id сбрасывается в кэше, и запрос один раз повторяется
+    с новым токеном.
+    """
+
+    def __init__(self, timeout=None, connect_timeout=None, pool_connections=None,
+                 pool_maxsize=None, max_retries=None, backoff_factor=None):
+        self.max_retries = max_retries if max_retries is not None else settings.AVITO_API_MAX_RETRIES
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.AVITO_API_CONNECT_TIMEOUT,
+            timeout if timeout is not None else settings.AVITO_API_TIMEOUT,
+        )
+
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=backoff_factor if backoff_factor is not None else settings.AVITO_API_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS_CODES,
+            # Все POST-запросы к API Авито - это запросы на чтение статистики
+            allowed_methods=frozenset({'GET', 'POST'}),
+            respect_retry_after_header=True,
+            # После исчерпания попыток возвращаем последний ответ, чтобы
+            # вызывающий код мог сам обработать 429/5xx
+            raise_on_status=False,
+        )
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections or settings.AVITO_API_POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize or settings.AVITO_API_POOL_MAXSIZE,
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        # Отдельный пул для хоста API Авито, остальные хосты используют адаптер по умолчанию
+        self.session.mount(AVITO_API_URL, adapter)
+
+        # Блокировки обновления токена внутри процесса, по одной на client_id
+        self._token_locks = {}
+        self._token_locks_guard = threading.Lock()
+        # Какому client_id принадлежит токен - для лимита частоты по аккаунту
+        # и обновления токена по ответу 401. Хранятся текущий и предыдущий
+        # токены каждого client_id (см. _remember_token)
+        self._token_clients = {}
+        self._client_tokens = {}
+        # Секреты client_id для получения нового токена по ответу 401
+        self._client_secrets = {}
+
+    def _remember_token(self, client_id, access_token):
+        """
+        Запоминает текущий токен client_id. Предыдущий токен тоже запоминается:
+        запросы с ним (вызывающий код держит токен весь обход) отправляются
+        с текущим токеном. Более старые токены забываются.
+        """
+        with self._token_locks_guard:
+            tokens = self._client_tokens.get(client_id, ())
+            if tokens and tokens[0] == access_token:
+                return
+            for stale in tokens[1:]:
+                self._token_clients.pop(stale, None)
+            self._client_tokens[client_id] = (access_token,) + tokens[:1]
+            self._token_clients[access_token] = client_id
+
+    def _get_token_client(self, headers):
+        """Возвращает (токен из заголовка Authorization, его client_id или None)"""
+        access_token = (headers or {}).get('Authorization', '').removeprefix('Bearer ')
+        return access_token, self._token_clients.get(access_token)
+
+    def _get_buckets(self, client_id):
+        """Ограничители, через которые проходит запрос: лимит client_id (если известен) и общий"""
+        if client_id is None:
+            return [avito_bucket]
+        return [get_client_bucket(client_id), avito_bucket]
+
+    @staticmethod
+    def _with_token(kwargs, access_token):
+        """Подставляет токен в копию заголовков запроса, заголовки вызывающего кода не меняются"""
+        kwargs['headers'] = dict(kwargs['headers'], Authorization=f'Bearer {access_token}')
+
+    def request(self, method, url, **kwargs):
+        """
+        Выполняет запрос через общий пул соединений с учетом лимитов частоты.
+        
+        Ответ 429 замедляет ограничитель client_id (или общий, если токен
+        неизвестен) и приостанавливает его на время из Retry-After, после чего
+        запрос повторяется (не более max_retries раз).
+        
+        Запрос с замененным токеном отправляется с текущим токеном client_id.
+        Ответ 401 на токен известного client_id сбрасывает токен в кэше,
+        и запрос один раз повторяется с новым токеном.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        access_token, client_id = self._get_token_client(kwargs.get('headers'))
+        buckets = self._get_buckets(client_id)
+        if client_id is not None:
+            current_token = self._client_tokens[client_id][0]
+            if current_token != access_token:
+                access_token = current_token
+                self._with_token(kwargs, access_token)
+        
+        attempt = 0
+        token_refreshed = False
+        while True:
+            for bucket in buckets:
+                bucket.acquire()
+            response = self.session.request(method, url, **kwargs)
+            
+            if response.status_code == 401 and client_id is not None and not token_refreshed:
+                token_refreshed = True
+                new_token = self.refresh_access_token(client_id, access_token)
+                if new_token and new_token != access_token:
+                    logger.warning(f"Ответ 401 от API Авито для {client_id}: {url}, повтор с новым токеном")
+                    access_token = new_token
+                    self._with_token(kwargs, access_token)
+                    continue
+            
+            if response.status_code != 429:
+                for bucket in buckets:
+                    bucket.reward()
+                if response.headers.get('X-RateLimit-Remaining') == '0':
+                    buckets[0].drain()
+                return response
+            
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            buckets[0].penalize(retry_after)
+            
+            attempt += 1
+            if attempt > self.max_retries:
+                logger.warning(f"Превышен лимит запросов к API Авито (429): {url}, попыток: {attempt}")
+                return response
+            logger.info(f"Ответ 429 от API Авито: {url}, повтор через ограничитель (Retry-After: {retry_after})")
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def _get_token_lock(self, client_id):
+        with self._token_locks_guard:
+            if client_id not in self._token_locks:
+                self._token_locks[client_id] = threading.Lock()
+            return self._token_locks[client_id]
+
+    def _request_access_token(self, client_id, client_secret):
+        """Запрашивает новый токен у API Авито, возвращает (токен, время жизни в секундах)"""
+        auth_data = {
+            'grant_type': 'client_credentials',
+            'client_id': client_id,
+            'client_secret': client_secret
+        }
+
+        auth_response = self.post(AVITO_TOKEN_URL, data=auth_data)
+        auth_result = auth_response.json()
+
+        return auth_result.get('access_token'), int(auth_result.get('expires_in') or 0)
+
+    def get_access_token(self, client_id, client_secret):
+        """
+        Возвращает токен доступа для client_id из общего кэша.
+
+        Токен хранится в кэше Django (общем для всех процессов) до истечения
+        expires_in минус запас AVITO_TOKEN_REFRESH_MARGIN. Одновременные
+        обновления одного токена схлопываются: внутри процесса - блокировкой,
+        между процессами - ключом-блокировкой в кэше, остальные ждут готовый токен.
+        """
+        token_key = f"avito_token_{client_id}"
+        self._client_secrets[client_id] = client_secret
+
+        access_token = cache.get(token_key)
+        if access_token:
+            self._remember_token(client_id, access_token)
+            return access_token
+
+        with self._get_token_lock(client_id):
+            access_token = cache.get(token_key)
+            if access_token:
+                self._remember_token(client_id, access_token)
+                return access_token
+
+            lock_key = f"{token_key}_lock"
+            lock_timeout = settings.AVITO_TOKEN_LOCK_TIMEOUT
+            deadline = time.monotonic() + lock_timeout
+            lock_acquired = cache.add(lock_key, 1, timeout=lock_timeout)
+            while not lock_acquired:
+                # Токен обновляет другой процесс, ждем результат
+                time.sleep(0.2)
+                access_token = cache.get(token_key)
+                if access_token:
+                    self._remember_token(client_id, access_token)
+                    return access_token
+                if time.monotonic() > deadline:
+                    logger.warning(f"Не дождались обновления токена для {client_id}, запрашиваем самостоятельно")
+                    break
+                lock_acquired = cache.add(lock_key, 1, timeout=lock_timeout)
+
+            try:
+                access_token, expires_in = self._request_access_token(client_id, client_secret)
+                if access_token:
+                    self._remember_token(client_id, access_token)
+                    cache_timeout = expires_in - settings.AVITO_TOKEN_REFRESH_MARGIN
+                    if cache_timeout > 0:
+                        cache.set(token_key, access_token, timeout=cache_timeout)
+                    logger.info(f"Получен новый токен доступа для {client_id}, срок действия {expires_in} с")
+                return access_token
+            finally:
+                if lock_acquired:
+                    cache.delete(lock_key)
+
+    def refresh_access_token(self, client_id, rejected_token):
+        """
+        Заменяет токен, отклоненный API (отозван или истек раньше срока), новым.
+
+        Токен удаляется из общего кэша, только если там все еще лежит отклоненный:
+        иначе его уже обновил другой поток или процесс, и используется готовый.
+
+        Returns:
+            str: Новый токен или None, если секрет client_id неизвестен или токен не получен
+        """
+        client_secret = self._client_secrets.get(client_id)
+        if client_secret is None:
+            return None
+        token_key = f"avito_token_{client_id}"
+        with self._get_token_lock(client_id):
+            if cache.get(token_key) == rejected_token:
+                cache.delete(token_key)
+        return self.get_access_token(client_id, client_secret)
+
+
+avito_client = AvitoClient()
@@ -0,0 +1,302 @@
+import datetime
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from bot.cron import upsert_daily_stats
+from bot.models import AvitoAccount, AvitoAccountDailyStats, Settings
+from bot.services import get_daily_statistics, get_daily_statistics_grouped
+
+logger = logging.getLogger(__name__)
+
+# Ключ настройки (модель Settings), в которой хранится прогресс заполнения
+CHECKPOINT_KEY = 'backfill_checkpoint'
+
+
+def load_checkpoint():
+    """Возвращает сохраненный прогресс заполнения или None"""
+    value = Settings.get_value(CHECKPOINT_KEY)
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        logger.warning(f"Некорректная контрольная точка заполнения: {value}")
+        return None
+
+
+def save_checkpoint(checkpoint):
+    Settings.set_value(
+        CHECKPOINT_KEY,
+        json.dumps(checkpoint),
+        description='Прогресс заполнения исторической статистики'
+    )
+
+
+def clear_checkpoint():
+    Settings.objects.filter(key=CHECKPOINT_KEY).delete()
+
+
+def get_missing_pairs(accounts, date_from, date_to):
+    """
+    Возвращает пары (аккаунт, дата) без записи статистики за период, по возрастанию даты.
+    Существующие записи определяются одним запросом.
+    """
+    existing = set(AvitoAccountDailyStats.objects.filter(
+        avito_account__in=accounts,
+        date__gte=date_from,
+        date__lte=date_to
+    ).values_list('avito_account_id', 'date'))
+
+    pairs = []
+    date = date_from
+    while date <= date_to:
+        for account in accounts:
+            if (account.pk, date) not in existing:
+                pairs.append((account, date))
+        date += datetime.timedelta(days=1)
+    return pairs
+
+
+def fetch_daily_stats(account, date):
+    """Запрашивает статистику аккаунта за дату и возвращает несохраненную запись или None"""
+    try:
+        daily_stats = get_daily_statistics(account.client_id, account.client_secret, date, fallback=False)
+        if not daily_stats:
+            logger.warning(f"Не удалось получить статистику для аккаунта {account.name} за {date}")
+            return None
+        return AvitoAccountDailyStats.from_report_data(account, date, daily_stats)
+    finally:
+        # Каждый поток открывает свое соединение с БД, закрываем его сразу
+        connection.close()
+
+
+def fetch_account_daily_stats(account, dates):
+    """
+    Запрашивает статистику аккаунта за даты запросами за весь диапазон
+    (get_daily_statistics_grouped); если статистика с группировкой по дням
+    недоступна, запрашивает каждую дату отдельно.
+    
+    Returns:
+        list: Несохраненные записи за даты, по которым получена статистика
+    """
+    try:
+        reports = get_daily_statistics_grouped(account.client_id, account.client_secret, min(dates), max(dates))
+        if reports is None:
+            logger.info(f"Заполнение по дням для аккаунта {account.name}")
+            return [row for row in (fetch_daily_stats(account, date) for date in dates) if row is not None]
+        return [
+            AvitoAccountDailyStats.from_report_data(account, date, reports[date.isoformat()])
+            for date in dates if date.isoformat() in reports
+        ]
+    finally:
+        connection.close()
+
+
+def pair_key(account, date):
+    """Ключ пары (аккаунт, дата) в контрольной точке"""
+    return [account.pk, date.isoformat()]
+
+
+def backfill_grouped(pairs, concurrency, result, on_account_done=None):
+    """
+    Заполняет пары (аккаунт, дата) по аккаунтам: статистика аккаунта за все его
+    недостающие даты запрашивается за диапазон (fetch_account_daily_stats),
+    concurrency аккаунтов одновременно, и записывается одним bulk upsert на аккаунт.
+    
+    Args:
+        on_account_done: Функция (аккаунт, даты, даты с ошибкой), вызывается
+                         после записи каждого аккаунта
+    """
+    dates_by_account = {}
+    for account, date in pairs:
+        dates_by_account.setdefault(account, []).append(date)
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(fetch_account_daily_stats, account, dates): (account, dates)
+            for account, dates in dates_by_account.items()
+        }
+        for future in as_completed(futures):
+            account, dates = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                logger.error(f"Ошибка при получении статистики для аккаунта {account.name}: {e}")
+                rows = []
+            result["written"] += upsert_daily_stats(rows)
+            result["failed"] += len(dates) - len(rows)
+            logger.info(f"Аккаунт {account.name}: записано {len(rows)} из {len(dates)} дней")
+            if on_account_done:
+                written_dates = {row.date for row in rows}
+                on_account_done(account, dates, [date for date in dates if date not in written_dates])
+
+
+def backfill_daily_stats(days=30, account_ids=None, concurrency=None, restart=False, grouped=True):
+    """
+    Заполняет недостающую статистику аккаунтов за последние days дней (не включая сегодня).
+
+    Недостающие пары (аккаунт, дата) определяются одним запросом и обрабатываются
+    блоками дат, от старых к новым: статистика блока запрашивается параллельно
+    (concurrency потоков, с общими лимитами частоты API) и записывается одним
+    bulk upsert, после чего сохраняется контрольная точка. Прерванное заполнение
+    с теми же параметрами продолжается со следующего блока.
+    
+    При grouped статистика запрашивается по аккаунтам за весь диапазон
+    недостающих дат (несколько запросов на аккаунт вместо ~15 на каждый день,
+    см. backfill_grouped), а контрольная точка сохраняется после каждого
+    аккаунта: прерванное заполнение продолжается с необработанных аккаунтов.
+    
+    Пары, которые не удалось получить, сохраняются в контрольной точке
+    и запрашиваются повторно при продолжении заполнения.
+
+    Args:
+        days: Количество дней для заполнения
+        account_ids: ID аккаунтов AvitoAccount (по умолчанию все настроенные)
+        concurrency: Число одновременных запросов статистики (по умолчанию BACKFILL_CONCURRENCY)
+        restart: Не использовать сохраненную контрольную точку
+        grouped: Запрашивать статистику за диапазон дат, а не за каждый день
+
+    Returns:
+        dict: {"written": число записанных строк, "failed": число пар с ошибкой,
+               "skipped": число пар, пропущенных по контрольной точке}
+    """
+    concurrency = concurrency or settings.BACKFILL_CONCURRENCY
+
+    accounts = AvitoAccount.objects.filter(
+        client_id__isnull=False,
+        client_secret__isnull=False
+    ).exclude(client_id="none")
+    if account_ids:
+        accounts = accounts.filter(pk__in=account_ids)
+    accounts = list(accounts)
+
+    result = {"written": 0, "failed": 0, "skipped": 0}
+    if not accounts:
+        logger.info("Нет аккаунтов для заполнения исторических данных")
+        return result
+
+    params = {"days": days, "accounts": sorted(account_ids) if account_ids else None, "grouped": grouped}
+    checkpoint = None if restart else load_checkpoint()
+
+    if checkpoint and checkpoint.get("params") == params:
+        # Продолжаем прерванное заполнение в том же окне дат
+        date_from = datetime.date.fromisoformat(checkpoint["date_from"])
+        date_to = datetime.date.fromisoformat(checkpoint["date_to"])
+        resume_from = datetime.date.fromisoformat(checkpoint["next_date"])
+        logger.info(
+            f"Продолжение заполнения исторических данных с {resume_from}, "
+            f"обработано аккаунтов: {len(checkpoint['done_accounts'])}, "
+            f"повтор пар с ошибкой: {len(checkpoint['failed'])}"
+        )
+    else:
+        if checkpoint:
+            logger.info("Контрольная точка заполнения сохранена с другими параметрами, заполнение начинается заново")
+        today = timezone.localdate()
+        date_from = today - datetime.timedelta(days=days)
+        date_to = today - datetime.timedelta(days=1)
+        resume_from = date_from
+        checkpoint = {
+            "params": params,
+            "date_from": date_from.isoformat(),
+            "date_to": date_to.isoformat(),
+            # Заполнение по дням: первая необработанная дата
+            "next_date": date_from.isoformat(),
+            # Заполнение по аккаунтам: ID обработанных аккаунтов
+            "done_accounts": [],
+            # Пары [ID аккаунта, дата], которые не удалось получить
+            "failed": [],
+        }
+        save_checkpoint(checkpoint)
+
+    done_accounts = set(checkpoint["done_accounts"])
+    failed = {tuple(key) for key in checkpoint["failed"]}
+
+    def is_pending(account, date):
+        # Пары с ошибкой запрашиваются повторно, остальные пары уже обработанной
+        # части окна (запись могли удалить) пропускаются
+        if tuple(pair_key(account, date)) in failed:
+            return True
+        return date >= resume_from and account.pk not in done_accounts
+
+    pairs = get_missing_pairs(accounts, date_from, date_to)
+    pending = [(account, date) for account, date in pairs if is_pending(account, date)]
+    result["skipped"] = len(pairs) - len(pending)
+    pairs = pending
+
+    logger.info(
+        f"Заполнение исторических данных с {date_from} по {date_to}: "
+        f"{len(pairs)} недостающих записей для {len(accounts)} аккаунтов"
+    )
+
+    def mark_processed(processed, failed_pairs):
+        for account, date in processed:
+            failed.discard(tuple(pair_key(account, date)))
+        failed.update(tuple(pair_key(account, date)) for account, date in failed_pairs)
+        checkpoint["failed"] = sorted(list(key) for key in failed)
+
+    if grouped:
+        def on_account_done(account, dates, failed_dates):
+            mark_processed(
+                [(account, date) for date in dates],
+                [(account, date) for date in failed_dates]
+            )
+            done_accounts.add(account.pk)
+            checkpoint["done_accounts"] = sorted(done_accounts)
+            save_checkpoint(checkpoint)
+
+        backfill_grouped(pairs, concurrency, result, on_account_done)
+        clear_checkpoint()
+        logger.info(
+            f"Заполнение исторических данных завершено: записано {result['written']}, "
+            f"с ошибкой {result['failed']}, пропущено по контрольной точке {result['skipped']}"
+        )
+        return result
+    
+    # Блок - столько дат, чтобы все потоки были заняты даже при малом числе аккаунтов
+    dates_per_block = max(1, -(-concurrency // len(accounts)))
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        # Пары с ошибкой из прошлого запуска лежат до resume_from и обрабатываются первыми
+        block_start = min([resume_from] + [date for _, date in pairs])
+        while block_start <= date_to:
+            block_end = min(date_to, block_start + datetime.timedelta(days=dates_per_block - 1))
+            block = [(account, date) for account, date in pairs if block_start <= date <= block_end]
+
+            rows = []
+            failed_pairs = []
+            futures = {executor.submit(fetch_daily_stats, account, date): (account, date) for account, date in block}
+            for future in as_completed(futures):
+                account, date = futures[future]
+                try:
+                    row = future.result()
+                except Exception as e:
+                    logger.error(f"Ошибка при получении статистики для аккаунта {account.name} за {date}: {e}")
+                    row = None
+                if row is None:
+                    result["failed"] += 1
+                    failed_pairs.append((account, date))
+                else:
+                    rows.append(row)
+
+            result["written"] += upsert_daily_stats(rows)
+
+            block_start = block_end + datetime.timedelta(days=1)
+            mark_processed(block, failed_pairs)
+            checkpoint["next_date"] = max(block_start, resume_from).isoformat()
+            save_checkpoint(checkpoint)
+            logger.info(f"Заполнено по {block_end}: записано {result['written']}, с ошибкой {result['failed']}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    clear_checkpoint()
+    logger.info(
+        f"Заполнение исторических данных завершено: записано {result['written']}, "
+        f"с ошибкой {result['failed']}, пропущено по контрольной точке {result['skipped']}"
+    )
+    return result
@@ -0,0 +1,101 @@
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Время жизни по умолчанию для типов запросов, которых нет в AVITO_CACHE_TTLS
+DEFAULT_TTL = 60 * 60
+
+
+def make_key(endpoint, key_parts):
+    """Формирует ключ кэша вида avito:<тип запроса>:<части ключа>"""
+    return ":".join(["avito", endpoint, *(str(part) for part in key_parts)])
+
+
+def get_ttl(endpoint):
+    return settings.AVITO_CACHE_TTLS.get(endpoint, DEFAULT_TTL)
+
+
+# Счетчики попаданий/промахов в памяти процесса: запись счетчиков в общий
+# кэш удваивала бы число обращений к нему (а в файловом кэше еще и теряла бы
+# одновременные увеличения), поэтому каждый процесс считает отдельно
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def _count(endpoint, counter, delta=1):
+    """Увеличивает счетчик попаданий/промахов кэша для типа запроса"""
+    with _counters_lock:
+        _counters[(endpoint, counter)] += delta
+
+
+def cache_get(endpoint, key_parts):
+    """
+    Возвращает закэшированный ответ API или None.
+    
+    Args:
+        endpoint: Тип запроса (ключ в AVITO_CACHE_TTLS), например 'daily_stats'
+        key_parts: Части ключа, однозначно определяющие запрос (аккаунт, даты и т.п.)
+    """
+    value = cache.get(make_key(endpoint, key_parts))
+    _count(endpoint, "hits" if value is not None else "misses")
+    return value
+
+
+def cache_set(endpoint, key_parts, value, timeout=None):
+    """Сохраняет ответ API в кэш на время жизни, заданное для типа запроса"""
+    cache.set(make_key(endpoint, key_parts), value, timeout=timeout if timeout is not None else get_ttl(endpoint))
+
+
+def cache_get_many(endpoint, keys_parts):
+    """
+    Возвращает закэшированные ответы для нескольких запросов одного типа за одно обращение к кэшу.
+    
+    Args:
+        endpoint: Тип запроса (ключ в AVITO_CACHE_TTLS)
+        keys_parts: Словарь {идентификатор: части ключа}
+        
+    Returns:
+        dict: {идентификатор: значение} только для найденных в кэше запросов
+    """
+    keys = {make_key(endpoint, key_parts): ident for ident, key_parts in keys_parts.items()}
+    found = cache.get_many(list(keys))
+    
+    if found:
+        _count(endpoint, "hits", len(found))
+    if len(keys) > len(found):
+        _count(endpoint, "misses", len(keys) - len(found))
+    
+    return {keys[key]: value for key, value in found.items()}
+
+
+def cache_set_many(endpoint, values, timeout=None):
+    """
+    Сохраняет несколько ответов одного типа в кэш.
+    
+    Args:
+        endpoint: Тип запроса (ключ в AVITO_CACHE_TTLS)
+        values: Словарь {части ключа (tuple): значение}
+    """
+    if not values:
+        return
+    cache.set_many(
+        {make_key(endpoint, key_parts): value for key_parts, value in values.items()},
+        timeout=timeout if timeout is not None else get_ttl(endpoint)
+    )
+
+
+def get_cache_metrics():
+    """Возвращает счетчики попаданий и промахов кэша по типам запросов (с запуска этого процесса)"""
+    with _counters_lock:
+        return {
+            endpoint: {
+                "hits": _counters[(endpoint, "hits")],
+                "misses": _counters[(endpoint, "misses")],
+            }
+            for endpoint in settings.AVITO_CACHE_TTLS
+        }
@@ -1,10 +1,20 @@
 import datetime
 import logging
+import time
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
-from bot.models import User, AvitoAccount, AvitoAccountDailyStats
-from bot.handlers.common import send_daily_report, send_weekly_report
-from bot.services import get_access_token, get_user_balance_info, get_daily_statistics
+from bot.models import User, AvitoAccount, AvitoAccountDailyStats, AvitoAccountMonthlyStats, ExpenseResetHistory
+from bot.handlers.common import (
+    AVERAGED_STATS_FIELDS, SUMMED_STATS_FIELDS, send_daily_report, send_weekly_report
+)
+from bot.services import (
+    get_access_token, get_avito_user_id, get_user_balance_info, get_daily_statistics, _run_tracked
+)
+from bot.workers import run_for_accounts
 
 logger = logging.getLogger(__name__)
 
@@ -18,16 +28,26 @@ def send_daily_reports_to_all_users():
     
     logger.info(f'Найдено аккаунтов для ежедневных отчетов: {accounts.count()}')
     
+    recipients = []
     for account in accounts:
-        try:
-            # Отправляем дневной отчет в указанный telegram_id
-            if account.daily_report_tg_id:
-                logger.info(f"Отправка ежедневного отчета для аккаунта {account.name} на ID: {account.daily_report_tg_id}")
-                send_daily_report(account.daily_report_tg_id, account.id)
-            else:
-                logger.info(f"Аккаунт {account.name} не имеет указанного получателя ежедневных отчетов")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке ежедневного отчета для аккаунта {account.name}: {e}")
+        # Отправляем дневной отчет в указанный telegram_id
+        if account.daily_report_tg_id:
+            recipients.append(account)
+        else:
+            logger.info(f"Аккаунт {account.name} не имеет указанного получателя ежедневных отчетов")
+    
+    def send(account):
+        logger.info(f"Отправка ежедневного отчета для аккаунта {account.name} на ID: {account.daily_report_tg_id}")
+        return send_daily_report(account.daily_report_tg_id, account.id)
+    
+    # Аккаунты обрабатываются параллельно в ограниченном пуле потоков
+    return run_for_accounts(
+        recipients,
+        send,
+        max_workers=settings.REPORT_WORKERS,
+        timeout=settings.REPORT_ACCOUNT_TIMEOUT,
+        task_name="Ежедневные отчеты"
+    )
 
 
 def send_weekly_reports_to_all_users():
@@ -39,82 +59,166 @@ def send_weekly_reports_to_all_users():
     
     logger.info(f'Найдено аккаунтов для еженедельных отчетов: {accounts.count()}')
     
+    recipients = []
     for account in accounts:
-        try:
-            # Отправляем недельный отчет
-            if account.weekly_report_tg_id:
-                logger.info(f"Отправка еженедельного отчета для аккаунта {account.name} на ID: {account.weekly_report_tg_id}")
-                send_weekly_report(account.weekly_report_tg_id, account.id)
-            else:
-                logger.info(f"Аккаунт {account.name} не имеет указанного получателя еженедельных отчетов")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке еженедельного отчета для аккаунта {account.name}: {e}")
+        # Отправляем недельный отчет
+        if account.weekly_report_tg_id:
+            recipients.append(account)
+        else:
+            logger.info(f"Аккаунт {account.name} не имеет указанного получателя еженедельных отчетов")
+    
+    def send(account):
+        logger.info(f"Отправка еженедельного отчета для аккаунта {account.name} на ID: {account.weekly_report_tg_id}")
+        return send_weekly_report(account.weekly_report_tg_id, account.id)
+    
+    # Аккаунты обрабатываются параллельно в ограниченном пуле потоков
+    return run_for_accounts(
+        recipients,
+        send,
+        max_workers=settings.REPORT_WORKERS,
+        timeout=settings.REPORT_ACCOUNT_TIMEOUT,
+        task_name="Еженедельные отчеты"
+    )
+
+
+def poll_account_balance(account, current_time):
+    """
+    Запрашивает баланс аккаунта и записывает расход, если баланс уменьшился.
+    
+    Пишутся только изменившиеся поля; расходы увеличиваются через F(),
+    чтобы не затереть одновременный сброс расходов.
+    
+    Returns:
+        bool: True, если баланс изменился (или проверен впервые) и записан,
+              False при ошибке, None если баланс не изменился
+    """
+    # Получаем токен доступа
+    access_token = get_access_token(account.client_id, account.client_secret)
+    if not access_token:
+        logger.error(f"Не удалось получить токен доступа для аккаунта {account.name}")
+        return False
+        
+    # Получаем текущий баланс аккаунта
+    balance_info, failed = _run_tracked(get_user_balance_info, (
+        access_token,
+        account.avito_user_id or get_avito_user_id(account.client_id, account.client_secret)
+    ))
+    # При ошибке API возвращаются нули: это не настоящий баланс, расход не записываем
+    if failed:
+        logger.error(f"Не удалось получить баланс аккаунта {account.name}")
+        return False
+    
+    # Используем сумму реального баланса, бонусов и авансовых платежей
+    current_balance = balance_info["balance_real"] + balance_info["balance_bonus"] + balance_info["advance"]
+    
+    # Если это первая проверка баланса
+    if account.last_balance_check is None:
+        AvitoAccount.objects.filter(pk=account.pk).update(
+            last_balance=current_balance,
+            last_balance_check=current_time
+        )
+        logger.info(f"Инициализация баланса аккаунта {account.name}: {current_balance}")
+        return True
+    
+    if current_balance == account.last_balance:
+        return None
+    
+    changes = {
+        'last_balance': current_balance,
+        'last_balance_check': current_time,
+    }
+    
+    # Проверяем, уменьшился ли баланс (произошел расход)
+    if current_balance < account.last_balance:
+        # Рассчитываем сумму расхода
+        expense_amount = account.last_balance - current_balance
+        
+        # Обновляем дневной и недельный расход
+        changes['daily_expense'] = F('daily_expense') + expense_amount
+        changes['weekly_expense'] = F('weekly_expense') + expense_amount
+        
+        logger.info(f"Зафиксирован расход для аккаунта {account.name}: {expense_amount} р.")
+    
+    AvitoAccount.objects.filter(pk=account.pk).update(**changes)
+    return True
 
 
 def track_user_expenses():
-    """Отслеживание расходов аккаунтов на основе изменения баланса"""
+    """
+    Отслеживание расходов аккаунтов на основе изменения баланса.
+    
+    Балансы запрашиваются параллельно (BALANCE_POLL_WORKERS потоков).
+    Аккаунт, который еще обрабатывается предыдущим запуском, пропускается.
+    Для аккаунтов с неизменным балансом время проверки обновляется одним запросом.
+    """
     accounts = AvitoAccount.objects.filter(
         client_id__isnull=False, 
         client_secret__isnull=False
     ).exclude(client_id="none")
     
-    current_time = datetime.datetime.now()
+    current_time = timezone.now()
+    unchanged = []
     
-    for account in accounts:
+    def poll(account):
+        # Защита от наложения запусков: аккаунт обрабатывает только один запуск
+        lock_key = f"balance_poll_lock_{account.pk}"
+        if not cache.add(lock_key, 1, timeout=settings.BALANCE_POLL_LOCK_TIMEOUT):
+            logger.info(f"Баланс аккаунта {account.name} еще проверяется предыдущим запуском, пропускаем")
+            return True
         try:
-            # Получаем токен доступа
-            access_token = get_access_token(account.client_id, account.client_secret)
-            if not access_token:
-                logger.error(f"Не удалось получить токен доступа для аккаунта {account.name}")
-                continue
-                
-            # Получаем текущий баланс аккаунта
-            balance_info = get_user_balance_info(access_token)
-            
-            # Используем сумму реального баланса, бонусов и авансовых платежей
-            current_balance = balance_info["balance_real"] + balance_info["balance_bonus"] + balance_info["advance"]
-            
-            # Если это первая проверка баланса
-            if account.last_balance_check is None:
-                account.last_balance = current_balance
-                account.last_balance_check = current_time
-                account.save()
-                logger.info(f"Инициализация баланса аккаунта {account.name}: {current_balance}")
-                continue
-            
-            # Проверяем, уменьшился ли баланс (произошел расход)
-            if current_balance < account.last_balance:
-                # Рассчитываем сумму расхода
-                expense_amount = account.last_balance - current_balance
-                
-                # Обновляем дневной расход
-                account.daily_expense += expense_amount
-                
-                # Обновляем недельный расход
-                account.weekly_expense += expense_amount
-                
-                logger.info(f"Зафиксирован расход для аккаунта {account.name}: {expense_amount} р. "
-                           f"Дневной расход: {account.daily_expense} р., Недельный расход: {account.weekly_expense} р.")
-            
-            # Обновляем значение последнего баланса и времени проверки
-            account.last_balance = current_balance
-            account.last_balance_check = current_time
-            account.save()
-            
-        except Exception as e:
-            logger.error(f"Ошибка при отслеживании расходов аккаунта {account.name}: {e}")
+            result = poll_account_balance(account, current_time)
+            if result is None:
+                unchanged.append(account.pk)
+            # Неизменный баланс (None) - тоже успешная проверка
+            return result is not False
+        finally:
+            cache.delete(lock_key)
+    
+    summary = run_for_accounts(
+        accounts,
+        poll,
+        max_workers=settings.BALANCE_POLL_WORKERS,
+        timeout=settings.BALANCE_POLL_TIMEOUT,
+        task_name="Отслеживание расходов"
+    )
+    
+    if unchanged:
+        AvitoAccount.objects.filter(pk__in=unchanged).update(last_balance_check=current_time)
+    
+    return summary
+
+
+def reset_expenses(field, period):
+    """
+    Обнуляет поле расхода (daily_expense/weekly_expense) у всех аккаунтов одним UPDATE.
+    
+    Если включен EXPENSE_RESET_HISTORY, значения перед сбросом сохраняются
+    одним bulk insert в ExpenseResetHistory в той же транзакции.
+    
+    Returns:
+        int: Количество аккаунтов, у которых был сброшен расход
+    """
+    with transaction.atomic():
+        accounts = AvitoAccount.objects.filter(**{f"{field}__gt": 0})
+        
+        if settings.EXPENSE_RESET_HISTORY:
+            # Блокируем строки до сброса, чтобы сохраненные значения совпадали со сброшенными
+            snapshot = list(accounts.select_for_update().values_list('id', field))
+            ExpenseResetHistory.objects.bulk_create([
+                ExpenseResetHistory(avito_account_id=account_id, period=period, amount=amount)
+                for account_id, amount in snapshot
+            ])
+        
+        count = accounts.update(**{field: 0})
+    
+    logger.info(f"Сброшен {field} для {count} аккаунтов")
+    return count
 
 
 def reset_daily_expenses():
     """Сброс дневных расходов в начале нового дня"""
     try:
-        # Сбрасываем дневной расход для всех аккаунтов
-        accounts = AvitoAccount.objects.all()
-        for account in accounts:
-            if account.daily_expense > 0:
-                logger.info(f"Сброс дневного расхода для аккаунта {account.name}: {account.daily_expense} р.")
-                account.daily_expense = 0
-                account.save()
+        return reset_expenses('daily_expense', 'daily')
     except Exception as e:
         logger.error(f"Ошибка при сбросе дневных расходов: {e}")
 
@@ -122,93 +226,259 @@ def reset_daily_expenses():
 def reset_weekly_expenses():
     """Сброс недельных расходов в начале новой недели"""
     try:
-        # Сбрасываем недельный расход для всех аккаунтов
-        accounts = AvitoAccount.objects.all()
-        for account in accounts:
-            if account.weekly_expense > 0:
-                logger.info(f"Сброс недельного расхода для аккаунта {account.name}: {account.weekly_expense} р.")
-                account.weekly_expense = 0
-                account.save()
+        return reset_expenses('weekly_expense', 'weekly')
     except Exception as e:
         logger.error(f"Ошибка при сбросе недельных расходов: {e}")
 
 
+# Поля, которые перезаписываются при повторном сохранении статистики за тот же день
+DAILY_STATS_UPDATE_FIELDS = [
+    field.name for field in AvitoAccountDailyStats._meta.concrete_fields
+    if not field.primary_key and field.name not in ('avito_account', 'date')
+]
+
+
+def collect_daily_stats(accounts, date, account_expense=False):
+    """
+    Параллельно собирает статистику аккаунтов за дату, не записывая ее в БД.
+    
+    Args:
+        accounts: Аккаунты AvitoAccount
+        date: Дата статистики
+        account_expense: Записывать в daily_expense текущий расход аккаунта
+                         (иначе 0)
+        
+    Returns:
+        tuple: (несохраненные записи AvitoAccountDailyStats, итоги run_for_accounts)
+    """
+    rows = []
+    
+    def collect(account):
+        daily_stats = get_daily_statistics(account.client_id, account.client_secret, date, fallback=False)
+        
+        if not daily_stats:
+            logger.warning(f"Не удалось получить статистику для аккаунта {account.name} за {date}")
+            return False
+        
+        rows.append(AvitoAccountDailyStats.from_report_data(
+            account, date, daily_stats,
+            daily_expense=account.daily_expense if account_expense else 0
+        ))
+        return True
+    
+    summary = run_for_accounts(
+        accounts,
+        collect,
+        max_workers=settings.REPORT_WORKERS,
+        timeout=settings.REPORT_ACCOUNT_TIMEOUT,
+        task_name=f"Сбор статистики за {date}"
+    )
+    return rows, summary
+
+
+def upsert_daily_stats(rows):
+    """
+    Записывает статистику одним запросом INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE
+    в одной транзакции: новые записи создаются, существующие (аккаунт, дата) обновляются.
+    
+    Returns:
+        int: Количество записанных строк
+    """
+    if not rows:
+        return 0
+    
+    upsert_options = {
+        'update_conflicts': True,
+        'update_fields': DAILY_STATS_UPDATE_FIELDS,
+    }
+    # MySQL не принимает список полей конфликта, там используется любой уникальный ключ
+    if connection.features.supports_update_conflicts_with_target:
+        upsert_options['unique_fields'] = ['avito_account', 'date']
+    
+    with transaction.atomic():
+        AvitoAccountDailyStats.objects.bulk_create(rows, batch_size=500, **upsert_options)
+    return len(rows)
+
+
+def store_daily_stats(accounts, date, account_expense=False, only_missing=False):
+    """
+    Собирает статистику аккаунтов за дату и сохраняет ее одним bulk upsert.
+    
+    Args:
+        accounts: Аккаунты AvitoAccount
+        date: Дата статистики
+        account_expense: Записывать в daily_expense текущий расход аккаунта
+        only_missing: Обрабатывать только аккаунты, у которых нет записи за эту дату
+        
+    Returns:
+        dict: {"date": ..., "written": число строк, "failed": [названия аккаунтов]}
+    """
+    accounts = list(accounts)
+    
+    if only_missing:
+        existing = set(AvitoAccountDailyStats.objects.filter(
+            date=date,
+            avito_account__in=accounts
+        ).values_list('avito_account_id', flat=True))
+        accounts = [account for account in accounts if account.pk not in existing]
+    
+    result = {"date": date, "written": 0, "failed": []}
+    if not accounts:
+        logger.info(f"Статистика за {date} уже есть для всех аккаунтов")
+        return result
+    
+    rows, summary = collect_daily_stats(accounts, date, account_expense=account_expense)
+    result["failed"] = summary["failed"] + summary["timeout"]
+    
+    try:
+        result["written"] = upsert_daily_stats(rows)
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении статистики за {date}: {e}")
+        result["failed"] = [account.name for account in accounts]
+        return result
+    
+    logger.info(
+        f"Статистика за {date}: сохранено {result['written']} из {len(accounts)} аккаунтов, "
+        f"с ошибкой {len(result['failed'])}"
+    )
+    return result
+
+
 def store_daily_statistics():
-    """Сохранение ежедневной статистики для всех аккаунтов"""
+    """Сохранение ежедневной статистики за вчера для всех аккаунтов"""
     try:
         # Получаем все аккаунты с настроенным API
         accounts = AvitoAccount.objects.filter(
-            ~Q(client_id='none') & ~Q(client_secret='none')
-        )
+            client_id__isnull=False,
+            client_secret__isnull=False
+        ).exclude(client_id="none").exclude(client_secret="none")
         
         if not accounts.exists():
             logger.info("Нет настроенных аккаунтов для сохранения статистики")
             return
         
         # Рассчитываем вчерашнюю дату
-        yesterday = timezone.now().date() - timezone.timedelta(days=1)
+        yesterday = timezone.localdate() - timezone.timedelta(days=1)
         
-        for account in accounts:
-            try:
-                # Получаем статистику за вчерашний день
-                client_id = account.client_id
-                client_secret = account.client_secret
-                daily_stats = get_daily_statistics(client_id, client_secret, str(yesterday))
-                
-                if not daily_stats:
-                    logger.warning(f"Не удалось получить статистику для аккаунта {account.name}")
-                    continue
-                
-                # Создаем запись в базе данных
-                stats = AvitoAccountDailyStats(
-                    avito_account=account,
-                    date=yesterday,
-                    total_calls=daily_stats['calls']['total'],
-                    answered_calls=daily_stats['calls']['answered'],
-                    missed_calls=daily_stats['calls']['missed'],
-                    total_chats=daily_stats['chats']['total'],
-                    new_chats=daily_stats['chats']['new'],
-                    phones_received=daily_stats['phones_received'],
-                    rating=daily_stats['rating'],
-                    total_reviews=daily_stats['reviews']['total'],
-                    daily_reviews=daily_stats['reviews']['today'],
-                    total_items=daily_stats['items']['total'],
-                    xl_promotion_count=daily_stats['items']['with_xl_promotion'],
-                    views=daily_stats['statistics']['views'],
-                    contacts=daily_stats['statistics']['contacts'],
-                    favorites=daily_stats['statistics']['favorites'],
-                    balance_real=daily_stats['balance_real'],
-                    balance_bonus=daily_stats['balance_bonus'],
-                    advance=daily_stats['advance'],
-                    daily_expense=account.daily_expense  # Берем расход из аккаунта
-                )
-                
-                stats.save()
-                logger.info(f"Сохранена статистика для аккаунта {account.name} за {yesterday}")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при сохранении статистики для аккаунта {account.name}: {e}")
-        
-        logger.info("Сохранение ежедневной статистики завершено")
+        # Дневной расход аккаунта еще не сброшен и относится ко вчерашнему дню
+        return store_daily_stats(accounts, yesterday, account_expense=True)
     except Exception as e:
         logger.error(f"Ошибка при сохранении ежедневной статистики: {e}")
 
 
-def clean_old_statistics():
-    """Удаление статистики старше 30 дней"""
+def rollup_monthly_stats(stats_ids):
+    """
+    Добавляет записи ежедневной статистики stats_ids в помесячные итоги AvitoAccountMonthlyStats.
+    Вызывается в одной транзакции с удалением этих записей, поэтому дни не учитываются дважды.
+    
+    Returns:
+        set: Обновленные пары (ID аккаунта, месяц)
+    """
+    chunk_totals = list(
+        AvitoAccountDailyStats.objects.filter(pk__in=stats_ids)
+        .annotate(month=TruncMonth('date'))
+        .values('avito_account_id', 'month')
+        .annotate(
+            days=Count('id'),
+            **{field: Sum(field) for field in SUMMED_STATS_FIELDS + AVERAGED_STATS_FIELDS}
+        )
+        .order_by()
+    )
+    if not chunk_totals:
+        return set()
+    
+    existing = {
+        (monthly.avito_account_id, monthly.month): monthly
+        for monthly in AvitoAccountMonthlyStats.objects.select_for_update().filter(
+            avito_account_id__in={row['avito_account_id'] for row in chunk_totals},
+            month__in={row['month'] for row in chunk_totals}
+        )
+    }
+    
+    rows = []
+    for totals in chunk_totals:
+        key = (totals['avito_account_id'], totals['month'])
+        monthly = existing.get(key) or AvitoAccountMonthlyStats(avito_account_id=key[0], month=key[1])
+        previous_days = monthly.days
+        monthly.days = previous_days + totals['days']
+        for field in SUMMED_STATS_FIELDS:
+            setattr(monthly, field, getattr(monthly, field) + (totals[field] or 0))
+        for field in AVERAGED_STATS_FIELDS:
+            total = getattr(monthly, field) * previous_days + (totals[field] or 0)
+            setattr(monthly, field, total / monthly.days)
+        rows.append(monthly)
+    
+    upsert_options = {
+        'update_conflicts': True,
+        'update_fields': ['days', *SUMMED_STATS_FIELDS, *AVERAGED_STATS_FIELDS, 'updated_at'],
+    }
+    # MySQL не принимает список полей конфликта, там используется любой уникальный ключ
+    if connection.features.supports_update_conflicts_with_target:
+        upsert_options['unique_fields'] = ['avito_account', 'month']
+    AvitoAccountMonthlyStats.objects.bulk_create(rows, **upsert_options)
+    return {(row.avito_account_id, row.month) for row in rows}
+
+
+def clean_old_statistics(days=None, chunk_size=None, pause=None, rollup=None):
+    """
+    Удаляет ежедневную статистику старше days дней (по умолчанию STATS_RETENTION_DAYS).
+    
+    Записи удаляются пачками по первичному ключу, не больше chunk_size за запрос
+    и с паузой pause секунд между запросами, чтобы не блокировать таблицу надолго.
+    Связанных объектов у записей нет, поэтому каждая пачка удаляется одним DELETE
+    без предварительной загрузки. При rollup удаляемые дни в той же транзакции
+    добавляются в помесячные итоги (AvitoAccountMonthlyStats).
+    
+    Returns:
+        dict: {"deleted": удалено записей, "chunks": число пачек,
+               "months": обновлено помесячных записей}
+    """
+    days = days if days is not None else settings.STATS_RETENTION_DAYS
+    chunk_size = chunk_size or settings.STATS_RETENTION_CHUNK_SIZE
+    pause = pause if pause is not None else settings.STATS_RETENTION_PAUSE
+    rollup = rollup if rollup is not None else settings.STATS_MONTHLY_ROLLUP
+    
+    result = {"deleted": 0, "chunks": 0, "months": 0}
     try:
-        threshold_date = timezone.now().date() - datetime.timedelta(days=30)
-        old_stats = AvitoAccountDailyStats.objects.filter(date__lt=threshold_date)
-        count = old_stats.count()
+        threshold_date = timezone.localdate() - datetime.timedelta(days=days)
+        months = set()
+        last_pk = 0
+        
+        while True:
+            # Следующая пачка старых записей (индекс по дате), по возрастанию первичного ключа
+            stats_ids = list(
+                AvitoAccountDailyStats.objects.filter(date__lt=threshold_date, pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not stats_ids:
+                break
+            
+            with transaction.atomic():
+                if rollup:
+                    months |= rollup_monthly_stats(stats_ids)
+                deleted, _ = AvitoAccountDailyStats.objects.filter(pk__in=stats_ids).delete()
+            
+            result["deleted"] += deleted
+            result["chunks"] += 1
+            last_pk = stats_ids[-1]
+            if len(stats_ids) < chunk_size:
+                break
+            time.sleep(pause)
         
-        if count > 0:
-            old_stats.delete()
-            logger.info(f"Удалено {count} записей статистики старше {threshold_date}")
+        result["months"] = len(months)
+        if result["deleted"]:
+            logger.info(
+                f"Удалено {result['deleted']} записей статистики старше {threshold_date} "
+                f"({result['chunks']} пачек), обновлено помесячных итогов: {result['months']}"
+            )
         else:
             logger.info(f"Нет записей статистики старше {threshold_date} для удаления")
             
     except Exception as e:
-        logger.error(f"Ошибка при удалении старой статистики: {e}")
+        logger.error(f"Ошибка при удалении старой статистики (удалено {result['deleted']} записей): {e}")
+    
+    return result
 
 
 def ensure_daily_stats_exists():
@@ -217,96 +487,34 @@ def ensure_daily_stats_exists():
     Если записей нет, запускает процесс их создания.
     """
     try:
-        today = timezone.now().date()
+        today = timezone.localdate()
         yesterday = today - datetime.timedelta(days=1)
         
         # Получаем все активные аккаунты
-        accounts = AvitoAccount.objects.filter(
+        accounts = list(AvitoAccount.objects.filter(
             client_id__isnull=False, 
             client_secret__isnull=False
-        ).exclude(client_id="none")
+        ).exclude(client_id="none"))
         
-        logger.info(f"Проверка наличия статистики за {yesterday} и {today} для {accounts.count()} аккаунтов")
+        logger.info(f"Проверка наличия статистики за {yesterday} и {today} для {len(accounts)} аккаунтов")
         
-        for account in accounts:
-            try:
-                # Проверяем наличие статистики за вчера
-                yesterday_stats_exists = AvitoAccountDailyStats.objects.filter(
-                    avito_account=account,
-                    date=yesterday
-                ).exists()
-                
-                if not yesterday_stats_exists:
-                    logger.info(f"Создаем статистику за вчера ({yesterday}) для аккаунта {account.name}")
-                    store_account_daily_stats(account, yesterday)
-                
-                # Проверяем наличие статистики за сегодня
-                today_stats_exists = AvitoAccountDailyStats.objects.filter(
-                    avito_account=account,
-                    date=today
-                ).exists()
-                
-                if not today_stats_exists:
-                    logger.info(f"Создаем статистику за сегодня ({today}) для аккаунта {account.name}")
-                    store_account_daily_stats(account, today)
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при проверке/создании статистики для аккаунта {account.name}: {e}")
+        # Для сегодняшнего дня берем текущий расход аккаунта
+        store_daily_stats(accounts, yesterday, only_missing=True)
+        store_daily_stats(accounts, today, account_expense=True, only_missing=True)
                 
     except Exception as e:
         logger.error(f"Ошибка в ensure_daily_stats_exists: {e}")
 
 
 def store_account_daily_stats(account, date):
-    """Сохраняет статистику по аккаунту за указанную дату"""
+    """Сохраняет статистику по аккаунту за указанную дату, если ее еще нет"""
     try:
-        # Проверяем, существует ли у нас уже запись за эту дату
-        if AvitoAccountDailyStats.objects.filter(avito_account=account, date=date).exists():
-            logger.info(f"Статистика для аккаунта {account.name} за {date} уже существует")
-            return
-        
-        # Получаем статистику за указанный день
-        client_id = account.client_id
-        client_secret = account.client_secret
-        daily_stats = get_daily_statistics(client_id, client_secret, str(date))
-        
-        if not daily_stats:
-            logger.warning(f"Не удалось получить статистику для аккаунта {account.name} за {date}")
-            return
-            
-        # Определяем, является ли день сегодняшним
-        is_today = date == timezone.now().date()
-        
-        # Создаем запись в базе данных
-        stats, created = AvitoAccountDailyStats.objects.get_or_create(
-            avito_account=account,
-            date=date,
-            defaults={
-                'total_calls': daily_stats['calls']['total'],
-                'answered_calls': daily_stats['calls']['answered'],
-                'missed_calls': daily_stats['calls']['missed'],
-                'total_chats': daily_stats['chats']['total'],
-                'new_chats': daily_stats['chats']['new'],
-                'phones_received': daily_stats['phones_received'],
-                'rating': daily_stats['rating'],
-                'total_reviews': daily_stats['reviews']['total'],
-                'daily_reviews': daily_stats['reviews']['today'],
-                'total_items': daily_stats['items']['total'],
-                'xl_promotion_count': daily_stats['items']['with_xl_promotion'],
-                'views': daily_stats['statistics']['views'],
-                'contacts': daily_stats['statistics']['contacts'],
-                'favorites': daily_stats['statistics']['favorites'],
-                'balance_real': daily_stats['balance_real'],
-                'balance_bonus': daily_stats['balance_bonus'],
-                'advance': daily_stats['advance'],
-                'daily_expense': account.daily_expense if is_today else 0  # Для сегодняшнего дня берем текущий расход
-            }
-        )
-        
-        logger.info(f"{'Создана' if created else 'Обновлена'} статистика для аккаунта {account.name} за {date}")
-        
+        # Для сегодняшнего дня берем текущий расход
+        result = store_daily_stats([account], date, account_expense=date == timezone.localdate(), only_missing=True)
+        return result["written"] > 0
     except Exception as e:
         logger.error(f"Ошибка при сохранении статистики для аккаунта {account.name} за {date}: {e}")
+        return False
 
 
 # Функции для запуска через cron
@@ -349,51 +557,10 @@ def populate_historical_data(days=30):
     Args:
         days: Количество дней для заполнения (по умолчанию 30)
     """
+    from bot.backfill import backfill_daily_stats
+    
     try:
-        today = timezone.now().date()
-        
-        # Получаем все активные аккаунты
-        accounts = AvitoAccount.objects.filter(
-            client_id__isnull=False, 
-            client_secret__isnull=False
-        ).exclude(client_id="none")
-        
-        logger.info(f"Начало заполнения исторических данных за {days} дней для {accounts.count()} аккаунтов")
-        
-        for account in accounts:
-            try:
-                logger.info(f"Заполнение данных для аккаунта {account.name}")
-                
-                # Проходим по каждому дню
-                for day_offset in range(days, 0, -1):
-                    date = today - datetime.timedelta(days=day_offset)
-                    
-                    # Проверяем, есть ли уже запись за этот день
-                    stat_exists = AvitoAccountDailyStats.objects.filter(
-                        avito_account=account,
-                        date=date
-                    ).exists()
-                    
-                    if stat_exists:
-                        logger.info(f"Запись для {date} уже существует, пропускаем")
-                        continue
-                    
-                    logger.info(f"Создание записи за {date} для аккаунта {account.name}")
-                    
-                    # Создаем запись
-                    store_account_daily_stats(account, date)
-                    
-                    # Делаем небольшую паузу, чтобы не перегружать API
-                    import time
-                    time.sleep(1)
-                
-                logger.info(f"Заполнение данных для аккаунта {account.name} завершено")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при заполнении данных для аккаунта {account.name}: {e}")
-        
-        logger.info(f"Заполнение исторических данных завершено")
-        
+        return backfill_daily_stats(days)
     except Exception as e:
         logger.error(f"Ошибка в populate_historical_data: {e}")
 
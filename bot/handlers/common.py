@@ -2,9 +2,14 @@ from bot import bot
 from bot.models import User, AvitoAccount, UserAvitoAccount, AvitoAccountDailyStats, Settings
 from bot.keyboards import main_markup
 from bot.texts import MAIN_TEXT
-from bot.services import get_daily_statistics, get_weekly_statistics
+from bot.services import (
+    get_daily_statistics, get_daily_statistics_range, get_weekly_statistics, get_access_token,
+    get_operations_history
+)
 import telebot
+from django.conf import settings
 from django.db import models
+from django.db.models import Avg, Count, Sum
 import datetime
 from django.utils import timezone
 
@@ -201,57 +206,193 @@ def get_previous_day_stats(account_id, current_date):
         logger.error(f"Ошибка при получении статистики за предыдущий день: {e}")
         return None
 
+# Показатели, которые за период суммируются, и показатели-уровни, которые усредняются
+SUMMED_STATS_FIELDS = (
+    'total_calls', 'answered_calls', 'missed_calls', 'total_chats', 'new_chats',
+    'phones_received', 'views', 'contacts', 'favorites', 'daily_reviews', 'daily_expense',
+)
+AVERAGED_STATS_FIELDS = ('total_items', 'xl_promotion_count', 'rating')
+# Поля записи статистики, которые выводятся по дням
+DAY_STATS_FIELDS = (
+    'date', 'total_reviews', 'balance_real', 'balance_bonus', 'advance', 'expenses_details',
+) + SUMMED_STATS_FIELDS + AVERAGED_STATS_FIELDS
+
+class StatsSummary:
+    """Суммарные показатели AvitoAccountDailyStats за период (days - число дней с данными)"""
+    __slots__ = ('days',) + SUMMED_STATS_FIELDS + AVERAGED_STATS_FIELDS
+    
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name) or 0)
+
+def aggregate_daily_stats(queryset):
+    """Считает суммы и средние значения по записям статистики одним запросом"""
+    values = queryset.aggregate(
+        days=Count('id'),
+        **{field: Sum(field) for field in SUMMED_STATS_FIELDS},
+        **{field: Avg(field) for field in AVERAGED_STATS_FIELDS}
+    )
+    return StatsSummary(**values)
+
 def get_previous_week_stats(account_id, current_date):
-    """Получает статистику за предыдущую неделю (суммарно)"""
+    """Получает статистику за предыдущую неделю (суммарно) или None, если данных нет"""
     try:
         # Получаем начало предыдущей недели
         week_start = current_date - datetime.timedelta(days=14)
         week_end = current_date - datetime.timedelta(days=7)
         
-        # Получаем все записи за предыдущую неделю
-        previous_week_stats = AvitoAccountDailyStats.objects.filter(
+        summary = aggregate_daily_stats(AvitoAccountDailyStats.objects.filter(
             avito_account_id=account_id,
             date__gte=week_start,
             date__lt=week_end
-        )
+        ))
         
         # Если нет данных, возвращаем None
-        if not previous_week_stats.exists():
+        if not summary.days:
             return None
-            
-        # Суммируем данные
-        total_calls = sum(stats.total_calls for stats in previous_week_stats)
-        answered_calls = sum(stats.answered_calls for stats in previous_week_stats)
-        missed_calls = sum(stats.missed_calls for stats in previous_week_stats)
-        total_chats = sum(stats.total_chats for stats in previous_week_stats)
-        new_chats = sum(stats.new_chats for stats in previous_week_stats)
-        phones_received = sum(stats.phones_received for stats in previous_week_stats)
-        views = sum(stats.views for stats in previous_week_stats)
-        contacts = sum(stats.contacts for stats in previous_week_stats)
-        favorites = sum(stats.favorites for stats in previous_week_stats)
-        daily_reviews = sum(stats.daily_reviews for stats in previous_week_stats)
-        daily_expense = sum(stats.daily_expense for stats in previous_week_stats)
-        
-        # Создаем объект с суммарными данными
-        class WeeklySummary:
-            def __init__(self):
-                self.total_calls = total_calls
-                self.answered_calls = answered_calls
-                self.missed_calls = missed_calls
-                self.total_chats = total_chats
-                self.new_chats = new_chats
-                self.phones_received = phones_received
-                self.views = views
-                self.contacts = contacts
-                self.favorites = favorites
-                self.daily_reviews = daily_reviews
-                self.daily_expense = daily_expense
-                
-        return WeeklySummary()
+        return summary
     except Exception as e:
         logger.error(f"Ошибка при получении статистики за предыдущую неделю: {e}")
         return None
 
+def fetch_expenses(account, date_from, date_to):
+    """Запрашивает расходы аккаунта из истории операций API за период (даты включительно)"""
+    access_token = get_access_token(account.client_id, account.client_secret)
+    if not access_token:
+        logger.error(f"Не удалось получить токен доступа для аккаунта {account.name}")
+        return {"total": 0, "details": {}}
+    return get_operations_history(access_token, f"{date_from}T00:00:00Z", f"{date_to}T23:59:59Z")
+
+def merge_expenses(expenses_list):
+    """Суммирует расходы за несколько дней в формате {"total": ..., "details": {...}}"""
+    merged = {"total": 0, "details": {}}
+    for expenses in expenses_list:
+        merged["total"] += expenses.get("total", 0)
+        for service, details in expenses.get("details", {}).items():
+            merged_details = merged["details"].setdefault(
+                service,
+                {"amount": 0, "count": 0, "type": details.get("type", ""), "items": []}
+            )
+            merged_details["amount"] += details.get("amount", 0)
+            merged_details["count"] += details.get("count", 0)
+            for item in details.get("items", []):
+                if item not in merged_details["items"]:
+                    merged_details["items"].append(item)
+    return merged
+
+def get_daily_report_data(account):
+    """
+    Возвращает данные дневного отчета за вчера.
+    
+    Если в AvitoAccountDailyStats есть окончательная запись за вчера, отчет
+    строится по ней без обращения к API (из API запрашиваются только расходы,
+    если они не были сохранены). Иначе данные запрашиваются из API.
+    """
+    yesterday = timezone.localdate() - datetime.timedelta(days=1)
+    
+    if settings.REPORTS_FROM_DB:
+        snapshot = AvitoAccountDailyStats.objects.filter(avito_account=account, date=yesterday).first()
+        if snapshot and snapshot.is_complete():
+            logger.info(f"Дневной отчет для аккаунта {account.name} построен по сохраненной статистике за {yesterday}")
+            response = snapshot.to_report_data()
+            if snapshot.get_expenses_details() is None:
+                response["expenses"] = fetch_expenses(account, yesterday, yesterday)
+            return response
+    
+    return get_daily_statistics(account.client_id, account.client_secret)
+
+def get_weekly_report_data(account):
+    """
+    Возвращает данные недельного отчета за 7 прошедших дней (с today-7 по вчера включительно).
+    
+    Дни с окончательной записью в AvitoAccountDailyStats берутся из БД, из API
+    запрашиваются только недостающие дни (get_daily_statistics_range, с кэшем). Если
+    сохраненных дней нет или недостающий день получить не удалось, неделя
+    запрашивается из API одним отчетом за тот же период. Расходы запрашиваются
+    из истории операций, если они сохранены не за все дни.
+    """
+    today = timezone.localdate()
+    week_start = today - datetime.timedelta(days=7)
+    week_end = today - datetime.timedelta(days=1)
+    
+    snapshots = {}
+    if settings.REPORTS_FROM_DB:
+        snapshots = {
+            snapshot.date: snapshot
+            for snapshot in AvitoAccountDailyStats.objects.filter(
+                avito_account=account,
+                date__gte=week_start,
+                date__lte=week_end
+            )
+            if snapshot.is_complete()
+        }
+    
+    if not snapshots:
+        return get_weekly_statistics(account.client_id, account.client_secret, week_start, week_end)
+    
+    fetched = get_daily_statistics_range(
+        account.client_id, account.client_secret, week_start, week_end,
+        fallback=False, skip_dates=snapshots
+    )
+    
+    days = []
+    expenses_saved = True
+    date = week_start
+    while date <= week_end:
+        snapshot = snapshots.get(date)
+        if snapshot is not None:
+            day = snapshot.to_report_data()
+            expenses_saved = expenses_saved and snapshot.get_expenses_details() is not None
+        else:
+            day = fetched.get(date.strftime("%Y-%m-%d"))
+            if day is None:
+                logger.warning(f"Не удалось получить статистику аккаунта {account.name} за {date}, недельный отчет запрашивается из API")
+                return get_weekly_statistics(account.client_id, account.client_secret, week_start, week_end)
+        days.append(day)
+        date += datetime.timedelta(days=1)
+    
+    logger.info(
+        f"Недельный отчет для аккаунта {account.name} построен по сохраненной статистике "
+        f"(из API запрошено дней: {7 - len(snapshots)})"
+    )
+    last_day = days[-1]
+    
+    if expenses_saved:
+        expenses = merge_expenses([day["expenses"] for day in days])
+    else:
+        expenses = fetch_expenses(account, week_start, week_end)
+    
+    total_calls = sum(day["calls"]["total"] for day in days)
+    missed_calls = sum(day["calls"]["missed"] for day in days)
+    return {
+        "period": f"{week_start.strftime('%Y-%m-%d')} - {week_end.strftime('%Y-%m-%d')}",
+        "calls": {
+            "total": total_calls,
+            "missed": missed_calls,
+            "answered": total_calls - missed_calls
+        },
+        "balance_real": last_day["balance_real"],
+        "balance_bonus": last_day["balance_bonus"],
+        "advance": last_day["advance"],
+        "expenses": expenses,
+        "chats": {
+            "total": sum(day["chats"]["total"] for day in days),
+            "new": sum(day["chats"]["new"] for day in days)
+        },
+        "phones_received": sum(day["phones_received"] for day in days),
+        "rating": last_day["rating"],
+        "reviews": {
+            "total": last_day["reviews"]["total"],
+            "weekly": sum(day["reviews"]["today"] for day in days)
+        },
+        "items": last_day["items"],
+        "statistics": {
+            "views": sum(day["statistics"]["views"] for day in days),
+            "contacts": sum(day["statistics"]["contacts"] for day in days),
+            "favorites": sum(day["statistics"]["favorites"] for day in days)
+        }
+    }
+
 def daily_report_for_account(chat_id, account_id):
     """Отправка дневного отчета для конкретного аккаунта"""
     # Отправляем сообщение о загрузке и сохраняем его ID
@@ -259,9 +400,7 @@ def daily_report_for_account(chat_id, account_id):
     
     try:
         account = AvitoAccount.objects.get(id=account_id)
-        client_id = account.client_id
-        client_secret = account.client_secret
-        response = get_daily_statistics(client_id, client_secret)
+        response = get_daily_report_data(account)
         
         # Удаляем сообщение о загрузке после получения данных
         bot.delete_message(chat_id, loading_message.message_id)
@@ -303,15 +442,13 @@ def weekly_report_for_account(chat_id, account_id):
     
     try:
         account = AvitoAccount.objects.get(id=account_id)
-        client_id = account.client_id
-        client_secret = account.client_secret
-        response = get_weekly_statistics(client_id, client_secret)
+        response = get_weekly_report_data(account)
         
         # Удаляем сообщение о загрузке после получения данных
         bot.delete_message(chat_id, loading_message.message_id)
         
         # Получаем текущую дату для поиска данных предыдущей недели
-        current_date = timezone.now().date()
+        current_date = timezone.localdate()
         
         # Получаем статистику за предыдущую неделю
         previous_week_stats = get_previous_week_stats(account_id, current_date)
@@ -435,15 +572,13 @@ def weekly_report_for_account(chat_id, account_id):
         bot.send_message(chat_id, f"❌ Произошла ошибка: {str(e)}")
 
 def send_weekly_report(telegram_id, account_id):
-    """Отправка недельного отчета по ID в Telegram и ID аккаунта Авито"""
+    """Отправка недельного отчета по ID в Telegram и ID аккаунта Авито. Возвращает True при успехе"""
     try:
         account = AvitoAccount.objects.get(id=account_id)
-        client_id = account.client_id
-        client_secret = account.client_secret
-        response = get_weekly_statistics(client_id, client_secret)
+        response = get_weekly_report_data(account)
         
         # Получаем текущую дату для поиска данных предыдущей недели
-        current_date = timezone.now().date()
+        current_date = timezone.localdate()
         
         # Получаем статистику за предыдущую неделю
         previous_week_stats = get_previous_week_stats(account_id, current_date)
@@ -553,20 +688,21 @@ def send_weekly_report(telegram_id, account_id):
         
         # Отправляем отчет на указанный ID для недельных отчетов
         bot.send_message(telegram_id, message_text, parse_mode="Markdown")
+        return True
         
     except AvitoAccount.DoesNotExist:
         bot.send_message(telegram_id, "❌ Ошибка: аккаунт не найден")
+        return False
     except Exception as e:
         logger.error(f"Ошибка при отправке недельного отчета: {e}")
         bot.send_message(telegram_id, f"❌ Произошла ошибка: {str(e)}")
+        return False
 
 def send_daily_report(telegram_id, account_id):
-    """Отправка дневного отчета по ID в Telegram и ID аккаунта Авито"""
+    """Отправка дневного отчета по ID в Telegram и ID аккаунта Авито. Возвращает True при успехе"""
     try:
         account = AvitoAccount.objects.get(id=account_id)
-        client_id = account.client_id
-        client_secret = account.client_secret
-        response = get_daily_statistics(client_id, client_secret)
+        response = get_daily_report_data(account)
         
         # Получаем дату текущего отчета в формате datetime.date
         today_date = datetime.datetime.strptime(response['date'], '%Y-%m-%d').date()
@@ -584,12 +720,15 @@ def send_daily_report(telegram_id, account_id):
             message_text = format_daily_report_standard(account, response, previous_stats)
         
         bot.send_message(telegram_id, message_text, parse_mode="Markdown")
+        return True
         
     except AvitoAccount.DoesNotExist:
         bot.send_message(telegram_id, "❌ Ошибка: аккаунт не найден")
+        return False
     except Exception as e:
         logger.error(f"Ошибка при отправке дневного отчета: {e}")
         bot.send_message(telegram_id, f"❌ Произошла ошибка: {str(e)}")
+        return False
 
 def add_avito_account(message):
     """Обработчик для добавления нового аккаунта Авито"""
@@ -640,6 +779,9 @@ def get_historical_stats(account_id, days=7):
     """
     Получение исторической статистики из БД для аккаунта за указанное количество дней
     
+    Данные по дням выбираются одним запросом values(), итоги и средние
+    значения считаются в БД одним aggregate().
+    
     Args:
         account_id: ID аккаунта Авито
         days: Количество дней для выборки (по умолчанию 7)
@@ -648,94 +790,77 @@ def get_historical_stats(account_id, days=7):
         dict: Словарь со статистикой по дням
     """
     try:
-        # Проверяем существование аккаунта
-        account = AvitoAccount.objects.get(id=account_id)
-        
         # Получаем текущую дату
-        today = timezone.now().date()
+        today = timezone.localdate()
         start_date = today - datetime.timedelta(days=days)
         
         # Получаем все записи статистики для данного аккаунта за указанный период
-        stats = AvitoAccountDailyStats.objects.filter(
-            avito_account=account,
+        period_stats = AvitoAccountDailyStats.objects.filter(
+            avito_account_id=account_id,
             date__gte=start_date,
             date__lt=today
-        ).order_by('date')
+        )
+        rows = list(period_stats.order_by('date').values('avito_account__name', *DAY_STATS_FIELDS))
         
         # Если нет данных статистики, возвращаем пустой словарь
-        if not stats.exists():
-            # Попробуем получить хотя бы последние доступные данные
-            last_stats = AvitoAccountDailyStats.objects.filter(
-                avito_account=account
-            ).order_by('-date').first()
-            
-            if last_stats:
-                logger.info(f"Нет данных за последние {days} дней, но найдены данные за {last_stats.date} для аккаунта {account.name}")
-            else:
-                logger.info(f"Нет исторической статистики для аккаунта {account.name}")
-            
-            # В любом случае возвращаем пустой словарь
+        if not rows:
+            account = AvitoAccount.objects.get(id=account_id)
+            logger.info(f"Нет исторической статистики для аккаунта {account.name} за последние {days} дней")
             return {}
         
-        # Сначала подготовим полный список всех дат в запрошенном периоде
-        all_dates = []
-        current_date = start_date
-        while current_date < today:
-            all_dates.append(current_date)
-            current_date = current_date + datetime.timedelta(days=1)
-            
-        # Создадим словарь {дата: данные} для быстрого доступа
-        stats_by_date = {stat.date: stat for stat in stats}
+        account_name = rows[0]['avito_account__name']
+        stats_by_date = {row['date']: row for row in rows}
         
         # Формируем результат
         result = {
-            "account_name": account.name,
+            "account_name": account_name,
             "period": f"{start_date} - {today - datetime.timedelta(days=1)}",
             "days_count": days,
             "days": [],
-            "days_with_data": stats.count(),
-            "days_missing": days - stats.count()
+            "days_with_data": len(rows),
+            "days_missing": days - len(rows)
         }
         
         # Добавляем статистику по всем дням в периоде
         # (включая дни без данных, чтобы сохранить хронологию)
-        for date in all_dates:
-            if date in stats_by_date:
-                stat = stats_by_date[date]
+        date = start_date
+        while date < today:
+            row = stats_by_date.get(date)
+            if row:
                 day_stats = {
                     "date": date.strftime("%Y-%m-%d"),
                     "has_data": True,
                     "calls": {
-                        "total": stat.total_calls,
-                        "answered": stat.answered_calls,
-                        "missed": stat.missed_calls
+                        "total": row['total_calls'],
+                        "answered": row['answered_calls'],
+                        "missed": row['missed_calls']
                     },
                     "chats": {
-                        "total": stat.total_chats,
-                        "new": stat.new_chats
+                        "total": row['total_chats'],
+                        "new": row['new_chats']
                     },
-                    "phones_received": stat.phones_received,
-                    "rating": stat.rating,
+                    "phones_received": row['phones_received'],
+                    "rating": row['rating'],
                     "reviews": {
-                        "total": stat.total_reviews,
-                        "daily": stat.daily_reviews
+                        "total": row['total_reviews'],
+                        "daily": row['daily_reviews']
                     },
                     "items": {
-                        "total": stat.total_items,
-                        "with_xl_promotion": stat.xl_promotion_count
+                        "total": row['total_items'],
+                        "with_xl_promotion": row['xl_promotion_count']
                     },
                     "statistics": {
-                        "views": stat.views,
-                        "contacts": stat.contacts,
-                        "favorites": stat.favorites
+                        "views": row['views'],
+                        "contacts": row['contacts'],
+                        "favorites": row['favorites']
                     },
                     "finance": {
-                        "balance_real": stat.balance_real,
-                        "balance_bonus": stat.balance_bonus,
-                        "advance": stat.advance,
-                        "expense": stat.daily_expense
+                        "balance_real": row['balance_real'],
+                        "balance_bonus": row['balance_bonus'],
+                        "advance": row['advance'],
+                        "expense": row['daily_expense']
                     },
-                    "expenses_details": stat.get_expenses_details()
+                    "expenses_details": AvitoAccountDailyStats.parse_expenses_details(row['expenses_details'])
                 }
             else:
                 # Если данных за этот день нет, добавляем заглушку
@@ -745,43 +870,37 @@ def get_historical_stats(account_id, days=7):
                 }
             
             result["days"].append(day_stats)
-        
-        # Добавляем суммарную статистику за весь период
-        # Учитываем только дни, для которых есть данные
-        days_with_data = [day for day in result["days"] if day.get("has_data", False)]
-        
-        if days_with_data:
-            total_stats = {
-                "calls": {
-                    "total": sum(day["calls"]["total"] for day in days_with_data),
-                    "answered": sum(day["calls"]["answered"] for day in days_with_data),
-                    "missed": sum(day["calls"]["missed"] for day in days_with_data)
-                },
-                "chats": {
-                    "total": sum(day["chats"]["total"] for day in days_with_data)
-                },
-                "phones_received": sum(day["phones_received"] for day in days_with_data),
-                "statistics": {
-                    "views": sum(day["statistics"]["views"] for day in days_with_data),
-                    "contacts": sum(day["statistics"]["contacts"] for day in days_with_data),
-                    "favorites": sum(day["statistics"]["favorites"] for day in days_with_data)
-                },
-                "daily_reviews": sum(day["reviews"]["daily"] for day in days_with_data),
-                "expenses": sum(day["finance"]["expense"] for day in days_with_data)
+            date += datetime.timedelta(days=1)
+        
+        # Добавляем суммарную статистику за весь период (по дням, для которых есть данные)
+        summary = aggregate_daily_stats(period_stats)
+        result["total"] = {
+            "calls": {
+                "total": summary.total_calls,
+                "answered": summary.answered_calls,
+                "missed": summary.missed_calls
+            },
+            "chats": {
+                "total": summary.total_chats
+            },
+            "phones_received": summary.phones_received,
+            "statistics": {
+                "views": summary.views,
+                "contacts": summary.contacts,
+                "favorites": summary.favorites
+            },
+            "daily_reviews": summary.daily_reviews,
+            "expenses": summary.daily_expense,
+            # Среднедневные значения
+            "daily_avg": {
+                "calls": round(summary.total_calls / summary.days, 1),
+                "views": round(summary.views / summary.days, 1),
+                "contacts": round(summary.contacts / summary.days, 1),
+                "expenses": round(summary.daily_expense / summary.days, 2)
             }
-            
-            # Добавляем среднедневные значения
-            if result["days_with_data"] > 0:
-                total_stats["daily_avg"] = {
-                    "calls": round(total_stats["calls"]["total"] / result["days_with_data"], 1),
-                    "views": round(total_stats["statistics"]["views"] / result["days_with_data"], 1),
-                    "contacts": round(total_stats["statistics"]["contacts"] / result["days_with_data"], 1),
-                    "expenses": round(total_stats["expenses"] / result["days_with_data"], 2)
-                }
-            
-            result["total"] = total_stats
+        }
         
-        logger.info(f"Получена историческая статистика для аккаунта {account.name} за {days} дней")
+        logger.info(f"Получена историческая статистика для аккаунта {account_name} за {days} дней")
         return result
         
     except AvitoAccount.DoesNotExist:
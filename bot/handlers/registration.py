@@ -128,6 +128,7 @@ def get_weekly_report_id(message, account_name, client_id, client_secret, daily_
             name=account_name,
             client_id=client_id,
             client_secret=client_secret,
+            avito_user_id=get_avito_user_id(client_id, client_secret),
             daily_report_tg_id=daily_report_tg_id,
             weekly_report_tg_id=weekly_report_tg_id
         )
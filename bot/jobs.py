@@ -0,0 +1,263 @@
+import datetime
+import json
+import logging
+import time
+from traceback import format_exc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from telebot.apihelper import ApiTelegramException
+from telebot.types import Update
+
+from bot import bot
+from bot.models import TelegramUpdateJob
+
+logger = logging.getLogger(__name__)
+
+# Запросы отчетов, одинаковые повторы которых из одного чата выполняются один раз
+COALESCED_CALLBACK_PREFIXES = ('daily_report', 'weekly_report', 'stats_')
+COALESCED_COMMANDS = ('/daily', '/weekly', '/stats')
+
+
+def mark_update_seen(update_id):
+    """
+    Запоминает update_id на TELEGRAM_UPDATE_DEDUP_TTL секунд.
+    
+    Returns:
+        bool: False, если обновление уже было получено (повторная доставка Telegram)
+    """
+    return cache.add(f"telegram_update_{update_id}", 1, timeout=settings.TELEGRAM_UPDATE_DEDUP_TTL)
+
+
+def forget_update(update_id):
+    """Удаляет update_id из полученных (обновление не удалось сохранить, Telegram повторит его)"""
+    cache.delete(f"telegram_update_{update_id}")
+
+
+def get_update_chat(update):
+    """
+    Возвращает чат обновления и ключ запроса для объединения повторов.
+    
+    Returns:
+        tuple: (ID чата или None, ключ запроса или None, если запрос не объединяется)
+    """
+    if update.callback_query and update.callback_query.message:
+        data = update.callback_query.data or ""
+        request_key = f"callback:{data}" if data.startswith(COALESCED_CALLBACK_PREFIXES) else None
+        return update.callback_query.message.chat.id, request_key
+    if update.message:
+        # Команда без упоминания бота: /daily@bot_name -> /daily
+        command = (update.message.text or "").split(" ")[0].split("@")[0]
+        return update.message.chat.id, f"command:{command}" if command in COALESCED_COMMANDS else None
+    return None, None
+
+
+def acquire_chat_lock(chat_id):
+    """Ждет, пока закончится обработка предыдущего обновления из чата (но не дольше TELEGRAM_CHAT_LOCK_TIMEOUT)"""
+    lock_key = f"telegram_chat_lock_{chat_id}"
+    deadline = time.monotonic() + settings.TELEGRAM_CHAT_LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, timeout=settings.TELEGRAM_CHAT_LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            logger.warning(f"Не дождались обработки предыдущего обновления из чата {chat_id}")
+            return None
+        time.sleep(0.1)
+    return lock_key
+
+
+def parse_update_id(json_string):
+    """
+    Возвращает update_id обновления Telegram.
+    
+    Raises:
+        ValueError: Если тело запроса - не JSON-объект обновления
+    """
+    try:
+        return int(json.loads(json_string)['update_id'])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Нет update_id: {e}")
+
+
+def enqueue_update(update_id, json_string):
+    """Сохраняет обновление Telegram в очередь"""
+    return TelegramUpdateJob.objects.create(update_id=update_id, payload=json_string)
+
+
+def dispatch_update(update):
+    """Передает обновление обработчикам бота; ошибки записываются в лог, как и раньше в вебхуке"""
+    try:
+        bot.process_new_updates([update])
+    except ApiTelegramException as e:
+        logger.error(f"Telegram exception. {e} {format_exc()}")
+    except ConnectionError as e:
+        logger.error(f"Connection error. {e} {format_exc()}")
+    except Exception as e:
+        bot.send_message(settings.OWNER_ID, f'Error from index: {e}')
+        logger.error(f"Unhandled exception. {e} {format_exc()}")
+        return str(e)
+    return None
+
+
+def process_update(json_string):
+    """
+    Передает обновление обработчикам бота. Ошибки записываются в лог,
+    о непредвиденных ошибках сообщается владельцу бота.
+    
+    Обновления из одного чата обрабатываются по очереди (даже в разных
+    обработчиках очереди). Одинаковый запрос отчета из того же чата,
+    пришедший, пока такой же запрос выполняется или в течение
+    TELEGRAM_COALESCE_WINDOW секунд после его выполнения, не выполняется
+    повторно: пользователь получит ответ на первый запрос.
+    
+    Returns:
+        str: Текст непредвиденной ошибки или None
+    """
+    update = Update.de_json(json_string)
+    chat_id, request_key = get_update_chat(update)
+    if chat_id is None:
+        return dispatch_update(update)
+    
+    coalesce_key = f"telegram_request_{chat_id}_{request_key}" if request_key else None
+    if coalesce_key and not cache.add(coalesce_key, 1, timeout=settings.TELEGRAM_CHAT_LOCK_TIMEOUT):
+        logger.info(f"Запрос {request_key} из чата {chat_id} уже выполняется, повтор пропущен")
+        if update.callback_query:
+            try:
+                bot.answer_callback_query(update.callback_query.id, "⏳ Запрос уже выполняется")
+            except Exception as e:
+                logger.warning(f"Не удалось ответить на повторный запрос: {e}")
+        return None
+    
+    lock_key = acquire_chat_lock(chat_id)
+    try:
+        return dispatch_update(update)
+    finally:
+        if lock_key:
+            cache.delete(lock_key)
+        if coalesce_key:
+            # Повторы, пришедшие сразу после выполнения, тоже получили этот ответ
+            cache.touch(coalesce_key, timeout=settings.TELEGRAM_COALESCE_WINDOW)
+
+
+def claim_job():
+    """
+    Забирает в обработку самое старое ожидающее обновление или возвращает None.
+    
+    Строка блокируется SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько
+    обработчиков одновременно забирают разные обновления, не дожидаясь друг друга.
+    Там, где блокировки строк нет (SQLite), статус меняется только у строки,
+    которая все еще ожидает: если обновление уже забрал другой обработчик,
+    берется следующее. Обновление забирается непосредственно перед обработкой,
+    поэтому started_at отсчитывает время обработки именно этого обновления,
+    а остальные обновления остаются в очереди для свободных обработчиков.
+    """
+    while True:
+        with transaction.atomic():
+            job = (
+                TelegramUpdateJob.objects.select_for_update(skip_locked=True)
+                .filter(status='pending')
+                .order_by('id')
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = 'processing'
+            job.started_at = timezone.now()
+            job.attempts += 1
+            claimed = TelegramUpdateJob.objects.filter(pk=job.pk, status='pending').update(
+                status=job.status, started_at=job.started_at, attempts=job.attempts
+            )
+        if claimed:
+            return job
+        logger.debug(f"Обновление {job.pk} уже забрал другой обработчик")
+
+
+def get_claimed_job(job):
+    """
+    Queryset обновления, пока оно числится за этим обработчиком: после
+    requeue_stale_jobs его может забрать другой обработчик с новым started_at
+    """
+    return TelegramUpdateJob.objects.filter(pk=job.pk, status='processing', started_at=job.started_at)
+
+
+def process_job(job):
+    """
+    Обрабатывает обновление из очереди: успешно обработанное удаляется, с ошибкой - помечается.
+    
+    Returns:
+        bool: True - обработано, False - с ошибкой, None - обновление уже забрал другой обработчик
+    """
+    if not get_claimed_job(job).exists():
+        logger.warning(f"Обновление {job.update_id} уже обрабатывается другим обработчиком, пропущено")
+        return None
+    error = process_update(job.payload)
+    if error:
+        # Повторно не обрабатываем: обработчик мог уже отправить часть сообщений
+        get_claimed_job(job).update(status='failed', error=error)
+        return False
+    if not get_claimed_job(job).delete()[0]:
+        logger.warning(f"Обновление {job.update_id} было возвращено в очередь во время обработки")
+    return True
+
+
+def requeue_stale_jobs():
+    """
+    Возвращает в очередь обновления, обработка которых не завершилась за UPDATE_JOB_TIMEOUT
+    секунд (обработчик был остановлен), или помечает их ошибочными после
+    UPDATE_JOB_MAX_ATTEMPTS попыток.
+    
+    Returns:
+        int: Количество возвращенных в очередь обновлений
+    """
+    stale = TelegramUpdateJob.objects.filter(
+        status='processing',
+        started_at__lt=timezone.now() - datetime.timedelta(seconds=settings.UPDATE_JOB_TIMEOUT)
+    )
+    stale.filter(attempts__gte=settings.UPDATE_JOB_MAX_ATTEMPTS).update(
+        status='failed', error='Превышено время обработки'
+    )
+    requeued = stale.filter(attempts__lt=settings.UPDATE_JOB_MAX_ATTEMPTS).update(status='pending')
+    if requeued:
+        logger.warning(f"Возвращено в очередь зависших обновлений: {requeued}")
+    return requeued
+
+
+def run_worker(poll_interval=None, once=False, should_stop=None):
+    """
+    Обрабатывает очередь обновлений Telegram по одному, пока should_stop() не вернет True.
+    
+    Args:
+        poll_interval: Пауза при пустой очереди в секундах (по умолчанию UPDATE_WORKER_POLL_INTERVAL)
+        once: Завершиться, когда очередь опустеет
+        should_stop: Функция без аргументов, сигнализирующая об остановке
+        
+    Returns:
+        dict: {"processed": обработано, "failed": с ошибкой}
+    """
+    poll_interval = poll_interval if poll_interval is not None else settings.UPDATE_WORKER_POLL_INTERVAL
+    should_stop = should_stop or (lambda: False)
+    
+    result = {"processed": 0, "failed": 0}
+    last_requeue = 0
+    while not should_stop():
+        # Соединение с БД могло быть закрыто сервером за время простоя
+        close_old_connections()
+        
+        if time.monotonic() - last_requeue > settings.UPDATE_JOB_TIMEOUT / 10:
+            requeue_stale_jobs()
+            last_requeue = time.monotonic()
+        
+        job = claim_job()
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        
+        processed = process_job(job)
+        if processed:
+            result["processed"] += 1
+        elif processed is False:
+            result["failed"] += 1
+    
+    return result
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from bot.backfill import backfill_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Заполняет недостающую историческую статистику аккаунтов (с продолжением после прерывания)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Количество дней для заполнения')
+        parser.add_argument('--accounts', type=int, nargs='+', help='ID аккаунтов (по умолчанию все)')
+        parser.add_argument('--concurrency', type=int, help='Число одновременных запросов статистики')
+        parser.add_argument('--restart', action='store_true', help='Начать заново, не используя контрольную точку')
+        parser.add_argument(
+            '--per-day', action='store_true',
+            help='Запрашивать статистику за каждый день отдельно, а не за весь период'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Запуск заполнения исторических данных за {options['days']} дней...")
+        result = backfill_daily_stats(
+            days=options['days'],
+            account_ids=options['accounts'],
+            concurrency=options['concurrency'],
+            restart=options['restart'],
+            grouped=not options['per_day'],
+        )
+        self.stdout.write(
+            f"Записано: {result['written']}, с ошибкой: {result['failed']}, "
+            f"пропущено по контрольной точке: {result['skipped']}"
+        )
+        self.stdout.write(self.style.SUCCESS('Заполнение исторических данных завершено'))
@@ -0,0 +1,128 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from bot.models import AvitoAccount, AvitoAccountDailyStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время типичных запросов к AvitoAccountDailyStats с индексами из Meta.indexes и без них '
+        '(уникальный индекс (avito_account, date) остается в обоих замерах). '
+        'Работает в отдельной временной БД (как тесты Django), рабочая БД не затрагивается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=1000, help='Количество аккаунтов')
+        parser.add_argument('--days', type=int, default=730, help='Количество дней статистики на аккаунт')
+        parser.add_argument('--repeat', type=int, default=5, help='Сколько раз повторять каждый запрос')
+        parser.add_argument('--explain', action='store_true', help='Выводить план выполнения запросов')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        self.stdout.write(f"Создание временной БД ({connection.vendor})...")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.fill(options['accounts'], options['days'])
+            self.stdout.write(self.style.SUCCESS('С индексами Meta.indexes:'))
+            after = self.run_queries(options)
+            self.drop_indexes()
+            self.stdout.write(self.style.WARNING('Без индексов Meta.indexes:'))
+            before = self.run_queries(options)
+
+            self.stdout.write('\nИтог (медиана, мс): без индексов -> с индексами')
+            for name in after:
+                self.stdout.write(f"  {name}: {before[name]:.2f} -> {after[name]:.2f}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def fill(self, accounts_count, days):
+        """Заполняет временную БД аккаунтами и статистикой за days дней"""
+        self.stdout.write(f"Заполнение: {accounts_count} аккаунтов x {days} дней...")
+        started_at = time.monotonic()
+
+        AvitoAccount.objects.bulk_create([
+            AvitoAccount(name=f"Бенчмарк {i}", client_id=f"bench-{i}", client_secret="bench")
+            for i in range(accounts_count)
+        ])
+        # SQLite и MySQL возвращают первичные ключи не во всех версиях
+        accounts = list(AvitoAccount.objects.order_by('id'))
+
+        self.today = datetime.date.today()
+        batch = []
+        for day in range(days):
+            date = self.today - datetime.timedelta(days=day + 1)
+            for account in accounts:
+                batch.append(AvitoAccountDailyStats(
+                    avito_account=account,
+                    date=date,
+                    total_calls=random.randint(0, 50),
+                    views=random.randint(0, 5000),
+                    contacts=random.randint(0, 100),
+                    daily_expense=random.uniform(0, 3000),
+                ))
+                if len(batch) >= 5000:
+                    AvitoAccountDailyStats.objects.bulk_create(batch)
+                    batch = []
+        AvitoAccountDailyStats.objects.bulk_create(batch)
+
+        self.account_ids = [account.id for account in accounts]
+        self.stdout.write(
+            f"Записано {AvitoAccountDailyStats.objects.count()} строк за {time.monotonic() - started_at:.1f} с"
+        )
+
+    def drop_indexes(self):
+        """
+        Удаляет индексы из Meta.indexes (dailystats_date_idx). Уникальный индекс
+        (avito_account, date) и индекс внешнего ключа были и до их добавления,
+        поэтому остаются, чтобы замер "без индексов" соответствовал прежней схеме
+        """
+        with connection.schema_editor() as schema_editor:
+            for index in AvitoAccountDailyStats._meta.indexes:
+                schema_editor.remove_index(AvitoAccountDailyStats, index)
+
+    def get_queries(self):
+        """Типичные запросы: отчеты по аккаунту за период, итоги, удаление старых данных"""
+        account_id = random.choice(self.account_ids)
+        month_ago = self.today - datetime.timedelta(days=30)
+        two_weeks_ago = self.today - datetime.timedelta(days=14)
+        week_ago = self.today - datetime.timedelta(days=7)
+        threshold = self.today - datetime.timedelta(days=365)
+        return {
+            'Аккаунт за 30 дней по дате': lambda: AvitoAccountDailyStats.objects.filter(
+                avito_account_id=account_id, date__gte=month_ago, date__lt=self.today
+            ).order_by('date'),
+            'Итоги аккаунта за прошлую неделю': lambda: AvitoAccountDailyStats.objects.filter(
+                avito_account_id=account_id, date__gte=two_weeks_ago, date__lt=week_ago
+            ),
+            'Все аккаунты за вчера': lambda: AvitoAccountDailyStats.objects.filter(
+                date=self.today - datetime.timedelta(days=1)
+            ),
+            'Старше года (удаление)': lambda: AvitoAccountDailyStats.objects.filter(date__lt=threshold),
+        }
+
+    def run_queries(self, options):
+        results = {}
+        for name, make_queryset in self.get_queries().items():
+            timings = []
+            for _ in range(options['repeat']):
+                queryset = make_queryset()
+                started_at = time.perf_counter()
+                if name.startswith('Итоги'):
+                    queryset.aggregate(Sum('total_calls'), Sum('views'))
+                elif name.startswith('Старше'):
+                    queryset.count()
+                else:
+                    list(queryset.values_list('id', 'date'))
+                timings.append((time.perf_counter() - started_at) * 1000)
+
+            results[name] = statistics.median(timings)
+            self.stdout.write(f"  {name}: {results[name]:.2f} мс")
+            if options['explain']:
+                self.stdout.write(f"    {make_queryset().explain()}")
+        return results
@@ -1,7 +1,6 @@
 import logging
 from django.core.management.base import BaseCommand
-from bot.models import AvitoAccount
-from bot.handlers.common import send_daily_report
+from bot.cron import send_daily_reports_to_all_users, reset_daily_expenses
 
 logger = logging.getLogger(__name__)
 
@@ -17,33 +16,16 @@ class Command(BaseCommand):
 
     def send_daily_reports_to_all_users(self):
         """Отправка ежедневных отчетов всем пользователям"""
-        accounts = AvitoAccount.objects.filter(
-            client_id__isnull=False, 
-            client_secret__isnull=False
-        ).exclude(client_id="none")
-        
-        self.stdout.write(f'Найдено аккаунтов для отправки отчетов: {accounts.count()}')
-        
-        for account in accounts:
-            try:
-                # Отправляем дневной отчет
-                if account.daily_report_tg_id:
-                    self.stdout.write(f"Отправка отчета для аккаунта {account.name} на ID: {account.daily_report_tg_id}")
-                    send_daily_report(account.daily_report_tg_id, account.id)
-                else:
-                    self.stdout.write(f"Аккаунт {account.name} не имеет указанного получателя ежедневных отчетов")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке ежедневного отчета для аккаунта {account.name}: {e}")
+        summary = send_daily_reports_to_all_users()
+        self.stdout.write(
+            f"Отправлено: {len(summary['success'])}, с ошибкой: {len(summary['failed'])}, "
+            f"превышено время: {len(summary['timeout'])}"
+        )
+        for account_name in summary['failed'] + summary['timeout']:
+            self.stdout.write(self.style.WARNING(f"Отчет для аккаунта {account_name} не отправлен"))
 
     def reset_daily_expenses(self):
-        """Сброс дневных расходов в начале нового дня"""
-        try:
-            # Сбрасываем дневной расход для всех аккаунтов
-            accounts = AvitoAccount.objects.all()
-            for account in accounts:
-                if account.daily_expense > 0:
-                    logger.info(f"Сброс дневного расхода для аккаунта {account.name}: {account.daily_expense} р.")
-                    account.daily_expense = 0
-                    account.save()
-        except Exception as e:
-            logger.error(f"Ошибка при сбросе дневных расходов: {e}")
+        """Сброс дневных расходов"""
+        count = reset_daily_expenses()
+        if count is not None:
+            self.stdout.write(f"Сброшены дневные расходы для {count} аккаунтов")
@@ -0,0 +1,35 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from bot.scheduler import get_default_tasks, run_scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает задачи bot.cron (minutely_task, daily_task, weekly_task) по расписанию '
+        'SCHEDULER_TASKS в одном постоянно работающем процессе вместо запусков manage.py из cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, help='Максимальная пауза между проверками расписания в секундах')
+
+    def handle(self, *args, **options):
+        stop = {"requested": False}
+
+        def request_stop(signum, frame):
+            self.stdout.write('Остановка после завершения выполняющихся задач...')
+            stop["requested"] = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        tasks = get_default_tasks()
+        for task in tasks:
+            self.stdout.write(f"{task.name}: {task.schedule.expression}")
+        self.stdout.write('Планировщик запущен')
+
+        result = run_scheduler(tasks, should_stop=lambda: stop["requested"], tick=options['tick'])
+        for name, counts in result.items():
+            self.stdout.write(f"{name}: запусков {counts['runs']}, пропущено {counts['skipped']}")
+        self.stdout.write(self.style.SUCCESS('Планировщик остановлен'))
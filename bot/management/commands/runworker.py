@@ -0,0 +1,39 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from bot.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает очередь обновлений Telegram, сохраненных вебхуком. '
+        'Можно запускать несколько процессов одновременно'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, help='Пауза при пустой очереди в секундах')
+        parser.add_argument('--once', action='store_true', help='Завершиться, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        # Регистрирует обработчики сообщений и кнопок бота
+        import bot.views  # noqa: F401
+
+        stop = {"requested": False}
+
+        def request_stop(signum, frame):
+            self.stdout.write('Остановка после текущего обновления...')
+            stop["requested"] = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write('Обработчик очереди обновлений запущен')
+        result = run_worker(
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+            should_stop=lambda: stop["requested"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработчик остановлен: обработано {result['processed']}, с ошибкой {result['failed']}"
+        ))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bot import bot, setup_bot
+
+
+class Command(BaseCommand):
+    help = 'Регистрирует команды бота в Telegram и, с --webhook, устанавливает вебхук'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--webhook', action='store_true', help='Установить вебхук на адрес из HOOK')
+
+    def handle(self, *args, **options):
+        username = setup_bot()
+        self.stdout.write(f"Команды бота @{username} зарегистрированы")
+        if options['webhook']:
+            bot.set_webhook(url=f"{settings.HOOK}/bot/{settings.BOT_TOKEN}")
+            self.stdout.write(f"Вебхук установлен: {settings.HOOK}/bot/...")
+        self.stdout.write(self.style.SUCCESS('Настройка бота завершена'))
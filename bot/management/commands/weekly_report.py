@@ -1,7 +1,6 @@
 import logging
 from django.core.management.base import BaseCommand
-from bot.models import AvitoAccount
-from bot.handlers.common import send_weekly_report
+from bot.cron import send_weekly_reports_to_all_users, reset_weekly_expenses
 
 logger = logging.getLogger(__name__)
 
@@ -17,33 +16,16 @@ class Command(BaseCommand):
 
     def send_weekly_reports_to_all_users(self):
         """Отправка еженедельных отчетов всем пользователям"""
-        accounts = AvitoAccount.objects.filter(
-            client_id__isnull=False, 
-            client_secret__isnull=False
-        ).exclude(client_id="none")
-        
-        self.stdout.write(f'Найдено аккаунтов для отправки отчетов: {accounts.count()}')
-        
-        for account in accounts:
-            try:
-                # Отправляем недельный отчет
-                if account.weekly_report_tg_id:
-                    self.stdout.write(f"Отправка отчета для аккаунта {account.name} на ID: {account.weekly_report_tg_id}")
-                    send_weekly_report(account.weekly_report_tg_id, account.id)
-                else:
-                    self.stdout.write(f"Аккаунт {account.name} не имеет указанного получателя еженедельных отчетов")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке еженедельного отчета для аккаунта {account.name}: {e}")
+        summary = send_weekly_reports_to_all_users()
+        self.stdout.write(
+            f"Отправлено: {len(summary['success'])}, с ошибкой: {len(summary['failed'])}, "
+            f"превышено время: {len(summary['timeout'])}"
+        )
+        for account_name in summary['failed'] + summary['timeout']:
+            self.stdout.write(self.style.WARNING(f"Отчет для аккаунта {account_name} не отправлен"))
 
     def reset_weekly_expenses(self):
-        """Сброс недельных расходов в начале новой недели"""
-        try:
-            # Сбрасываем недельный расход для всех аккаунтов
-            accounts = AvitoAccount.objects.all()
-            for account in accounts:
-                if account.weekly_expense > 0:
-                    logger.info(f"Сброс недельного расхода для аккаунта {account.name}: {account.weekly_expense} р.")
-                    account.weekly_expense = 0
-                    account.save()
-        except Exception as e:
-            logger.error(f"Ошибка при сбросе недельных расходов: {e}")
+        """Сброс недельных расходов"""
+        count = reset_weekly_expenses()
+        if count is not None:
+            self.stdout.write(f"Сброшены недельные расходы для {count} аккаунтов")
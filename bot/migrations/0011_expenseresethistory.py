@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_avitoaccount_avito_user_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseResetHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('daily', 'Дневной'), ('weekly', 'Недельный')], max_length=10, verbose_name='Период')),
+                ('amount', models.FloatField(verbose_name='Расход перед сбросом')),
+                ('reset_at', models.DateTimeField(auto_now_add=True, verbose_name='Время сброса')),
+                ('avito_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_resets', to='bot.avitoaccount', verbose_name='Аккаунт Авито')),
+            ],
+            options={
+                'verbose_name': 'Сброс расходов',
+                'verbose_name_plural': 'История сброса расходов',
+                'ordering': ['-reset_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0011_expenseresethistory'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avitoaccountdailystats',
+            index=models.Index(fields=['date'], name='dailystats_date_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_avitoaccountdailystats_dailystats_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvitoAccountMonthlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц (первое число)')),
+                ('days', models.IntegerField(default=0, verbose_name='Дней со статистикой')),
+                ('total_calls', models.IntegerField(default=0, verbose_name='Всего звонков')),
+                ('answered_calls', models.IntegerField(default=0, verbose_name='Отвеченные звонки')),
+                ('missed_calls', models.IntegerField(default=0, verbose_name='Пропущенные звонки')),
+                ('total_chats', models.IntegerField(default=0, verbose_name='Всего чатов')),
+                ('new_chats', models.IntegerField(default=0, verbose_name='Новые чаты')),
+                ('phones_received', models.IntegerField(default=0, verbose_name='Показы телефона')),
+                ('views', models.IntegerField(default=0, verbose_name='Просмотры')),
+                ('contacts', models.IntegerField(default=0, verbose_name='Контакты')),
+                ('favorites', models.IntegerField(default=0, verbose_name='В избранном')),
+                ('daily_reviews', models.IntegerField(default=0, verbose_name='Отзывы')),
+                ('daily_expense', models.FloatField(default=0, verbose_name='Расход')),
+                ('total_items', models.FloatField(default=0, verbose_name='Объявлений (в среднем)')),
+                ('xl_promotion_count', models.FloatField(default=0, verbose_name='С XL продвижением (в среднем)')),
+                ('rating', models.FloatField(default=0, verbose_name='Рейтинг (в среднем)')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('avito_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to='bot.avitoaccount', verbose_name='Аккаунт Авито')),
+            ],
+            options={
+                'verbose_name': 'Помесячная статистика аккаунта',
+                'verbose_name_plural': 'Помесячная статистика аккаунтов',
+                'ordering': ['-month'],
+                'unique_together': {('avito_account', 'month')},
+            },
+        ),
+    ]
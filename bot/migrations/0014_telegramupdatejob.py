@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_avitoaccountmonthlystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramUpdateJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('update_id', models.BigIntegerField(db_index=True, verbose_name='ID обновления Telegram')),
+                ('payload', models.TextField(verbose_name='Обновление JSON')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('processing', 'Обрабатывается'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток обработки')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата получения')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало обработки')),
+            ],
+            options={
+                'verbose_name': 'Обновление Telegram в очереди',
+                'verbose_name_plural': 'Очередь обновлений Telegram',
+                'indexes': [models.Index(fields=['status', 'id'], name='updatejob_status_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import datetime
 import json
 
@@ -40,6 +41,11 @@ class AvitoAccount(models.Model):
         blank=True,
         default="none",
     )
+    avito_user_id = models.BigIntegerField(
+        verbose_name='ID пользователя Авито',
+        null=True,
+        blank=True,
+    )
     daily_report_tg_id = models.CharField(
         max_length=50,
         verbose_name='Telegram ID для дневных отчетов',
@@ -197,17 +203,267 @@ class AvitoAccountDailyStats(models.Model):
         verbose_name='Расход за день',
         default=0
     )
+    expenses_details = models.TextField(
+        verbose_name='Детализация расходов JSON',
+        null=True,
+        blank=True
+    )
+    
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        null=True,
+        verbose_name='Дата обновления'
+    )
     
     class Meta:
         verbose_name = 'Ежедневная статистика аккаунта'
         verbose_name_plural = 'Ежедневная статистика аккаунтов'
-        # Уникальное ограничение по аккаунту и дате
+        # Уникальное ограничение по аккаунту и дате. Его составной индекс
+        # (avito_account, date) обслуживает выборки аккаунта за диапазон дат
+        # с сортировкой по дате, отдельный индекс для этих полей не нужен
         unique_together = ('avito_account', 'date')
+        indexes = [
+            # Выборки и удаление по дате без аккаунта (clean_old_statistics, отчеты по всем аккаунтам)
+            models.Index(fields=['date'], name='dailystats_date_idx'),
+        ]
         # Сортировка по убыванию даты
         ordering = ['-date']
         
     def __str__(self):
         return f"Статистика {self.avito_account.name} за {self.date}"
+    
+    @staticmethod
+    def parse_expenses_details(value):
+        """Разбирает значение поля expenses_details (JSON) или возвращает None"""
+        if not value:
+            return None
+        try:
+            return json.loads(value)
+        except (TypeError, ValueError):
+            return None
+    
+    def get_expenses_details(self):
+        """Расходы за день из API в формате {"total": ..., "details": {...}} или None"""
+        return self.parse_expenses_details(self.expenses_details)
+    
+    def set_expenses_details(self, expenses):
+        """Сохраняет расходы за день из API (словарь с ключами total и details)"""
+        self.expenses_details = json.dumps(expenses, ensure_ascii=False) if expenses is not None else None
+    
+    def is_complete(self):
+        """
+        Запись считается окончательной, если она сохранена после окончания дня,
+        за который собрана статистика. Записи, созданные в течение дня, неполные.
+        """
+        if not self.updated_at:
+            return False
+        return timezone.localtime(self.updated_at).date() > self.date
+    
+    @classmethod
+    def from_report_data(cls, account, date, daily_stats, daily_expense=0):
+        """Создает (не сохраняя) запись по словарю формата get_daily_statistics"""
+        stats = cls(
+            avito_account=account,
+            date=date,
+            total_calls=daily_stats['calls']['total'],
+            answered_calls=daily_stats['calls']['answered'],
+            missed_calls=daily_stats['calls']['missed'],
+            total_chats=daily_stats['chats']['total'],
+            new_chats=daily_stats['chats']['new'],
+            phones_received=daily_stats['phones_received'],
+            rating=daily_stats['rating'],
+            total_reviews=daily_stats['reviews']['total'],
+            daily_reviews=daily_stats['reviews']['today'],
+            total_items=daily_stats['items']['total'],
+            xl_promotion_count=daily_stats['items']['with_xl_promotion'],
+            views=daily_stats['statistics']['views'],
+            contacts=daily_stats['statistics']['contacts'],
+            favorites=daily_stats['statistics']['favorites'],
+            balance_real=daily_stats['balance_real'],
+            balance_bonus=daily_stats['balance_bonus'],
+            advance=daily_stats['advance'],
+            daily_expense=daily_expense
+        )
+        stats.set_expenses_details(daily_stats['expenses'])
+        return stats
+    
+    def to_report_data(self):
+        """Преобразует запись в словарь того же формата, что возвращает get_daily_statistics"""
+        return {
+            "date": self.date.strftime("%Y-%m-%d"),
+            "calls": {
+                "total": self.total_calls,
+                "missed": self.missed_calls,
+                "answered": self.answered_calls
+            },
+            "balance_real": self.balance_real,
+            "balance_bonus": self.balance_bonus,
+            "advance": self.advance,
+            "expenses": self.get_expenses_details() or {"total": 0, "details": {}},
+            "chats": {
+                "total": self.total_chats,
+                "new": self.new_chats
+            },
+            "phones_received": self.phones_received,
+            "rating": self.rating,
+            "reviews": {
+                "total": self.total_reviews,
+                "today": self.daily_reviews
+            },
+            "items": {
+                "total": self.total_items,
+                "with_xl_promotion": self.xl_promotion_count
+            },
+            "statistics": {
+                "views": self.views,
+                "contacts": self.contacts,
+                "favorites": self.favorites
+            }
+        }
+
+
+class AvitoAccountMonthlyStats(models.Model):
+    """
+    Помесячные итоги статистики аккаунта Авито. Заполняются из ежедневной статистики
+    перед ее удалением (clean_old_statistics); поля называются так же, как в
+    AvitoAccountDailyStats, и содержат суммы (или средние) за дни месяца.
+    """
+    avito_account = models.ForeignKey(
+        AvitoAccount,
+        on_delete=models.CASCADE,
+        related_name='monthly_stats',
+        verbose_name='Аккаунт Авито'
+    )
+    month = models.DateField(
+        verbose_name='Месяц (первое число)'
+    )
+    days = models.IntegerField(
+        verbose_name='Дней со статистикой',
+        default=0
+    )
+    
+    # Суммы за дни месяца
+    total_calls = models.IntegerField(verbose_name='Всего звонков', default=0)
+    answered_calls = models.IntegerField(verbose_name='Отвеченные звонки', default=0)
+    missed_calls = models.IntegerField(verbose_name='Пропущенные звонки', default=0)
+    total_chats = models.IntegerField(verbose_name='Всего чатов', default=0)
+    new_chats = models.IntegerField(verbose_name='Новые чаты', default=0)
+    phones_received = models.IntegerField(verbose_name='Показы телефона', default=0)
+    views = models.IntegerField(verbose_name='Просмотры', default=0)
+    contacts = models.IntegerField(verbose_name='Контакты', default=0)
+    favorites = models.IntegerField(verbose_name='В избранном', default=0)
+    daily_reviews = models.IntegerField(verbose_name='Отзывы', default=0)
+    daily_expense = models.FloatField(verbose_name='Расход', default=0)
+    
+    # Средние за дни месяца
+    total_items = models.FloatField(verbose_name='Объявлений (в среднем)', default=0)
+    xl_promotion_count = models.FloatField(verbose_name='С XL продвижением (в среднем)', default=0)
+    rating = models.FloatField(verbose_name='Рейтинг (в среднем)', default=0)
+    
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+    
+    class Meta:
+        verbose_name = 'Помесячная статистика аккаунта'
+        verbose_name_plural = 'Помесячная статистика аккаунтов'
+        unique_together = ('avito_account', 'month')
+        ordering = ['-month']
+    
+    def __str__(self):
+        return f"Статистика {self.avito_account.name} за {self.month:%m.%Y}"
+
+
+class ExpenseResetHistory(models.Model):
+    """Значения расходов аккаунтов перед сбросом (дневным или недельным)"""
+    PERIOD_CHOICES = [
+        ('daily', 'Дневной'),
+        ('weekly', 'Недельный'),
+    ]
+    
+    avito_account = models.ForeignKey(
+        AvitoAccount,
+        on_delete=models.CASCADE,
+        related_name='expense_resets',
+        verbose_name='Аккаунт Авито'
+    )
+    period = models.CharField(
+        max_length=10,
+        choices=PERIOD_CHOICES,
+        verbose_name='Период'
+    )
+    amount = models.FloatField(
+        verbose_name='Расход перед сбросом'
+    )
+    reset_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Время сброса'
+    )
+    
+    class Meta:
+        verbose_name = 'Сброс расходов'
+        verbose_name_plural = 'История сброса расходов'
+        ordering = ['-reset_at']
+    
+    def __str__(self):
+        return f"{self.avito_account.name}: {self.get_period_display()} расход {self.amount} р."
+
+
+class TelegramUpdateJob(models.Model):
+    """
+    Обновление Telegram в очереди на обработку. Вебхук сохраняет обновление
+    и сразу отвечает Telegram, обработчики (команда runworker) забирают
+    обновления из очереди и удаляют успешно обработанные.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('processing', 'Обрабатывается'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    update_id = models.BigIntegerField(
+        verbose_name='ID обновления Telegram',
+        db_index=True
+    )
+    payload = models.TextField(
+        verbose_name='Обновление JSON'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name='Статус'
+    )
+    attempts = models.IntegerField(
+        default=0,
+        verbose_name='Попыток обработки'
+    )
+    error = models.TextField(
+        verbose_name='Ошибка',
+        blank=True,
+        null=True
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата получения'
+    )
+    started_at = models.DateTimeField(
+        verbose_name='Начало обработки',
+        blank=True,
+        null=True
+    )
+    
+    class Meta:
+        verbose_name = 'Обновление Telegram в очереди'
+        verbose_name_plural = 'Очередь обновлений Telegram'
+        indexes = [
+            # Выборка следующих обновлений обработчиком (status = 'pending' ORDER BY id)
+            models.Index(fields=['status', 'id'], name='updatejob_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Обновление {self.update_id} ({self.get_status_display()})"
 
 
 class Settings(models.Model):
@@ -0,0 +1,95 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Общий для процесса пул заранее запрашиваемых страниц: обходы выполняются внутри
+# других пулов (сбор статистики, рассылка отчетов), и собственный пул на каждый
+# обход превышал бы размер пула соединений AVITO_API_POOL_MAXSIZE
+_prefetch_executor = None
+_prefetch_executor_lock = threading.Lock()
+
+
+def get_prefetch_executor():
+    global _prefetch_executor
+    with _prefetch_executor_lock:
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(
+                max_workers=settings.AVITO_PAGE_PREFETCH_WORKERS, thread_name_prefix="page-prefetch"
+            )
+        return _prefetch_executor
+
+
+def paginate(fetch_page, page_size, prefetch=None, max_pages=None):
+    """
+    Лениво обходит постраничный (offset/limit) ответ API.
+
+    Страницы запрашиваются по мере потребления, поэтому в памяти одновременно
+    находятся только текущая страница и заранее запрошенные (prefetch).
+    Обход завершается на первой неполной или пустой странице, после max_pages
+    страниц или когда вызывающий код перестает читать генератор. Код, который
+    прерывает обход досрочно, закрывает генератор (contextlib.closing), чтобы
+    сразу отменить заранее запрошенные страницы.
+
+    Args:
+        fetch_page: Функция (offset, limit) -> список элементов страницы
+        page_size: Размер страницы
+        prefetch: Сколько следующих страниц запрашивать заранее параллельно
+                  в общем пуле процесса (по умолчанию AVITO_PAGE_PREFETCH,
+                  0 - строго последовательно)
+        max_pages: Предел числа страниц (по умолчанию AVITO_MAX_PAGES)
+
+    Yields:
+        list: Элементы очередной страницы
+    """
+    prefetch = settings.AVITO_PAGE_PREFETCH if prefetch is None else prefetch
+    max_pages = settings.AVITO_MAX_PAGES if max_pages is None else max_pages
+
+    if prefetch <= 0:
+        for page in range(max_pages):
+            items = fetch_page(page * page_size, page_size)
+            if items:
+                yield items
+            if len(items) < page_size:
+                return
+        logger.warning(f"Достигнут предел в {max_pages} страниц, остальные страницы не запрошены")
+        return
+
+    executor = get_prefetch_executor()
+    pending = deque()
+    next_page = 0
+    try:
+        while True:
+            # Держим в работе текущую страницу и prefetch следующих
+            while len(pending) < prefetch + 1 and next_page < max_pages:
+                offset = next_page * page_size
+                pending.append((offset, executor.submit(fetch_page, offset, page_size)))
+                next_page += 1
+
+            if not pending:
+                logger.warning(f"Достигнут предел в {max_pages} страниц, остальные страницы не запрошены")
+                return
+
+            offset, future = pending.popleft()
+            # Страница еще ждет свободного потока общего пула - запрашиваем ее сами
+            items = fetch_page(offset, page_size) if future.cancel() else future.result()
+            if items:
+                yield items
+            if len(items) < page_size:
+                return
+    finally:
+        # Заранее запрошенные страницы после конца данных или выхода вызывающего
+        # кода из обхода не нужны: еще не начатые отменяются, а уже выполняющийся
+        # запрос отменить нельзя, его результат отбрасывается
+        for _, future in pending:
+            future.cancel()
+
+
+def iter_items(fetch_page, page_size, prefetch=None, max_pages=None):
+    """Лениво обходит элементы всех страниц по одному (см. paginate)"""
+    for items in paginate(fetch_page, page_size, prefetch=prefetch, max_pages=max_pages):
+        yield from items
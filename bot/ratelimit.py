@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+
+# На сколько (доля исходной частоты) ускоряется ограничитель после каждого успешного запроса
+RECOVERY_STEP = 0.05
+
+
+class TokenBucket:
+    """
+    Потокобезопасный ограничитель частоты запросов (token bucket).
+
+    Каждую секунду в корзину добавляется rate токенов, но не больше capacity.
+    Каждый запрос забирает один токен; если токенов нет, поток ждет.
+    rate <= 0 отключает ограничение.
+
+    Частота подстраивается под ответы API: после 429 она уменьшается вдвое
+    (но не ниже min_factor от исходной), а запросы приостанавливаются на
+    время из Retry-After; после успешных запросов частота постепенно
+    возвращается к исходной.
+    """
+
+    def __init__(self, rate, capacity=None, min_factor=None):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = rate * (min_factor if min_factor is not None else settings.RATE_LIMIT_MIN_FACTOR)
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Забирает токены, при необходимости дожидаясь их появления.
+
+        Returns:
+            bool: True, если токены получены, False - если не дождались за timeout секунд
+        """
+        started_at = time.monotonic()
+        deadline = started_at + timeout if timeout is not None else None
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    if self.blocked_until > now:
+                        # API попросил подождать (Retry-After)
+                        wait = self.blocked_until - now
+                    elif self.rate <= 0:
+                        return True
+                    else:
+                        self._refill()
+                        if self.tokens >= tokens:
+                            self.tokens -= tokens
+                            return True
+                        wait = (tokens - self.tokens) / self.rate
+
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    return False
+                time.sleep(wait)
+        finally:
+            waited = time.monotonic() - started_at
+            if waited > 0.001:
+                with self.lock:
+                    self.waited += waited
+
+    def penalize(self, retry_after=None):
+        """Замедляет ограничитель после ответа 429 и приостанавливает запросы на retry_after секунд"""
+        with self.lock:
+            self._refill()
+            self.throttled += 1
+            self.tokens = 0
+            if self.rate > 0:
+                self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def reward(self):
+        """Постепенно возвращает частоту к исходной после успешного запроса"""
+        if self.rate >= self.base_rate:
+            return
+        with self.lock:
+            self._refill()
+            self.rate = min(self.base_rate, self.rate + self.base_rate * RECOVERY_STEP)
+
+    def drain(self):
+        """Обнуляет запас токенов (API сообщил, что лимит исчерпан)"""
+        with self.lock:
+            self._refill()
+            self.tokens = 0
+
+    def snapshot(self):
+        """Текущее состояние ограничителя для метрик"""
+        with self.lock:
+            self._refill()
+            return {
+                "rate": round(self.rate, 3),
+                "base_rate": self.base_rate,
+                "tokens": round(self.tokens, 3),
+                "blocked_for": round(max(0, self.blocked_until - time.monotonic()), 3),
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited, 3),
+            }
+
+
+# Лимиты запросов к API Авито и Telegram общие для потоков одного процесса.
+# Процессы (воркеры веб-сервера, runworker, runscheduler) ограничиваются
+# независимо, поэтому при N процессах суммарная частота может достигать
+# N x AVITO_API_RATE_LIMIT - лимиты в настройках нужно делить на число процессов
+avito_bucket = TokenBucket(settings.AVITO_API_RATE_LIMIT)
+telegram_bucket = TokenBucket(settings.TELEGRAM_RATE_LIMIT)
+
+# Лимиты запросов к API Авито отдельно для каждого client_id
+_client_buckets = {}
+_client_buckets_guard = threading.Lock()
+
+
+def get_client_bucket(client_id):
+    """Возвращает ограничитель частоты запросов для client_id, создавая его при первом обращении"""
+    with _client_buckets_guard:
+        if client_id not in _client_buckets:
+            _client_buckets[client_id] = TokenBucket(settings.AVITO_CLIENT_RATE_LIMIT)
+        return _client_buckets[client_id]
+
+
+def mask_client_id(client_id):
+    """Короткий хеш client_id для метрик: сам client_id не раскрывается"""
+    return hashlib.sha256(str(client_id).encode()).hexdigest()[:12]
+
+
+def get_rate_limit_metrics():
+    """Возвращает состояние ограничителей частоты запросов этого процесса (client_id - в виде хеша)"""
+    with _client_buckets_guard:
+        client_buckets = dict(_client_buckets)
+    return {
+        "avito": avito_bucket.snapshot(),
+        "avito_clients": {mask_client_id(client_id): bucket.snapshot() for client_id, bucket in client_buckets.items()},
+        "telegram": telegram_bucket.snapshot(),
+    }
@@ -0,0 +1,231 @@
+import datetime
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Ключ кэша с результатами последних запусков задач планировщика
+STATUS_CACHE_KEY = 'scheduler_status'
+
+# Допустимые значения полей cron: минута, час, день месяца, месяц, день недели
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def parse_cron_field(field, minimum, maximum):
+    """
+    Разбирает поле cron-выражения: *, число, диапазон a-b, шаг */n или a-b/n
+    и списки через запятую.
+
+    Returns:
+        set: Подходящие значения поля
+    """
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+        if part == '*':
+            start, end = minimum, maximum
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-', 1))
+        else:
+            start = int(part)
+            # "5/15" - с 5 и далее с шагом 15
+            end = maximum if step > 1 else start
+        if step < 1 or start < minimum or end > maximum or start > end:
+            raise ValueError(f"Недопустимое поле cron: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """
+    Расписание в формате cron: "минута час день месяц день_недели"
+    (день недели 0-7, 0 и 7 - воскресенье). Как и в cron, если заданы и день
+    месяца, и день недели, подходит совпадение с любым из них.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Cron-выражение должно состоять из 5 полей: {expression}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            parse_cron_field(field, *limits) for field, limits in zip(fields, CRON_FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def matches(self, moment):
+        if moment.minute not in self.minutes or moment.hour not in self.hours or moment.month not in self.months:
+            return False
+        day_matches = moment.day in self.days
+        # В cron воскресенье - 0, в Python понедельник - 0
+        weekday_matches = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_matches and weekday_matches
+        return day_matches or weekday_matches
+
+    def next_after(self, moment):
+        """Возвращает ближайшую минуту расписания строго после moment"""
+        candidate = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        # Расписание повторяется не реже раза в 4 года (29 февраля)
+        for _ in range(4 * 366 * 24 * 60):
+            if self.matches(candidate):
+                return candidate
+            candidate += datetime.timedelta(minutes=1)
+        raise ValueError(f"Расписание никогда не срабатывает: {self.expression}")
+
+
+def get_scheduler_status():
+    """Возвращает результаты последних запусков задач планировщика для метрик"""
+    try:
+        return cache.get(STATUS_CACHE_KEY) or {}
+    except Exception as e:
+        logger.error(f"Ошибка при чтении состояния планировщика: {e}")
+        return {}
+
+
+class ScheduledTask:
+    """Задача планировщика: функция, расписание и результаты запусков"""
+
+    def __init__(self, name, func, schedule, jitter=0):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.jitter = jitter
+        # Постоянный поток задачи: его соединение с БД переиспользуется между запусками
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"scheduler-{name}")
+        self.future = None
+        self.scheduled_for = None
+        self.next_run = None
+        self.status = {"schedule": schedule.expression, "runs": 0, "failed": 0, "skipped": 0}
+
+    def plan(self, now):
+        """Назначает следующий запуск: ближайшая минута расписания плюс случайная задержка"""
+        self.scheduled_for = self.schedule.next_after(now)
+        self.next_run = self.scheduled_for + datetime.timedelta(seconds=random.uniform(0, self.jitter))
+        self.status["next_run"] = self.next_run.isoformat()
+
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+    def run(self):
+        started_at = time.monotonic()
+        self.status["last_started"] = timezone.localtime().isoformat()
+        # Соединение с БД живет между запусками не дольше CONN_MAX_AGE
+        # и проверяется перед каждым запуском
+        close_old_connections()
+        try:
+            self.func()
+            self.status["last_status"] = "ok"
+            self.status.pop("last_error", None)
+        except Exception as e:
+            logger.exception(f"Ошибка в задаче {self.name}: {e}")
+            self.status["last_status"] = "failed"
+            self.status["last_error"] = str(e)
+            self.status["failed"] += 1
+        finally:
+            duration = time.monotonic() - started_at
+            self.status["runs"] += 1
+            self.status["last_duration"] = round(duration, 3)
+            logger.info(f"Задача {self.name} выполнена за {duration:.1f} с ({self.status['last_status']})")
+            close_old_connections()
+
+    def start(self):
+        self.future = self.executor.submit(self.run)
+
+    def snapshot(self):
+        return dict(self.status)
+
+
+def get_default_tasks():
+    """Задачи bot.cron с расписаниями из SCHEDULER_TASKS"""
+    from bot import cron
+
+    return [
+        ScheduledTask(name, getattr(cron, name), CronSchedule(expression), settings.SCHEDULER_JITTER)
+        for name, expression in settings.SCHEDULER_TASKS.items()
+        if expression
+    ]
+
+
+def save_status(tasks):
+    try:
+        cache.set(STATUS_CACHE_KEY, {task.name: task.snapshot() for task in tasks}, None)
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении состояния планировщика: {e}")
+
+
+def run_scheduler(tasks=None, should_stop=None, tick=None):
+    """
+    Запускает задачи по расписанию, пока should_stop() не вернет True.
+
+    Каждая задача выполняется в своем постоянном потоке процесса, поэтому
+    соединения с API (requests.Session) и БД, токены и кэш в памяти
+    переиспользуются между запусками, а долгая задача не задерживает
+    остальные. Если предыдущий запуск задачи еще не завершился, очередной
+    пропускается. Результаты последних запусков (длительность, статус,
+    число пропусков) сохраняются в кэш, см. get_scheduler_status.
+
+    Args:
+        tasks: Список ScheduledTask (по умолчанию задачи из SCHEDULER_TASKS)
+        should_stop: Функция без аргументов, True - завершить работу
+        tick: Максимальная пауза между проверками расписания в секундах
+
+    Returns:
+        dict: Число запусков и пропусков по задачам
+    """
+    tasks = get_default_tasks() if tasks is None else tasks
+    should_stop = should_stop or (lambda: False)
+    tick = settings.SCHEDULER_TICK if tick is None else tick
+    if not tasks:
+        logger.warning("Нет задач для планировщика")
+        return {}
+
+    now = timezone.localtime()
+    for task in tasks:
+        task.plan(now)
+        logger.info(f"Задача {task.name} ({task.schedule.expression}): следующий запуск {task.next_run}")
+    save_status(tasks)
+    saved = [task.snapshot() for task in tasks]
+
+    while not should_stop():
+        now = timezone.localtime()
+        for task in tasks:
+            if now < task.next_run:
+                continue
+            if task.running:
+                task.status["skipped"] += 1
+                logger.warning(f"Задача {task.name} еще выполняется, запуск {task.scheduled_for} пропущен")
+            else:
+                task.start()
+            # После долгого простоя (сон машины) пропущенные запуски не наверстываются
+            task.plan(now)
+        # Состояние сохраняется только при изменении (запуск, пропуск, завершение)
+        current = [task.snapshot() for task in tasks]
+        if current != saved:
+            save_status(tasks)
+            saved = current
+
+        wait = min((task.next_run - timezone.localtime()).total_seconds() for task in tasks)
+        time.sleep(min(tick, max(wait, 0)))
+
+    for task in tasks:
+        if task.running:
+            logger.info(f"Ожидание завершения задачи {task.name}...")
+        task.executor.submit(connection.close)
+        task.executor.shutdown(wait=True)
+    save_status(tasks)
+    connection.close()
+    return {task.name: {"runs": task.status["runs"], "skipped": task.status["skipped"]} for task in tasks}
@@ -1,193 +1,369 @@
 import logging
 import datetime
+import warnings
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
 from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
+from bot.cache import cache_get_many, cache_set_many
 from bot.models import AvitoAccount, AvitoAccountDailyStats
 from bot import bot
 
 logger = logging.getLogger(__name__)
 
+# Показатели, изменение которых отслеживается:
+# поле статистики: (тип аномалии, порог изменения в процентах,
+# минимальное значение за позавчера для учета, название в сообщении)
+ANOMALY_METRICS = {
+    'total_calls': ('calls', 50, 5, 'звонков'),
+    'views': ('views', 40, 50, 'просмотров'),
+    'contacts': ('contacts', 40, 10, 'контактов'),
+}
+
+# Увеличение расходов на 100% (в 2 раза) при расходе за позавчера от 100 ₽
+THRESHOLD_EXPENSE = 100
+MIN_EXPENSE = 100
+
+# Изменение конверсии (контакты / просмотры) на 40% при числе просмотров от 50
+THRESHOLD_CONVERSION = 40
+MIN_CONVERSION_VIEWS = 50
+
+ANOMALY_STATS_FIELDS = ['total_calls', 'views', 'contacts', 'daily_expense']
+
+# Показатели, сравниваемые со скользящей нормой:
+# показатель: (тип аномалии, минимальное отклонение от нормы в процентах,
+# минимальная норма для учета, название в сообщении, формат значения, учитывать только рост)
+BASELINE_METRICS = {
+    'total_calls': ('calls', 50, 5, 'звонков', '{:.0f}', False),
+    'views': ('views', 40, 50, 'просмотров', '{:.0f}', False),
+    'contacts': ('contacts', 40, 10, 'контактов', '{:.0f}', False),
+    'daily_expense': ('expense', THRESHOLD_EXPENSE, MIN_EXPENSE, 'расходов', '{:.2f} ₽', True),
+    'conversion': ('conversion', THRESHOLD_CONVERSION, 0, 'конверсии', '{:.2f}%', False),
+}
+
+# Сколько дней истории нужно для сравнения с нормой (иначе - сравнение с позавчера)
+# и сколько значений за тот же день недели, чтобы норма считалась по дню недели
+BASELINE_MIN_DAYS = 7
+BASELINE_MIN_WEEKDAY_SAMPLES = 3
+
+# Коэффициент перевода MAD в стандартное отклонение для нормального распределения
+MAD_SCALE = 1.4826
+
+
+def load_baseline_windows(accounts, date):
+    """
+    Возвращает статистику аккаунтов за ANOMALY_BASELINE_DAYS дней до date и за саму date.
+
+    Окна статистики хранятся в кэше и дополняются инкрементально: из БД читаются
+    дни после последней проверки (при ежедневном запуске - одна дата) и дни окна,
+    записанные или пересчитанные после сохранения окна в кэш (updated_at), а для
+    аккаунтов без окна в кэше - вся история окна. Все аккаунты - одним запросом.
+
+    Args:
+        accounts: Список аккаунтов AvitoAccount
+        date: Проверяемая дата
+
+    Returns:
+        dict: {ID аккаунта: {дата в формате ISO: [значения ANOMALY_STATS_FIELDS]}}
+    """
+    window_start = date - datetime.timedelta(days=settings.ANOMALY_BASELINE_DAYS)
+    account_ids = [account.pk for account in accounts]
+    cached = {
+        pk: state
+        for pk, state in cache_get_many("anomaly_baseline", {pk: (pk,) for pk in account_ids}).items()
+        # Окна без времени загрузки (старый формат) перечитываются целиком
+        if "loaded_at" in state
+    }
+    # Время фиксируется до запроса, чтобы не потерять строки, записанные во время чтения
+    loaded_at = timezone.now()
+
+    # Дочитываем дни после последней проверки; проверяемую дату читаем всегда
+    since = date
+    changed_since = None
+    for pk in account_ids:
+        state = cached.get(pk)
+        if state:
+            last_date = datetime.date.fromisoformat(state["date"])
+            state_loaded_at = datetime.datetime.fromisoformat(state["loaded_at"])
+            changed_since = min(changed_since or state_loaded_at, state_loaded_at)
+        else:
+            last_date = window_start - datetime.timedelta(days=1)
+        since = min(since, max(window_start, last_date + datetime.timedelta(days=1)))
+
+    # Более ранние дни окна перечитываем, если строки обновились после загрузки окна
+    # (дозапись с опозданием, восстановление пропущенных дней)
+    days_filter = Q(date__gte=since)
+    if changed_since is not None:
+        days_filter |= Q(updated_at__gt=changed_since)
+
+    windows = {pk: dict(cached[pk]["days"]) if pk in cached else {} for pk in account_ids}
+    rows = AvitoAccountDailyStats.objects.filter(
+        days_filter,
+        avito_account__in=account_ids,
+        date__gte=window_start,
+        date__lte=date
+    ).values_list('avito_account_id', 'date', *ANOMALY_STATS_FIELDS)
+    for account_id, stats_date, *values in rows:
+        windows[account_id][stats_date.isoformat()] = values
+
+    # Отбрасываем дни за пределами окна и сохраняем окна для следующей проверки
+    window_dates = {
+        (window_start + datetime.timedelta(days=offset)).isoformat()
+        for offset in range(settings.ANOMALY_BASELINE_DAYS + 1)
+    }
+    for pk, days in windows.items():
+        windows[pk] = {day: values for day, values in days.items() if day in window_dates}
+    cache_set_many("anomaly_baseline", {
+        (pk,): {"date": date.isoformat(), "loaded_at": loaded_at.isoformat(), "days": days}
+        for pk, days in windows.items()
+    })
+
+    logger.info(f"Окна статистики для проверки аномалий: {len(cached)} из кэша, данные из БД с {since}")
+    return windows
+
+
 def check_anomalies():
     """
-    Проверяет аномалии в статистике аккаунтов и отправляет уведомления
+    Проверяет аномалии в статистике аккаунтов и отправляет уведомления.
+
+    Вчерашняя статистика всех аккаунтов сравнивается со скользящей нормой
+    (см. detect_anomalies), после чего отправляются уведомления.
     """
     try:
         logger.info("Запуск проверки аномалий в статистике аккаунтов")
         
         # Получаем текущую дату
-        today = timezone.now().date()
+        today = timezone.localdate()
         yesterday = today - datetime.timedelta(days=1)
         
         # Получаем все активные аккаунты
-        accounts = AvitoAccount.objects.filter(
+        accounts = list(AvitoAccount.objects.filter(
             client_id__isnull=False, 
             client_secret__isnull=False
-        ).exclude(client_id="none")
+        ).exclude(client_id="none"))
+        accounts_by_id = {account.pk: account for account in accounts}
+        
+        logger.info(f"Проверка аномалий для {len(accounts)} аккаунтов")
         
-        logger.info(f"Проверка аномалий для {accounts.count()} аккаунтов")
+        windows = load_baseline_windows(accounts, yesterday)
+        anomalies_by_account = detect_anomalies(windows, yesterday)
+        logger.info(f"Аномалии обнаружены у {len(anomalies_by_account)} аккаунтов")
         
-        for account in accounts:
-            try:
-                # Получаем статистику за вчера и позавчера
-                yesterday_stats = AvitoAccountDailyStats.objects.filter(
-                    avito_account=account,
-                    date=yesterday
-                ).first()
-                
-                day_before_yesterday = yesterday - datetime.timedelta(days=1)
-                day_before_stats = AvitoAccountDailyStats.objects.filter(
-                    avito_account=account,
-                    date=day_before_yesterday
-                ).first()
-                
-                if not yesterday_stats or not day_before_stats:
-                    logger.info(f"Недостаточно данных для аккаунта {account.name}")
-                    continue
-                
-                # Проверяем аномалии
-                anomalies = detect_anomalies(account, yesterday_stats, day_before_stats)
-                
-                if anomalies:
-                    # Отправляем уведомление, если есть аномалии
-                    send_anomaly_notification(account, anomalies, yesterday)
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при проверке аномалий для аккаунта {account.name}: {e}")
+        for account_id, anomalies in anomalies_by_account.items():
+            # Отправляем уведомление, если есть аномалии
+            send_anomaly_notification(accounts_by_id[account_id], anomalies, yesterday)
         
         logger.info("Проверка аномалий завершена")
         
     except Exception as e:
         logger.error(f"Ошибка при проверке аномалий: {e}")
 
-def detect_anomalies(account, yesterday_stats, day_before_stats):
+def detect_anomalies(windows, date):
+    """
+    Выявляет аномалии сразу для всех аккаунтов, сравнивая статистику за date со скользящей нормой.
+
+    Норма показателя - медиана за тот же день недели в окне (если таких дней
+    не меньше BASELINE_MIN_WEEKDAY_SAMPLES), иначе медиана за все окно; разброс -
+    медианное абсолютное отклонение (MAD) относительных отклонений дней окна от
+    нормы их дня недели, поэтому обычный спад в выходные не считается аномалией.
+    Значение считается аномальным, если отклоняется от нормы не меньше чем на
+    ANOMALY_SENSITIVITY[показатель] разбросов и не меньше чем на порог в процентах
+    из BASELINE_METRICS.
+    Для аккаунтов с историей короче BASELINE_MIN_DAYS дней статистика
+    сравнивается с позавчерашней (detect_day_over_day_anomalies).
+
+    Args:
+        windows: Окна статистики аккаунтов (см. load_baseline_windows)
+        date: Проверяемая дата
+
+    Returns:
+        dict: {ID аккаунта: список обнаруженных аномалий}, только аккаунты с аномалиями
+    """
+    window = settings.ANOMALY_BASELINE_DAYS
+    account_ids = list(windows)
+    dates = [(date - datetime.timedelta(days=window - offset)).isoformat() for offset in range(window + 1)]
+
+    # Массив аккаунт x день x показатель, последний день - проверяемый
+    values = np.full((len(account_ids), window + 1, len(ANOMALY_STATS_FIELDS)), np.nan)
+    for row, account_id in enumerate(account_ids):
+        days = windows[account_id]
+        for column, day in enumerate(dates):
+            if day in days:
+                values[row, column] = days[day]
+
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        # Медиана пустых срезов (нет данных) - NaN, предупреждения не нужны
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        views = values[:, :, ANOMALY_STATS_FIELDS.index('views')]
+        contacts = values[:, :, ANOMALY_STATS_FIELDS.index('contacts')]
+        conversion = np.where(views >= MIN_CONVERSION_VIEWS, contacts / views * 100, np.nan)
+        metrics = np.concatenate([values, conversion[:, :, np.newaxis]], axis=2)
+
+        history = metrics[:, :window]
+        current = metrics[:, window]
+        samples = np.count_nonzero(~np.isnan(history), axis=1)
+
+        # Норма для каждого дня недели: медиана за этот день недели в окне
+        # или медиана за все окно, если значений за день недели мало
+        median = np.nanmedian(history, axis=1)
+        weekdays = (window - np.arange(window)) % 7
+        weekday_norms = np.empty((len(account_ids), 7, metrics.shape[2]))
+        for weekday in range(7):
+            same_weekday = history[:, weekdays == weekday]
+            weekday_norms[:, weekday] = np.where(
+                np.count_nonzero(~np.isnan(same_weekday), axis=1) >= BASELINE_MIN_WEEKDAY_SAMPLES,
+                np.nanmedian(same_weekday, axis=1) if same_weekday.shape[1] else np.nan,
+                median
+            )
+        # weekdays == 0 - тот же день недели, что и проверяемая дата
+        expected = weekday_norms[:, 0]
+
+        # Разброс - MAD относительных отклонений от нормы своего дня недели
+        norms = weekday_norms[:, weekdays]
+        residuals = np.where(norms > 0, history / norms - 1, np.nan)
+        residual_median = np.nanmedian(residuals, axis=1)
+        spread = np.nanmedian(np.abs(residuals - residual_median[:, np.newaxis]), axis=1) * MAD_SCALE
+
+        deviation = current - expected
+        change = deviation / expected * 100
+        score = np.abs(change / 100) / spread
+
+    anomalies = defaultdict(list)
+    for index, (field, (name, threshold, minimum, title, value_format, increase_only)) in enumerate(BASELINE_METRICS.items()):
+        sensitivity = settings.ANOMALY_SENSITIVITY.get(field, 3)
+        mask = (
+            (samples[:, index] >= BASELINE_MIN_DAYS) & ~np.isnan(current[:, index]) &
+            (expected[:, index] > 0) & (expected[:, index] >= minimum) &
+            (score[:, index] >= sensitivity) & (np.abs(change[:, index]) >= threshold)
+        )
+        if increase_only:
+            mask &= deviation[:, index] > 0
+
+        for row in np.flatnonzero(mask):
+            current_value = float(current[row, index])
+            expected_value = float(expected[row, index])
+            percent_change = float(change[row, index])
+            if current_value == 0:
+                anomaly_type = f"{name}_drop"
+                message = f"Полное отсутствие {title} (норма {value_format.format(expected_value)})"
+            else:
+                anomaly_type = f"{name}_change"
+                direction = "увеличение" if percent_change > 0 else "снижение"
+                message = (
+                    f"Резкое {direction} {title} на {abs(percent_change):.1f}% "
+                    f"({value_format.format(current_value)} при норме {value_format.format(expected_value)})"
+                )
+            anomalies[account_ids[row]].append({
+                "type": anomaly_type,
+                "expected": expected_value,
+                "current": current_value,
+                "change_percent": percent_change,
+                "score": float(score[row, index]),
+                "message": message
+            })
+
+    # Аккаунты с короткой историей сравниваем с позавчерашним днем
+    short = [
+        row for row in range(len(account_ids))
+        if samples[row, 0] < BASELINE_MIN_DAYS
+        and not np.isnan(values[row, window]).any() and not np.isnan(values[row, window - 1]).any()
+    ]
+    if short:
+        index = [account_ids[row] for row in short]
+        previous = pd.DataFrame(values[short, window - 1], index=index, columns=ANOMALY_STATS_FIELDS)
+        current_stats = pd.DataFrame(values[short, window], index=index, columns=ANOMALY_STATS_FIELDS)
+        for account_id, account_anomalies in detect_day_over_day_anomalies(previous, current_stats).items():
+            anomalies[account_id].extend(account_anomalies)
+
+    return dict(anomalies)
+
+
+def detect_day_over_day_anomalies(previous, current):
     """
-    Выявляет аномалии путем сравнения вчерашней статистики с позавчерашней
+    Выявляет аномалии сразу для всех аккаунтов путем сравнения вчерашней статистики с позавчерашней.
+    Используется для аккаунтов, у которых еще недостаточно истории для скользящей нормы.
     
     Args:
-        account: Экземпляр модели AvitoAccount
-        yesterday_stats: Статистика за вчера
-        day_before_stats: Статистика за позавчера
+        previous: DataFrame статистики за позавчера, индекс - ID аккаунта
+        current: DataFrame статистики за вчера с тем же индексом
         
     Returns:
-        list: Список обнаруженных аномалий
+        dict: {ID аккаунта: список обнаруженных аномалий}, только аккаунты с аномалиями
     """
-    anomalies = []
-    
-    # Пороговые значения для обнаружения аномалий (в процентах)
-    THRESHOLD_CALLS = 50  # Изменение звонков на 50%
-    THRESHOLD_VIEWS = 40  # Изменение просмотров на 40%
-    THRESHOLD_CONTACTS = 40  # Изменение контактов на 40%
-    THRESHOLD_EXPENSE = 100  # Увеличение расходов на 100% (в 2 раза)
+    anomalies = defaultdict(list)
     
-    # Минимальные абсолютные значения для учета аномалий
-    MIN_CALLS = 5
-    MIN_VIEWS = 50
-    MIN_CONTACTS = 10
-    MIN_EXPENSE = 100
-    
-    # Расчет процентных изменений
-    # Звонки
-    if day_before_stats.total_calls >= MIN_CALLS:
-        if yesterday_stats.total_calls == 0 and day_before_stats.total_calls > 0:
-            # Полное исчезновение звонков
-            anomalies.append({
-                "type": "calls_drop",
-                "previous": day_before_stats.total_calls,
-                "current": 0,
-                "change_percent": -100,
-                "message": f"Полное отсутствие звонков (было {day_before_stats.total_calls})"
-            })
-        elif yesterday_stats.total_calls > 0 and day_before_stats.total_calls > 0:
-            percent_change = ((yesterday_stats.total_calls - day_before_stats.total_calls) / day_before_stats.total_calls) * 100
-            if abs(percent_change) >= THRESHOLD_CALLS:
-                direction = "увеличение" if percent_change > 0 else "снижение"
-                anomalies.append({
-                    "type": "calls_change",
-                    "previous": day_before_stats.total_calls,
-                    "current": yesterday_stats.total_calls,
-                    "change_percent": percent_change,
-                    "message": f"Резкое {direction} звонков на {abs(percent_change):.1f}% ({day_before_stats.total_calls} → {yesterday_stats.total_calls})"
-                })
-    
-    # Просмотры
-    if day_before_stats.views >= MIN_VIEWS:
-        if yesterday_stats.views == 0 and day_before_stats.views > 0:
-            # Полное исчезновение просмотров
-            anomalies.append({
-                "type": "views_drop",
-                "previous": day_before_stats.views,
+    # Звонки, просмотры, контакты: полное исчезновение или резкое изменение
+    for field, (name, threshold, minimum, title) in ANOMALY_METRICS.items():
+        prev = previous[field]
+        curr = current[field]
+        change = (curr - prev) / prev.where(prev > 0) * 100
+        checked = (prev >= minimum) & (prev > 0)
+        
+        dropped = checked & (curr == 0)
+        for account_id, prev_value in prev[dropped].items():
+            anomalies[account_id].append({
+                "type": f"{name}_drop",
+                "previous": int(prev_value),
                 "current": 0,
                 "change_percent": -100,
-                "message": f"Полное отсутствие просмотров (было {day_before_stats.views})"
+                "message": f"Полное отсутствие {title} (было {int(prev_value)})"
             })
-        elif yesterday_stats.views > 0 and day_before_stats.views > 0:
-            percent_change = ((yesterday_stats.views - day_before_stats.views) / day_before_stats.views) * 100
-            if abs(percent_change) >= THRESHOLD_VIEWS:
-                direction = "увеличение" if percent_change > 0 else "снижение"
-                anomalies.append({
-                    "type": "views_change",
-                    "previous": day_before_stats.views,
-                    "current": yesterday_stats.views,
-                    "change_percent": percent_change,
-                    "message": f"Резкое {direction} просмотров на {abs(percent_change):.1f}% ({day_before_stats.views} → {yesterday_stats.views})"
-                })
-    
-    # Контакты
-    if day_before_stats.contacts >= MIN_CONTACTS:
-        if yesterday_stats.contacts == 0 and day_before_stats.contacts > 0:
-            # Полное исчезновение контактов
-            anomalies.append({
-                "type": "contacts_drop",
-                "previous": day_before_stats.contacts,
-                "current": 0,
-                "change_percent": -100,
-                "message": f"Полное отсутствие контактов (было {day_before_stats.contacts})"
+        
+        changed = checked & (curr > 0) & (change.abs() >= threshold)
+        for account_id, prev_value, curr_value, percent_change in zip(
+            prev.index[changed], prev[changed], curr[changed], change[changed]
+        ):
+            direction = "увеличение" if percent_change > 0 else "снижение"
+            anomalies[account_id].append({
+                "type": f"{name}_change",
+                "previous": int(prev_value),
+                "current": int(curr_value),
+                "change_percent": float(percent_change),
+                "message": f"Резкое {direction} {title} на {abs(percent_change):.1f}% ({int(prev_value)} → {int(curr_value)})"
             })
-        elif yesterday_stats.contacts > 0 and day_before_stats.contacts > 0:
-            percent_change = ((yesterday_stats.contacts - day_before_stats.contacts) / day_before_stats.contacts) * 100
-            if abs(percent_change) >= THRESHOLD_CONTACTS:
-                direction = "увеличение" if percent_change > 0 else "снижение"
-                anomalies.append({
-                    "type": "contacts_change",
-                    "previous": day_before_stats.contacts,
-                    "current": yesterday_stats.contacts,
-                    "change_percent": percent_change,
-                    "message": f"Резкое {direction} контактов на {abs(percent_change):.1f}% ({day_before_stats.contacts} → {yesterday_stats.contacts})"
-                })
     
     # Расходы
-    if day_before_stats.daily_expense >= MIN_EXPENSE:
-        if yesterday_stats.daily_expense > day_before_stats.daily_expense:
-            percent_change = ((yesterday_stats.daily_expense - day_before_stats.daily_expense) / day_before_stats.daily_expense) * 100
-            if percent_change >= THRESHOLD_EXPENSE:
-                anomalies.append({
-                    "type": "expense_increase",
-                    "previous": day_before_stats.daily_expense,
-                    "current": yesterday_stats.daily_expense,
-                    "change_percent": percent_change,
-                    "message": f"Резкое увеличение расходов на {percent_change:.1f}% ({day_before_stats.daily_expense:.2f} ₽ → {yesterday_stats.daily_expense:.2f} ₽)"
-                })
+    prev = previous['daily_expense']
+    curr = current['daily_expense']
+    change = (curr - prev) / prev.where(prev > 0) * 100
+    increased = (prev >= MIN_EXPENSE) & (curr > prev) & (change >= THRESHOLD_EXPENSE)
+    for account_id, prev_value, curr_value, percent_change in zip(
+        prev.index[increased], prev[increased], curr[increased], change[increased]
+    ):
+        anomalies[account_id].append({
+            "type": "expense_increase",
+            "previous": float(prev_value),
+            "current": float(curr_value),
+            "change_percent": float(percent_change),
+            "message": f"Резкое увеличение расходов на {percent_change:.1f}% ({prev_value:.2f} ₽ → {curr_value:.2f} ₽)"
+        })
     
-    # Проверяем коэффициент конверсии (отношение контактов к просмотрам)
-    if (day_before_stats.views >= MIN_VIEWS and yesterday_stats.views >= MIN_VIEWS and
-        day_before_stats.contacts > 0 and yesterday_stats.contacts > 0):
-        
-        prev_conversion = (day_before_stats.contacts / day_before_stats.views) * 100
-        curr_conversion = (yesterday_stats.contacts / yesterday_stats.views) * 100
-        
-        if prev_conversion > 0:
-            percent_change = ((curr_conversion - prev_conversion) / prev_conversion) * 100
-            if abs(percent_change) >= THRESHOLD_CONTACTS:
-                direction = "увеличение" if percent_change > 0 else "снижение"
-                anomalies.append({
-                    "type": "conversion_change",
-                    "previous": prev_conversion,
-                    "current": curr_conversion,
-                    "change_percent": percent_change,
-                    "message": f"Резкое {direction} конверсии на {abs(percent_change):.1f}% ({prev_conversion:.2f}% → {curr_conversion:.2f}%)"
-                })
+    # Коэффициент конверсии (отношение контактов к просмотрам)
+    checked = (
+        (previous['views'] >= MIN_CONVERSION_VIEWS) & (current['views'] >= MIN_CONVERSION_VIEWS) &
+        (previous['contacts'] > 0) & (current['contacts'] > 0)
+    )
+    prev = previous['contacts'] / previous['views'].where(checked) * 100
+    curr = current['contacts'] / current['views'].where(checked) * 100
+    change = (curr - prev) / prev * 100
+    changed = checked & (change.abs() >= THRESHOLD_CONVERSION)
+    for account_id, prev_value, curr_value, percent_change in zip(
+        prev.index[changed], prev[changed], curr[changed], change[changed]
+    ):
+        direction = "увеличение" if percent_change > 0 else "снижение"
+        anomalies[account_id].append({
+            "type": "conversion_change",
+            "previous": float(prev_value),
+            "current": float(curr_value),
+            "change_percent": float(percent_change),
+            "message": f"Резкое {direction} конверсии на {abs(percent_change):.1f}% ({prev_value:.2f}% → {curr_value:.2f}%)"
+        })
     
-    return anomalies
+    return dict(anomalies)
 
 def send_anomaly_notification(account, anomalies, date):
     """
@@ -2,62 +2,97 @@ import requests
 import json
 import datetime
 import logging
+import threading
+from contextlib import closing
+from functools import partial
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from bot.avito_client import avito_client
+from bot.cache import cache_get, cache_get_many, cache_set, cache_set_many, get_ttl
+from bot.models import AvitoAccount
+from bot.pagination import iter_items
 
 logger = logging.getLogger(__name__)
 
+# Ошибки запросов к API в текущем потоке (см. record_api_error и run_concurrently)
+_api_errors = threading.local()
+
+
+def record_api_error():
+    """
+    Отмечает, что запрос к API завершился ошибкой и функция вернула значение
+    по умолчанию. Отметку видит run_concurrently, выполняющий функцию.
+    """
+    _api_errors.count = getattr(_api_errors, "count", 0) + 1
+
+
+def _run_tracked(func, args):
+    """Выполняет func(*args) и возвращает (результат, были ли ошибки запросов к API)"""
+    _api_errors.count = 0
+    result = func(*args)
+    return result, _api_errors.count > 0
+
+
 def get_access_token(client_id, client_secret):
-    auth_url = 'https://api.avito.ru/token'
-    auth_data = {
-        'grant_type': 'client_credentials',
-        'client_id': client_id,
-        'client_secret': client_secret
-    }
+    """Получение токена доступа (из общего кэша или новым запросом к API)"""
+    return avito_client.get_access_token(client_id, client_secret)
 
-    auth_response = requests.post(auth_url, data=auth_data)
-    auth_result = json.loads(auth_response.text)
+# Максимальные размеры страниц, которые принимают методы API
+CALLS_PAGE_SIZE = 100
+CHATS_PAGE_SIZE = 100
+REVIEWS_PAGE_SIZE = 50
+ITEMS_PAGE_SIZE = 100
 
-    # Извлечение API ключа из ответа
-    access_token = auth_result.get('access_token')
-    return access_token
+def iter_user_calls(access_token, date_from=None, date_to=None):
+    """
+    Лениво обходит все звонки за указанный период, запрашивая страницы по мере чтения.
+    
+    Ошибки запроса не перехватываются, их обрабатывает вызывающий код.
+    """
+    if date_from is None or date_to is None:
+        current_time = datetime.datetime.now()
+        date_from = (current_time - datetime.timedelta(days=30)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        date_to = current_time.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-def get_user_calls(access_token, date_from=None, date_to=None):
-    """Получение списка звонков за указанный период"""
-    try:
-        if date_from is None or date_to is None:
-            current_time = datetime.datetime.now()
-            date_from = (current_time - datetime.timedelta(days=30)).strftime("%Y-%m-%dT%H:%M:%SZ")
-            date_to = current_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+    calls_url = 'https://api.avito.ru/calltracking/v1/getCalls/'
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
 
-        calls_url = 'https://api.avito.ru/calltracking/v1/getCalls/'
+    def fetch_page(offset, limit):
         calls_data = {
             'dateTimeFrom': date_from,
             'dateTimeTo': date_to,
-            'limit': 100,
-            'offset': 0
-        }
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
+            'limit': limit,
+            'offset': offset
         }
-
-        logger.info(f"Запрос звонков с {date_from} по {date_to}")
-        
-        calls_response = requests.post(calls_url, headers=headers, json=calls_data)
+        calls_response = avito_client.post(calls_url, headers=headers, json=calls_data)
         calls_response.raise_for_status()
         
         # Проверяем, что ответ не пустой
         if not calls_response.text.strip():
             logger.warning("Получен пустой ответ от API звонков")
-            return {"calls": []}
+            return []
         
-        try:
-            calls_result = calls_response.json()
-            logger.info(f"Получено {len(calls_result.get('calls', []))} звонков")
-            return calls_result
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка декодирования JSON: {e}, содержимое ответа: {calls_response.text[:200]}")
-            return {"calls": []}
-            
+        return calls_response.json().get('calls', [])
+
+    logger.info(f"Запрос звонков с {date_from} по {date_to}")
+    return iter_items(fetch_page, CALLS_PAGE_SIZE)
+
+def get_user_calls(access_token, date_from=None, date_to=None):
+    """Получение списка звонков за указанный период"""
+    try:
+        calls = list(iter_user_calls(access_token, date_from, date_to))
+        logger.info(f"Получено {len(calls)} звонков")
+        return {"calls": calls}
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка декодирования JSON ответа API звонков: {e}")
+        return {"calls": []}
     except requests.exceptions.RequestException as e:
         logger.error(f"Ошибка запроса к API звонков: {e}")
         return {"calls": []}
@@ -65,28 +100,35 @@ def get_user_calls(access_token, date_from=None, date_to=None):
         logger.error(f"Непредвиденная ошибка при получении звонков: {e}")
         return {"calls": []}
 
+def count_user_calls(access_token, date_from=None, date_to=None):
+    """
+    Подсчитывает общее количество и количество пропущенных звонков за период,
+    не сохраняя список звонков в памяти.
+    
+    Returns:
+        dict: {"total": ..., "missed": ...}
+    """
+    try:
+        total_calls = 0
+        missed_calls = 0
+        for call in iter_user_calls(access_token, date_from, date_to):
+            total_calls += 1
+            if call.get('talkDuration', 0) == 0:
+                missed_calls += 1
+        logger.info(f"Звонков за период: {total_calls}, пропущенных: {missed_calls}")
+        return {"total": total_calls, "missed": missed_calls}
+    except Exception as e:
+        logger.error(f"Ошибка при подсчете звонков: {e}")
+        record_api_error()
+        return {"total": 0, "missed": 0}
 
 def get_total_calls(access_token, date_from=None, date_to=None):
     """Подсчет общего количества звонков за период"""
-    try:
-        calls_result = get_user_calls(access_token, date_from, date_to)
-        total_calls = len(calls_result.get('calls', []))
-        logger.info(f"Общее количество звонков: {total_calls}")
-        return total_calls
-    except Exception as e:
-        logger.error(f"Ошибка при подсчете общего количества звонков: {e}")
-        return 0
+    return count_user_calls(access_token, date_from, date_to)["total"]
 
 def get_missed_calls(access_token, date_from=None, date_to=None):
     """Подсчет пропущенных звонков за период"""
-    try:
-        calls_result = get_user_calls(access_token, date_from, date_to)
-        missed_calls = sum(1 for call in calls_result.get('calls', []) if call.get('talkDuration', 0) == 0)
-        logger.info(f"Количество пропущенных звонков: {missed_calls}")
-        return missed_calls
-    except Exception as e:
-        logger.error(f"Ошибка при подсчете пропущенных звонков: {e}")
-        return 0
+    return count_user_calls(access_token, date_from, date_to)["missed"]
 
 def get_user_balance_info(access_token, user_id=None):
     """
@@ -102,13 +144,14 @@ def get_user_balance_info(access_token, user_id=None):
             profile_headers = {
                 'Authorization': f'Bearer {access_token}'
             }
-            profile_response = requests.get(profile_url, headers=profile_headers)
+            profile_response = avito_client.get(profile_url, headers=profile_headers)
             profile_response.raise_for_status()
             profile_data = profile_response.json()
             user_id = profile_data.get('id')
             
             if not user_id:
                 logger.error("Не удалось получить идентификатор пользователя")
+                record_api_error()
                 return {"balance_real": 0, "balance_bonus": 0, "advance": 0}
         
         # Получаем реальный баланс кошелька (метод API v1)
@@ -117,7 +160,7 @@ def get_user_balance_info(access_token, user_id=None):
             'Authorization': f'Bearer {access_token}'
         }
         
-        balance_response = requests.get(balance_url, headers=balance_headers)
+        balance_response = avito_client.get(balance_url, headers=balance_headers)
         balance_response.raise_for_status()
         balance_data = balance_response.json()
         
@@ -130,7 +173,7 @@ def get_user_balance_info(access_token, user_id=None):
         }
         advance_data = {}
         
-        advance_response = requests.post(advance_url, headers=advance_headers, json=advance_data)
+        advance_response = avito_client.post(advance_url, headers=advance_headers, json=advance_data)
         advance_response.raise_for_status()
         advance_result = advance_response.json()
         
@@ -149,6 +192,7 @@ def get_user_balance_info(access_token, user_id=None):
         }
     except Exception as e:
         logger.error(f"Ошибка при получении информации о балансе: {e}")
+        record_api_error()
         return {"balance_real": 0, "balance_bonus": 0, "advance": 0}
 
 # Оставляем старую функцию для обратной совместимости, но теперь она возвращает авансы
@@ -184,7 +228,7 @@ def get_user_info(access_token):
         logger.info("Запрос информации о пользователе")
         
         # Выполняем запрос
-        response = requests.get(user_info_url, headers=headers)
+        response = avito_client.get(user_info_url, headers=headers)
         response.raise_for_status()
         
         # Проверяем, что ответ не пустой
@@ -205,28 +249,47 @@ def get_user_info(access_token):
         logger.error(f"Ошибка при получении информации о пользователе: {e}")
         return {}
 
-def get_user_chats(access_token, date_from=None, date_to=None, unread_only=False, chat_types=None, limit=100, offset=0):
-    """Получение списка чатов пользователя за определенный период"""
-    # Получаем user_id из профиля пользователя
+def iter_user_chats(access_token, user_id, params=None, offset=0):
+    """
+    Лениво обходит чаты пользователя от последних к более старым
+    (по времени последнего сообщения), запрашивая страницы по мере чтения.
+    
+    Ошибки запроса не перехватываются, их обрабатывает вызывающий код.
+    """
+    chats_url = f'https://api.avito.ru/messenger/v2/accounts/{user_id}/chats'
+    headers = {
+        'Authorization': f'Bearer {access_token}'
+    }
+    
+    def fetch_page(page_offset, page_limit):
+        page_params = dict(params or {}, limit=page_limit, offset=offset + page_offset)
+        chats_response = avito_client.get(chats_url, headers=headers, params=page_params)
+        chats_response.raise_for_status()
+        return chats_response.json().get('chats', [])
+    
+    logger.info(f"Запрос чатов пользователя {user_id} с параметрами: {params}")
+    return iter_items(fetch_page, CHATS_PAGE_SIZE)
+
+def get_user_chats(access_token, date_from=None, date_to=None, unread_only=False, chat_types=None, limit=None, offset=0, user_id=None):
+    """
+    Получение количества чатов пользователя за определенный период.
+    
+    Чаты обходятся постранично до конца списка (или до limit чатов, если он задан).
+    API возвращает чаты от последних к более старым по времени последнего
+    сообщения, поэтому обход прекращается на первом чате старше date_from.
+    Если user_id не передан, он запрашивается из профиля пользователя.
+    """
     try:
-        user_info = get_user_info(access_token)
-        user_id = user_info.get('id')
+        if not user_id:
+            user_id = get_user_info(access_token).get('id')
         
         if not user_id:
             logger.error("Не удалось получить идентификатор пользователя")
             return 0
             
-        # Формируем URL для получения чатов
-        chats_url = f'https://api.avito.ru/messenger/v2/accounts/{user_id}/chats'
-        
-        # Параметры запроса (API принимает максимум 100)
-        params = {
-            'limit': min(limit, 100),  # Ограничиваем до 100
-            'offset': offset
-        }
-        
-        # Не передаем даты в параметры URL - они не поддерживаются API
-        # Будем фильтровать чаты по датам в коде после получения
+        # Даты не передаются в параметры URL - они не поддерживаются API,
+        # чаты фильтруются по датам в коде после получения
+        params = {}
         
         # Добавляем необязательные параметры, если они указаны
         if unread_only:
@@ -238,89 +301,53 @@ def get_user_chats(access_token, date_from=None, date_to=None, unread_only=False
             else:
                 params['chat_types'] = 'u2i'  # По умолчанию только чаты по объявлениям
         
-        # Заголовки запроса
-        headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
-        
-        logger.info(f"Запрос чатов пользователя {user_id} с параметрами: {params}")
-        
-        # Выполняем запрос
-        chats_response = requests.get(chats_url, headers=headers, params=params)
-        chats_response.raise_for_status()
-        chats_result = chats_response.json()
-        
-        # Получаем все чаты из первой страницы
-        all_chats = chats_result.get('chats', [])
-        total_count = chats_result.get('count', 0)
-        
-        # Если нужно получить больше чатов и есть пагинация
-        if total_count > 100 and limit > 100:
-            # Определяем сколько еще страниц нужно запросить
-            max_pages = min(10, (limit // 100) + (1 if limit % 100 > 0 else 0))
-            
-            for page in range(1, max_pages):
-                page_offset = page * 100
-                
-                params['offset'] = page_offset
-                page_response = requests.get(chats_url, headers=headers, params=params)
-                
-                if page_response.status_code != 200:
-                    break
-                    
-                page_result = page_response.json()
-                page_chats = page_result.get('chats', [])
-                
-                if not page_chats:
-                    break
-                    
-                all_chats.extend(page_chats)
-                
-                # Если получили нужное количество или все чаты
-                if len(all_chats) >= limit or len(all_chats) >= total_count:
-                    break
+        from_date = datetime.datetime.fromisoformat(date_from.replace('Z', '+00:00')) if date_from else None
+        to_date = datetime.datetime.fromisoformat(date_to.replace('Z', '+00:00')) if date_to else None
         
-        # Фильтруем чаты по дате, если указаны даты
-        filtered_chats = all_chats
-        if date_from or date_to:
-            filtered_chats = []
-            from_date = None
-            to_date = None
-            
-            if date_from:
-                from_date = datetime.datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-            if date_to:
-                to_date = datetime.datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+        # Обходим чаты постранично, считая подходящие по дате
+        seen_chats = 0
+        total_chats = 0
+        with closing(iter_user_chats(access_token, user_id, params, offset)) as chats_iter:
+            for chat in chats_iter:
+                seen_chats += 1
             
-            for chat in all_chats:
                 last_message_time = chat.get('lastMessageTime')
-                if last_message_time:
+                if date_from or date_to:
+                    if not last_message_time:
+                        continue
                     message_time = datetime.datetime.fromisoformat(last_message_time.replace('Z', '+00:00'))
-                    
                     if from_date and message_time < from_date:
-                        continue
+                        # Дальше только более старые чаты
+                        break
                     if to_date and message_time > to_date:
                         continue
-                        
-                    filtered_chats.append(chat)
+            
+                total_chats += 1
+                if limit and seen_chats >= limit:
+                    break
         
-        # Возвращаем количество чатов
-        total_chats = len(filtered_chats)
-        logger.info(f"Получено {total_chats} чатов из {len(all_chats)} общих (всего в API: {total_count})")
+        logger.info(f"Получено {total_chats} чатов из {seen_chats} просмотренных")
         return total_chats
         
     except Exception as e:
         logger.error(f"Ошибка при получении списка чатов: {e}")
+        record_api_error()
         return 0
 
-def get_chats_by_time(access_token, date_from=None):
+def get_chats_by_time(access_token, date_from=None, user_id=None, date_to=None):
     """
     Получение новых чатов после указанной даты
     
+    Чаты отбираются по времени последнего сообщения, как и при заполнении
+    истории (_count_chats_by_day), поэтому за прошедший день считаются одни
+    и те же чаты.
+    
     Args:
         access_token: Токен доступа к API
         date_from: Время, с которого нужно начинать поиск чатов (RFC3339)
                   Если не передано, берется начало текущего дня/недели
+        user_id: ID пользователя Авито (если не передан, запрашивается из профиля)
+        date_to: Время, до которого учитываются чаты (RFC3339, по умолчанию - без ограничения)
     
     Returns:
         int: Количество новых чатов
@@ -331,20 +358,14 @@ def get_chats_by_time(access_token, date_from=None):
             current_time = datetime.datetime.now()
             date_from = current_time.replace(hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-        # Получаем информацию о пользователе для получения user_id
-        user_info = get_user_info(access_token)
-        user_id = user_info.get('id')
-        
-        if not user_id:
-            logger.error("Не удалось получить идентификатор пользователя")
-            return 0
-        
         # Получаем чаты пользователя через функцию get_user_chats
         # Передаем date_from как параметр для фильтрации
         total_chats = get_user_chats(
             access_token=access_token,
             date_from=date_from,
-            chat_types='u2i'
+            date_to=date_to,
+            chat_types='u2i',
+            user_id=user_id
         )
         
         logger.info(f"Найдено {total_chats} чатов после {date_from}")
@@ -352,6 +373,7 @@ def get_chats_by_time(access_token, date_from=None):
             
     except Exception as e:
         logger.error(f"Ошибка при получении новых чатов: {e}")
+        record_api_error()
         return 0
 
 def get_all_numbers(access_token, date_from=None, date_to=None):
@@ -379,7 +401,7 @@ def get_all_numbers(access_token, date_from=None, date_to=None):
 
         logger.info(f"Запрос статистики показов телефона с {date_from} по {date_to}")
         
-        phones_response = requests.post(phones_url, headers=phones_headers, json=phones_data)
+        phones_response = avito_client.post(phones_url, headers=phones_headers, json=phones_data)
         phones_response.raise_for_status()
         
         # Проверяем, что ответ не пустой
@@ -394,33 +416,38 @@ def get_all_numbers(access_token, date_from=None, date_to=None):
             return total_phone_results
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка декодирования JSON: {e}, содержимое ответа: {phones_response.text[:200]}")
+            record_api_error()
             return 0
             
     except requests.exceptions.RequestException as e:
         logger.error(f"Ошибка запроса к API показов телефона: {e}")
+        record_api_error()
         return 0
     except Exception as e:
         logger.error(f"Непредвиденная ошибка при получении показов телефона: {e}")
+        record_api_error()
         return 0
 
 
-def get_user_items_stats(access_token, user_id, status="active", per_page=25, page=1, date_from=None, date_to=None, period_grouping="day"):
-    """Получает базовую информацию о объявлениях пользователя и их идентификаторы."""
-    try:
-        items_url = 'https://api.avito.ru/core/v1/items'
-        items_headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
-        
+def iter_user_items(access_token, status="active"):
+    """
+    Лениво обходит объявления пользователя, запрашивая страницы по мере чтения.
+    
+    Ошибки запроса не перехватываются, их обрабатывает вызывающий код.
+    """
+    items_url = 'https://api.avito.ru/core/v1/items'
+    items_headers = {
+        'Authorization': f'Bearer {access_token}'
+    }
+
+    def fetch_page(offset, limit):
+        # API объявлений нумерует страницы с 1 вместо offset
         params = {
             'status': status,
-            'per_page': per_page,
-            'page': page
+            'per_page': limit,
+            'page': offset // limit + 1
         }
-        
-        logger.info(f"Запрос информации об объявлениях пользователя {user_id}")
-        
-        response = requests.get(items_url, headers=items_headers, params=params)
+        response = avito_client.get(items_url, headers=items_headers, params=params)
         response.raise_for_status()
         
         # Проверяем, что ответ не пустой
@@ -428,84 +455,118 @@ def get_user_items_stats(access_token, user_id, status="active", per_page=25, pa
             logger.warning("Получен пустой ответ от API объявлений")
             return []
         
-        try:
-            result = response.json()
-            
-            # Правильное извлечение идентификаторов объявлений из структуры ответа API
-            items = result.get('resources', [])
-            item_ids = [item['id'] for item in items if 'id' in item]
-            
-            logger.info(f"Получено {len(item_ids)} идентификаторов объявлений")
-            return item_ids
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка декодирования JSON: {e}, содержимое ответа: {response.text[:200]}")
-            return []
-            
+        return response.json().get('resources', [])
+
+    return iter_items(fetch_page, ITEMS_PAGE_SIZE)
+
+def get_user_items_stats(access_token, user_id, status="active", date_from=None, date_to=None, period_grouping="day"):
+    """Получает идентификаторы всех объявлений пользователя (постранично)."""
+    try:
+        logger.info(f"Запрос информации об объявлениях пользователя {user_id}")
+        
+        item_ids = [item['id'] for item in iter_user_items(access_token, status) if 'id' in item]
+        
+        logger.info(f"Получено {len(item_ids)} идентификаторов объявлений")
+        return item_ids
+        
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка декодирования JSON ответа API объявлений: {e}")
+        record_api_error()
+        return []
     except requests.exceptions.RequestException as e:
         logger.error(f"Ошибка запроса к API объявлений: {e}")
+        record_api_error()
         return []
     except Exception as e:
         logger.error(f"Непредвиденная ошибка при получении объявлений: {e}")
+        record_api_error()
         return []
 
+def _get_item_services(access_token, user_id, item_id):
+    """Возвращает коды услуг продвижения объявления или None при ошибке"""
+    item_info_url = f'https://api.avito.ru/core/v1/accounts/{user_id}/items/{item_id}/'
+    item_info_headers = {
+        'Authorization': f'Bearer {access_token}'
+    }
+    
+    item_response = avito_client.get(item_info_url, headers=item_info_headers)
+    item_response.raise_for_status()
+    
+    # Пустой ответ не кэшируем, объявление будет запрошено повторно
+    if not item_response.text.strip():
+        return None
+    
+    item_data = item_response.json()
+    return [service.get('code') for service in item_data.get('services', [])]
+
 def get_item_promotion_info(access_token, user_id, item_ids):
-    """Получает информацию о продвижении объявлений."""
+    """
+    Получает информацию о продвижении объявлений.
+    
+    Проверяются все объявления: коды услуг каждого объявления берутся из кэша
+    (AVITO_CACHE_TTLS['item_services']), остальные запрашиваются параллельно
+    в пуле из AVITO_ITEM_CONCURRENCY потоков. Объявления, которые не успели
+    загрузиться за AVITO_ITEM_FETCH_BUDGET секунд, не учитываются.
+    """
     try:
         if not item_ids:
             logger.info("Нет объявлений для анализа продвижения")
             return {"total_items": 0, "xl_promotion_count": 0}
-    
-        # Подсчет объявлений с XL продвижением
-        xl_promotion_count = 0
-        
-        # Ограничиваем количество проверяемых объявлений
-        check_ids = item_ids[:50]  # Проверяем не более 50 объявлений
         
-        # Получаем детальную информацию о каждом объявлении для проверки XL продвижения
-        for item_id in check_ids:
+        item_ids = list(dict.fromkeys(item_ids))
+        services_by_item = cache_get_many(
+            "item_services",
+            {item_id: (user_id, item_id) for item_id in item_ids}
+        )
+        missing_ids = [item_id for item_id in item_ids if item_id not in services_by_item]
+        
+        if missing_ids:
+            fetched = {}
+            executor = ThreadPoolExecutor(max_workers=min(settings.AVITO_ITEM_CONCURRENCY, len(missing_ids)))
+            futures = {
+                executor.submit(_get_item_services, access_token, user_id, item_id): item_id
+                for item_id in missing_ids
+            }
             try:
-                item_info_url = f'https://api.avito.ru/core/v1/accounts/{user_id}/items/{item_id}/'
-                item_info_headers = {
-                    'Authorization': f'Bearer {access_token}'
-                }
-                
-                item_response = requests.get(item_info_url, headers=item_info_headers)
-                item_response.raise_for_status()
-                
-                # Проверяем, что ответ не пустой
-                if not item_response.text.strip():
-                    continue
-                    
-                item_data = item_response.json()
-                
-                # Проверка наличия XL продвижения
-                services = item_data.get('services', [])
-                for service in services:
-                    if service.get('code') == 'xl':
-                        xl_promotion_count += 1
-                        break
-                        
-            except Exception as e:
-                logger.error(f"Ошибка при получении информации о продвижении объявления {item_id}: {e}")
-                continue
+                for future in as_completed(futures, timeout=settings.AVITO_ITEM_FETCH_BUDGET):
+                    item_id = futures[future]
+                    try:
+                        services = future.result()
+                    except Exception as e:
+                        logger.error(f"Ошибка при получении информации о продвижении объявления {item_id}: {e}")
+                        record_api_error()
+                        continue
+                    if services is not None:
+                        fetched[item_id] = services
+            except FuturesTimeoutError:
+                logger.warning(
+                    f"Не уложились в {settings.AVITO_ITEM_FETCH_BUDGET} с: получено {len(fetched)} "
+                    f"из {len(missing_ids)} объявлений"
+                )
+                record_api_error()
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+            
+            cache_set_many("item_services", {(user_id, item_id): services for item_id, services in fetched.items()})
+            services_by_item.update(fetched)
         
-        # Если проверили не все объявления, экстраполируем результаты
-        if len(check_ids) < len(item_ids):
-            ratio = len(item_ids) / len(check_ids)
-            xl_promotion_count = int(xl_promotion_count * ratio)
-            logger.info(f"Экстраполяция данных по продвижению: проверено {len(check_ids)} из {len(item_ids)} объявлений")
+        # Подсчет объявлений с XL продвижением
+        xl_promotion_count = sum(1 for services in services_by_item.values() if 'xl' in services)
         
         result = {
             "total_items": len(item_ids),
             "xl_promotion_count": xl_promotion_count
         }
         
-        logger.info(f"Информация о продвижениях: всего {len(item_ids)} объявлений, с XL продвижением: {xl_promotion_count}")
+        logger.info(
+            f"Информация о продвижениях: всего {len(item_ids)} объявлений "
+            f"(из кэша {len(item_ids) - len(missing_ids)}), с XL продвижением: {xl_promotion_count}"
+        )
         return result
         
     except Exception as e:
         logger.error(f"Ошибка при получении информации о продвижении объявлений: {e}")
+        record_api_error()
         return {
             "total_items": len(item_ids) if item_ids else 0,
             "xl_promotion_count": 0
@@ -549,7 +610,7 @@ def get_items_statistics(access_token, user_id, item_ids, date_from=None, date_t
         
         logger.info(f"Запрос статистики по {len(request_ids)} объявлениям с {date_from} по {date_to}")
         
-        stats_response = requests.post(stats_url, headers=stats_headers, json=stats_data)
+        stats_response = avito_client.post(stats_url, headers=stats_headers, json=stats_data)
         stats_response.raise_for_status()
         
         # Проверяем, что ответ не пустой
@@ -594,6 +655,7 @@ def get_items_statistics(access_token, user_id, item_ids, date_from=None, date_t
             
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка декодирования JSON: {e}, содержимое ответа: {stats_response.text[:200]}")
+            record_api_error()
             return {
                 "total_views": 0,
                 "total_contacts": 0,
@@ -602,6 +664,7 @@ def get_items_statistics(access_token, user_id, item_ids, date_from=None, date_t
             
     except Exception as e:
         logger.error(f"Ошибка при получении статистики объявлений: {e}")
+        record_api_error()
         return {
             "total_views": 0,
             "total_contacts": 0,
@@ -619,7 +682,7 @@ def get_user_rating_info(access_token):
 
         logger.info("Запрос информации о рейтинге пользователя")
         
-        response = requests.get(rating_info_url, headers=rating_info_headers)
+        response = avito_client.get(rating_info_url, headers=rating_info_headers)
         response.raise_for_status()
         
         # Проверяем, что ответ не пустой
@@ -634,554 +697,718 @@ def get_user_rating_info(access_token):
             return score
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка декодирования JSON: {e}, содержимое ответа: {response.text[:200]}")
+            record_api_error()
             return 0
             
     except requests.exceptions.RequestException as e:
         logger.error(f"Ошибка запроса к API рейтинга: {e}")
+        record_api_error()
         return 0
     except Exception as e:
         logger.error(f"Непредвиденная ошибка при получении рейтинга: {e}")
+        record_api_error()
         return 0
 
 
-def get_user_reviews(access_token, date_from=None, date_to=None, offset=0, limit=50):
-    """Получение отзывов пользователя за указанный период"""
-    try:
-        reviews_url = 'https://api.avito.ru/ratings/v1/reviews'
-        reviews_headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
+def iter_user_reviews(access_token, offset=0, meta=None):
+    """
+    Лениво обходит отзывы пользователя от новых к старым, запрашивая страницы по мере чтения.
+    
+    Args:
+        meta: Словарь, в который записывается общее количество отзывов (ключ "total")
+    
+    Ошибки запроса не перехватываются, их обрабатывает вызывающий код.
+    """
+    reviews_url = 'https://api.avito.ru/ratings/v1/reviews'
+    reviews_headers = {
+        'Authorization': f'Bearer {access_token}'
+    }
+    meta = meta if meta is not None else {}
+    meta.setdefault("total", 0)
 
+    def fetch_page(page_offset, page_limit):
         params = {
-            'offset': offset,
-            'limit': limit
+            'offset': offset + page_offset,
+            'limit': page_limit
         }
-
-        logger.info(f"Запрос отзывов пользователя с {date_from} по {date_to}")
-        
-        response = requests.get(reviews_url, headers=reviews_headers, params=params)
+        response = avito_client.get(reviews_url, headers=reviews_headers, params=params)
         response.raise_for_status()
         
         # Проверяем, что ответ не пустой
         if not response.text.strip():
             logger.warning("Получен пустой ответ от API отзывов")
-            return {"total_reviews": 0, "period_reviews": 0}
+            return []
         
-        try:
-            result = response.json()
-            total_reviews = result.get('total', 0)
-            reviews = result.get('reviews', [])
-
-            # Подсчет отзывов за указанный период
-            period_reviews = 0
-
-            # Определяем временной промежуток для фильтрации
-            if date_from is None:
-                today = datetime.datetime.now().date()
-                for review in reviews:
-                    created_at = review.get('createdAt', 0)
-                    if created_at:
-                        review_date = datetime.datetime.fromtimestamp(created_at).date()
-                        if review_date == today:
-                            period_reviews += 1
-            else:
-                # Преобразуем строковые даты в объекты datetime для сравнения
-                date_from_obj = datetime.datetime.fromisoformat(date_from.split('T')[0]).date()
-                date_to_obj = datetime.datetime.fromisoformat(date_to.split('T')[0]).date() if date_to else datetime.datetime.now().date()
-                
-                for review in reviews:
-                    created_at = review.get('createdAt', 0)
-                    if created_at:
-                        review_date = datetime.datetime.fromtimestamp(created_at).date()
-                        if date_from_obj <= review_date <= date_to_obj:
-                            period_reviews += 1
-
-            logger.info(f"Получено отзывов: всего {total_reviews}, за период: {period_reviews}")
-            return {
-                "total_reviews": total_reviews,
-                "period_reviews": period_reviews
-            }
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка декодирования JSON: {e}, содержимое ответа: {response.text[:200]}")
-            return {"total_reviews": 0, "period_reviews": 0}
+        result = response.json()
+        # Общее количество отзывов приходит в каждой странице ответа
+        meta["total"] = result.get('total', meta["total"])
+        return result.get('reviews', [])
+
+    return iter_items(fetch_page, REVIEWS_PAGE_SIZE)
+
+def get_user_reviews(access_token, date_from=None, date_to=None, offset=0, limit=None):
+    """
+    Получение отзывов пользователя за указанный период.
+    
+    Отзывы обходятся постранично от новых к старым, обход прекращается
+    на первом отзыве старше начала периода (или после limit отзывов).
+    """
+    try:
+        # Общее количество отзывов записывается при обходе страниц
+        total = {"total": 0}
+
+        logger.info(f"Запрос отзывов пользователя с {date_from} по {date_to}")
+        
+        # Определяем временной промежуток для фильтрации (по умолчанию - сегодня)
+        if date_from is None:
+            date_from_obj = date_to_obj = datetime.datetime.now().date()
+        else:
+            # Преобразуем строковые даты в объекты datetime для сравнения
+            date_from_obj = datetime.datetime.fromisoformat(date_from.split('T')[0]).date()
+            date_to_obj = datetime.datetime.fromisoformat(date_to.split('T')[0]).date() if date_to else datetime.datetime.now().date()
+
+        # Подсчет отзывов за указанный период
+        period_reviews = 0
+        seen_reviews = 0
+        with closing(iter_user_reviews(access_token, offset, total)) as reviews_iter:
+            for review in reviews_iter:
+                seen_reviews += 1
+                created_at = review.get('createdAt', 0)
+                if created_at:
+                    review_date = datetime.datetime.fromtimestamp(created_at).date()
+                    if review_date < date_from_obj:
+                        # Дальше только более старые отзывы
+                        break
+                    if review_date <= date_to_obj:
+                        period_reviews += 1
+                if limit and seen_reviews >= limit:
+                    break
+
+        logger.info(f"Получено отзывов: всего {total['total']}, за период: {period_reviews}")
+        return {
+            "total_reviews": total["total"],
+            "period_reviews": period_reviews
+        }
     
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка декодирования JSON ответа API отзывов: {e}")
+        record_api_error()
+        return {"total_reviews": 0, "period_reviews": 0}
     except requests.exceptions.RequestException as e:
         logger.error(f"Ошибка запроса к API отзывов: {e}")
+        record_api_error()
         return {"total_reviews": 0, "period_reviews": 0}
     except Exception as e:
         logger.error(f"Непредвиденная ошибка при получении отзывов: {e}")
+        record_api_error()
         return {"total_reviews": 0, "period_reviews": 0}
 
 
-
-
-
 def get_avito_user_id(client_id, client_secret):
-    token_url = 'https://api.avito.ru/token'
-    token_data = {
-        'grant_type': 'client_credentials',
-        'client_id': client_id,
-        'client_secret': client_secret
-    }
+    """
+    Возвращает Avito ID пользователя для client_id.
     
+    ID не меняется для client_id, поэтому после первого запроса к API он
+    сохраняется в AvitoAccount.avito_user_id и в кэше без срока действия.
+    """
     try:
-        # Получаем токен доступа
-        token_response = requests.post(token_url, data=token_data)
-        token_response.raise_for_status()
-        token_result = token_response.json()
-        access_token = token_result.get('access_token')
-        
-        if not access_token:
-            return None
+        user_id = cache_get("user_id", (client_id,))
+        if user_id is not None:
+            return user_id
+        
+        user_id = AvitoAccount.objects.filter(
+            client_id=client_id,
+            avito_user_id__isnull=False
+        ).values_list('avito_user_id', flat=True).first()
+        
+        if user_id is None:
+            # Получаем токен доступа (из кэша, без повторного запроса к /token)
+            access_token = get_access_token(client_id, client_secret)
             
-        # Получаем информацию о пользователе
-        user_info_url = 'https://api.avito.ru/core/v1/accounts/self'
-        user_info_headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
-        
-        user_response = requests.get(user_info_url, headers=user_info_headers)
-        user_response.raise_for_status()
-        user_data = user_response.json()
+            if not access_token:
+                return None
+            
+            user_id = get_user_info(access_token).get('id')
+            if not user_id:
+                return None
+            
+            AvitoAccount.objects.filter(client_id=client_id, avito_user_id__isnull=True).update(avito_user_id=user_id)
         
-        # Возвращаем Avito ID пользователя
-        return user_data.get('id')
+        cache_set("user_id", (client_id,), user_id)
+        return user_id
     except Exception as e:
-        print(f"Ошибка при получении Avito ID: {e}")
+        logger.error(f"Ошибка при получении Avito ID: {e}")
         return None
 
 
-
-def get_daily_statistics(client_id, client_secret):
-    try:
-        # Получаем текущую дату и вчерашнюю дату
-        current_time = datetime.datetime.now()
-        yesterday = current_time - datetime.timedelta(days=1)
-        yesterday_start = yesterday.replace(hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
-        yesterday_end = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999).strftime("%Y-%m-%dT%H:%M:%SZ")
-        
-        # Форматы дат для разных API
-        yesterday_date = yesterday.strftime("%Y-%m-%d")
-        
-        logger.info(f"Запрос дневной статистики за {yesterday_date}")
-        
-        # Получаем токен доступа
-        access_token = get_access_token(client_id, client_secret)
-        if not access_token:
-            logger.error("Не удалось получить токен доступа")
-            raise Exception("Не удалось получить токен доступа")
-            
-        user_id = get_avito_user_id(client_id, client_secret)
-        if not user_id:
-            logger.error("Не удалось получить ID пользователя")
-            raise Exception("Не удалось получить ID пользователя")
-        
-        # Инициализируем значения по умолчанию
-        total_calls = 0
-        missed_calls = 0
-        balance_info = {"balance_real": 0, "balance_bonus": 0, "advance": 0}
-        expenses_info = {"total": 0, "details": {}}
-        total_chats = 0
-        new_chats = 0
-        total_phones = 0
-        rating = 0
-        reviews_info = {"total_reviews": 0, "period_reviews": 0}
-        promotion_info = {"total_items": 0, "xl_promotion_count": 0}
-        items_stats = {"total_views": 0, "total_contacts": 0, "total_favorites": 0}
-        
-        # Создаем ключ для кэша статистики
-        stats_cache_key = f"daily_stats_{user_id}_{yesterday_date}"
-        
-        # Проверяем, есть ли у нас кэшированные данные
-        if hasattr(get_daily_statistics, '_stats_cache') and stats_cache_key in get_daily_statistics._stats_cache:
-            cache_data, cache_time = get_daily_statistics._stats_cache[stats_cache_key]
-            time_diff = (current_time - cache_time).total_seconds() / 60  # Разница в минутах
-            
-            # Используем кэш, если он не старше 30 минут
-            if time_diff < 30:
-                logger.info(f"Использование кэшированной дневной статистики ({time_diff:.1f} минут)")
-                return cache_data
+def run_concurrently(tasks, max_workers=None, failed=None):
+    """
+    Выполняет независимые запросы к API параллельно в пуле потоков.
+    
+    Args:
+        tasks: Словарь {имя: (функция, аргументы, значение по умолчанию)}
+        max_workers: Максимальное число одновременных запросов
+                     (по умолчанию AVITO_ACCOUNT_CONCURRENCY)
+        failed: Множество, в которое добавляются имена задач, завершившихся
+                ошибкой или вернувших значение по умолчанию после ошибки
+                запроса (record_api_error)
         
-        # Пытаемся получить расширенную статистику профиля, только если не было ошибок ранее
-        use_profile_stats = True
-        if hasattr(get_daily_statistics, '_profile_stats_errors'):
-            # Если было слишком много ошибок (429) в течение последнего часа, не запрашиваем API
-            last_error_time, error_count = get_daily_statistics._profile_stats_errors
-            if (current_time - last_error_time).total_seconds() < 3600 and error_count > 3:
-                logger.warning("Пропуск запроса к API статистики из-за предыдущих ошибок (Too Many Requests)")
-                use_profile_stats = False
-        else:
-            get_daily_statistics._profile_stats_errors = (datetime.datetime.min, 0)
-        
-        profile_stats = {}
-        if use_profile_stats:
-            # Получаем расширенную статистику профиля за вчерашний день
-            profile_stats = get_profile_statistics(access_token, user_id, date_from=yesterday_date, date_to=yesterday_date)
-        
-        # Если статистика успешно получена, используем ее
-        if profile_stats:
-            # Используем статистику профиля для звонков и чатов
-            total_calls = profile_stats.get('calls', 0)
-            total_chats = profile_stats.get('chats', 0)
-            
-            # Обновляем статистику объявлений
-            items_stats = {
-                "total_views": profile_stats.get('views', 0),
-                "total_contacts": profile_stats.get('contacts', 0),
-                "total_favorites": profile_stats.get('favorites', 0)
-            }
-            
-            # Обновляем расходы
-            spending = profile_stats.get('spending', {})
-            if spending:
-                expenses_info = {
-                    "total": spending.get('total', 0),
-                    "details": {
-                        "Размещение объявлений": {
-                            "amount": spending.get('presence', 0),
-                            "count": 1,
-                            "type": "размещение",
-                            "items": []
-                        },
-                        "Продвижение объявлений": {
-                            "amount": spending.get('promo', 0),
-                            "count": 1,
-                            "type": "продвижение",
-                            "items": []
-                        }
-                    }
-                }
-            
-            # Обновляем информацию о количестве объявлений
-            promotion_info["total_items"] = profile_stats.get('active_items', 0)
-            
-            # Сбрасываем счетчик ошибок
-            get_daily_statistics._profile_stats_errors = (datetime.datetime.min, 0)
-        else:
-            # Если получили ошибку 429, обновляем счетчик ошибок
-            if hasattr(get_profile_statistics, 'last_error_code') and get_profile_statistics.last_error_code == 429:
-                last_error_time, error_count = get_daily_statistics._profile_stats_errors
-                if (current_time - last_error_time).total_seconds() > 3600:
-                    # Если последняя ошибка была больше часа назад, сбрасываем счетчик
-                    get_daily_statistics._profile_stats_errors = (current_time, 1)
-                else:
-                    # Увеличиваем счетчик ошибок
-                    get_daily_statistics._profile_stats_errors = (last_error_time, error_count + 1)
-                
-                logger.warning(f"Зарегистрирована ошибка API статистики (429), всего: {error_count + 1} за последний час")
-            
-            # Если расширенная статистика недоступна, используем старые методы
-            try:
-                # Получаем статистику звонков за вчерашний день
-                total_calls = get_total_calls(access_token, yesterday_start, yesterday_end)
-                missed_calls = get_missed_calls(access_token, yesterday_start, yesterday_end)
-            except Exception as e:
-                logger.error(f"Ошибка при получении статистики звонков: {e}")
-            
-            try:
-                # Получаем чаты за вчерашний день
-                total_chats = get_user_chats(access_token, yesterday_start, yesterday_end)
-            except Exception as e:
-                logger.error(f"Ошибка при получении информации о чатах: {e}")
-                
-            try:
-                # Получаем информацию о объявлениях за вчерашний день
-                item_ids = get_user_items_stats(access_token, user_id, date_from=yesterday_start, date_to=yesterday_end)
-                items_stats = get_items_statistics(access_token, user_id, item_ids, date_from=yesterday_start, date_to=yesterday_end)
-                promotion_info = get_item_promotion_info(access_token, user_id, item_ids)
-            except Exception as e:
-                logger.error(f"Ошибка при получении информации об объявлениях: {e}")
-                
+    Returns:
+        dict: Словарь {имя: результат}; при ошибке задачи - значение по умолчанию
+    """
+    if not tasks:
+        return {}
+    
+    max_workers = min(max_workers or settings.AVITO_ACCOUNT_CONCURRENCY, len(tasks))
+    results = {}
+    failed = failed if failed is not None else set()
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_run_tracked, func, args): (name, default)
+            for name, (func, args, default) in tasks.items()
+        }
+        for future in as_completed(futures):
+            name, default = futures[future]
             try:
-                # Получаем информацию о расходах за вчерашний день
-                expenses_info = get_operations_history(access_token, yesterday_start, yesterday_end)
+                results[name], had_errors = future.result()
+                if had_errors:
+                    failed.add(name)
             except Exception as e:
-                logger.error(f"Ошибка при получении информации о расходах: {e}")
+                logger.error(f"Ошибка при выполнении запроса '{name}': {e}")
+                results[name] = default
+                failed.add(name)
+    
+    return results
+
+
+def _get_items_info(access_token, user_id, date_from, date_to):
+    """Получает статистику объявлений и информацию о продвижении (запасной путь без API v2)"""
+    item_ids = get_user_items_stats(access_token, user_id, date_from=date_from, date_to=date_to)
+    items_stats = get_items_statistics(access_token, user_id, item_ids, date_from=date_from, date_to=date_to)
+    promotion_info = get_item_promotion_info(access_token, user_id, item_ids)
+    return items_stats, promotion_info
+
+
+def apply_profile_stats(stats, profile_stats):
+    """Переносит показатели статистики профиля (API v2) в показатели collect_period_statistics"""
+    # Используем статистику профиля для звонков и чатов
+    stats["total_calls"] = profile_stats.get('calls', 0)
+    stats["total_chats"] = profile_stats.get('chats', 0)
+    
+    # Обновляем статистику объявлений
+    stats["items_stats"] = {
+        "total_views": profile_stats.get('views', 0),
+        "total_contacts": profile_stats.get('contacts', 0),
+        "total_favorites": profile_stats.get('favorites', 0)
+    }
+    
+    # Обновляем расходы
+    spending = profile_stats.get('spending', {})
+    if spending:
+        stats["expenses_info"] = {
+            "total": spending.get('total', 0),
+            "details": {
+                "Размещение объявлений": {
+                    "amount": spending.get('presence', 0),
+                    "count": 1,
+                    "type": "размещение",
+                    "items": []
+                },
+                "Продвижение объявлений": {
+                    "amount": spending.get('promo', 0),
+                    "count": 1,
+                    "type": "продвижение",
+                    "items": []
+                }
+            }
+        }
+    
+    # Обновляем информацию о количестве объявлений
+    stats["promotion_info"]["total_items"] = profile_stats.get('active_items', 0)
+
+
+def collect_period_statistics(access_token, user_id, period_start, period_end, stats_date_from, stats_date_to):
+    """
+    Собирает показатели аккаунта за период, выполняя независимые запросы параллельно.
+    
+    Сначала одновременно запрашиваются статистика профиля (API v2), звонки,
+    новые чаты, показы телефона, баланс, рейтинг и отзывы. Если статистика
+    профиля недоступна, вторым шагом параллельно запрашиваются данные
+    для запасного расчета (чаты, объявления, история операций).
+    
+    Args:
+        access_token: Токен доступа к API
+        user_id: ID пользователя Авито
+        period_start: Начало периода (RFC3339)
+        period_end: Конец периода (RFC3339)
+        stats_date_from: Начальная дата для API статистики (YYYY-MM-DD)
+        stats_date_to: Конечная дата для API статистики (YYYY-MM-DD)
         
-        # Дополняем данные, которые нельзя получить из расширенной статистики
-        try:
-            # Если статистика профиля не вернула пропущенные звонки, получаем их отдельно
-            if missed_calls == 0 and total_calls > 0:
-                missed_calls = get_missed_calls(access_token, yesterday_start, yesterday_end)
-        except Exception as e:
-            logger.error(f"Ошибка при получении информации о пропущенных звонках: {e}")
-            
-        try:
-            # Получаем новые чаты за период (функция использует фильтрацию по дате)
-            new_chats = get_chats_by_time(access_token, yesterday_start)
-            total_phones = get_all_numbers(access_token, yesterday_start, yesterday_end)
-        except Exception as e:
-            logger.error(f"Ошибка при получении дополнительной информации о чатах и телефонах: {e}")
+    Returns:
+        dict: Словарь с показателями за период; "complete" - все запросы
+              выполнены без ошибок (иначе часть показателей - нули по умолчанию)
+    """
+    tasks = {
+        "calls": (count_user_calls, (access_token, period_start, period_end), {"total": 0, "missed": 0}),
+        "new_chats": (get_chats_by_time, (access_token, period_start, user_id, period_end), 0),
+        "phones": (get_all_numbers, (access_token, period_start, period_end), 0),
+        "balance": (get_user_balance_info, (access_token, user_id), {"balance_real": 0, "balance_bonus": 0, "advance": 0}),
+        "rating": (get_user_rating_info, (access_token,), 0),
+        "reviews": (get_user_reviews, (access_token, period_start, period_end), {"total_reviews": 0, "period_reviews": 0}),
+        "profile_stats": (get_profile_statistics, (access_token, user_id, stats_date_from, stats_date_to), {}),
+    }
+    
+    failed = set()
+    results = run_concurrently(tasks, failed=failed)
+    # Без статистики профиля показатели берутся из запасного расчета ниже
+    failed.discard("profile_stats")
+    
+    profile_stats = results.get("profile_stats", {})
+    
+    stats = {
+        "total_calls": results["calls"]["total"],
+        "missed_calls": 0,
+        "total_chats": 0,
+        "new_chats": results["new_chats"],
+        "total_phones": results["phones"],
+        "balance_info": results["balance"],
+        "rating": results["rating"],
+        "reviews_info": results["reviews"],
+        "expenses_info": {"total": 0, "details": {}},
+        "promotion_info": {"total_items": 0, "xl_promotion_count": 0},
+        "items_stats": {"total_views": 0, "total_contacts": 0, "total_favorites": 0},
+    }
+    
+    # Если статистика успешно получена, используем ее
+    if profile_stats:
+        apply_profile_stats(stats, profile_stats)
+    else:
+        # Если расширенная статистика недоступна, используем старые методы
+        fallback = run_concurrently({
+            "chats": (partial(get_user_chats, user_id=user_id), (access_token, period_start, period_end), 0),
+            "items": (_get_items_info, (access_token, user_id, period_start, period_end), None),
+            "expenses": (get_operations_history, (access_token, period_start, period_end), {"total": 0, "details": {}}),
+        }, failed=failed)
+        
+        stats["total_chats"] = fallback["chats"]
+        stats["expenses_info"] = fallback["expenses"]
+        if fallback["items"]:
+            stats["items_stats"], stats["promotion_info"] = fallback["items"]
+    
+    # Пропущенные звонки считаем по списку звонков, полученному выше
+    if stats["total_calls"] > 0:
+        stats["missed_calls"] = results["calls"]["missed"]
+    
+    stats["complete"] = not failed
+    if failed:
+        logger.warning(f"Статистика за {stats_date_from} - {stats_date_to} неполная, ошибки запросов: {sorted(failed)}")
+    return stats
+
+
+def _to_date(value):
+    """Приводит дату (date, datetime или строку YYYY-MM-DD) к datetime.date"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def collect_statistics(client_id, client_secret, date_from, date_to):
+    """
+    Собирает показатели аккаунта за диапазон дат (включительно).
+    
+    Окна запросов для всех методов API вычисляются из диапазона:
+    RFC3339 с начала date_from до конца date_to для звонков, чатов и
+    операций, YYYY-MM-DD для API статистики.
+    
+    Returns:
+        dict: Показатели в формате collect_period_statistics
         
-        try:
-            # Получаем полную информацию о балансе (текущую)
-            balance_info = get_user_balance_info(access_token, user_id)
-        except Exception as e:
-            logger.error(f"Ошибка при получении информации о балансе: {e}")
+    Raises:
+        Exception: Если не удалось получить токен доступа или ID пользователя
+    """
+    date_from = _to_date(date_from)
+    date_to = _to_date(date_to)
+    
+    access_token = get_access_token(client_id, client_secret)
+    if not access_token:
+        logger.error("Не удалось получить токен доступа")
+        raise Exception("Не удалось получить токен доступа")
+        
+    user_id = get_avito_user_id(client_id, client_secret)
+    if not user_id:
+        logger.error("Не удалось получить ID пользователя")
+        raise Exception("Не удалось получить ID пользователя")
+    
+    return collect_period_statistics(
+        access_token, user_id,
+        f"{date_from.isoformat()}T00:00:00Z", f"{date_to.isoformat()}T23:59:59Z",
+        date_from.isoformat(), date_to.isoformat()
+    )
+
+
+def build_statistics_report(stats, reviews_key):
+    """
+    Формирует словарь отчета из показателей collect_period_statistics.
+    
+    Args:
+        stats: Показатели за период
+        reviews_key: Ключ числа отзывов за период ('today' для дня, 'weekly' для недели)
+    """
+    return {
+        "calls": {
+            "total": stats["total_calls"],
+            "missed": stats["missed_calls"],
+            "answered": stats["total_calls"] - stats["missed_calls"]
+        },
+        "balance_real": stats["balance_info"]["balance_real"],
+        "balance_bonus": stats["balance_info"]["balance_bonus"],
+        "advance": stats["balance_info"]["advance"],
+        "expenses": stats["expenses_info"],
+        "chats": {
+            "total": stats["total_chats"],
+            "new": stats["new_chats"]
+        },
+        "phones_received": stats["total_phones"],
+        "rating": stats["rating"],
+        "reviews": {
+            "total": stats["reviews_info"]["total_reviews"],
+            reviews_key: stats["reviews_info"]["period_reviews"]
+        },
+        "items": {
+            "total": stats["promotion_info"]["total_items"],
+            "with_xl_promotion": stats["promotion_info"]["xl_promotion_count"]
+        },
+        "statistics": {
+            "views": stats["items_stats"]["total_views"],
+            "contacts": stats["items_stats"]["total_contacts"],
+            "favorites": stats["items_stats"]["total_favorites"]
+        }
+    }
+
+
+def empty_statistics_report(reviews_key):
+    """Отчет с нулевыми значениями (при ошибке получения статистики)"""
+    return {
+        "calls": {"total": 0, "missed": 0, "answered": 0},
+        "balance_real": 0,
+        "balance_bonus": 0,
+        "advance": 0,
+        "expenses": {"total": 0, "details": {}},
+        "chats": {"total": 0, "new": 0},
+        "phones_received": 0,
+        "rating": 0,
+        "reviews": {"total": 0, reviews_key: 0},
+        "items": {"total": 0, "with_xl_promotion": 0},
+        "statistics": {"views": 0, "contacts": 0, "favorites": 0}
+    }
+
+
+def get_daily_statistics(client_id, client_secret, date=None, fallback=True):
+    """
+    Возвращает статистику аккаунта за день (по умолчанию - за вчера).
+    
+    Результат кэшируется по (client_id, дата), поэтому отчеты, сохранение
+    статистики, заполнение истории и проверка аномалий за один и тот же день
+    используют один запрос к API. Статистика за прошедшие дни хранится
+    дольше (AVITO_CACHE_TTLS['daily_stats_final']), чем за текущий день.
+    Неполная статистика (часть запросов завершилась ошибкой) не кэшируется.
+    
+    Args:
+        client_id: Client ID Авито
+        client_secret: Client Secret Авито
+        date: Дата (date или строка YYYY-MM-DD)
+        fallback: При ошибке вернуть отчет с нулевыми значениями, при неполной
+                  статистике - отчет с полученными показателями (иначе None:
+                  так в БД не попадают нули вместо неполученных показателей)
+    """
+    today = datetime.datetime.now().date()
+    date = _to_date(date) if date is not None else today - datetime.timedelta(days=1)
+    date_str = date.strftime("%Y-%m-%d")
+    
+    try:
+        logger.info(f"Запрос дневной статистики за {date_str}")
         
-        try:
-            # Получаем рейтинг и отзывы
-            rating = get_user_rating_info(access_token)
-            reviews_info = get_user_reviews(access_token, yesterday_start, yesterday_end)
-        except Exception as e:
-            logger.error(f"Ошибка при получении информации о рейтинге и отзывах: {e}")
+        # Проверяем, есть ли у нас кэшированные данные по этому аккаунту
+        cache_key_parts = (client_id, date_str)
+        cache_data = cache_get("daily_stats", cache_key_parts)
+        if cache_data is not None:
+            logger.info(f"Использование кэшированной дневной статистики за {date_str}")
+            return cache_data
         
-        # Формируем и возвращаем полную статистику за вчерашний день
-        result = {
-            "date": yesterday_date,
-            "calls": {
-                "total": total_calls,
-                "missed": missed_calls,
-                "answered": total_calls - missed_calls
-            },
-            "balance_real": balance_info["balance_real"],
-            "balance_bonus": balance_info["balance_bonus"],
-            "advance": balance_info["advance"],
-            "expenses": expenses_info,
-            "chats": {
-                "total": total_chats,
-                "new": new_chats
-            },
-            "phones_received": total_phones,
-            "rating": rating,
-            "reviews": {
-                "total": reviews_info["total_reviews"],
-                "today": reviews_info["period_reviews"]
-            },
-            "items": {
-                "total": promotion_info["total_items"],
-                "with_xl_promotion": promotion_info["xl_promotion_count"]
-            },
-            "statistics": {
-                "views": items_stats["total_views"],
-                "contacts": items_stats["total_contacts"],
-                "favorites": items_stats["total_favorites"]
-            }
-        }
+        stats = collect_statistics(client_id, client_secret, date, date)
+        result = {"date": date_str, **build_statistics_report(stats, "today")}
+        
+        if not stats["complete"]:
+            logger.warning(f"Дневная статистика за {date_str} неполная, в кэш не сохраняется")
+            return result if fallback else None
         
         # Сохраняем результат в кэш
-        if not hasattr(get_daily_statistics, '_stats_cache'):
-            get_daily_statistics._stats_cache = {}
-        get_daily_statistics._stats_cache[stats_cache_key] = (result, current_time)
+        cache_set(
+            "daily_stats", cache_key_parts, result,
+            timeout=get_ttl("daily_stats_final") if date < today else None
+        )
         
-        logger.info(f"Дневная статистика за вчера успешно получена")
+        logger.info(f"Дневная статистика за {date_str} успешно получена")
         return result
         
     except Exception as e:
-        logger.error(f"Ошибка при получении дневной статистики: {e}")
+        logger.error(f"Ошибка при получении дневной статистики за {date_str}: {e}")
+        if not fallback:
+            return None
         # Возвращаем структуру с нулевыми значениями в случае ошибки
-        yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-        return {
-            "date": yesterday,
-            "calls": {"total": 0, "missed": 0, "answered": 0},
-            "balance_real": 0,
-            "balance_bonus": 0,
-            "advance": 0,
-            "expenses": {"total": 0, "details": {}},
-            "chats": {"total": 0, "new": 0},
-            "phones_received": 0,
-            "rating": 0,
-            "reviews": {"total": 0, "today": 0},
-            "items": {"total": 0, "with_xl_promotion": 0},
-            "statistics": {"views": 0, "contacts": 0, "favorites": 0}
-        }
+        return {"date": date_str, **empty_statistics_report("today")}
 
 
-def get_weekly_statistics(client_id, client_secret):
+def get_daily_statistics_range(client_id, client_secret, date_from, date_to, fallback=True, skip_dates=()):
+    """
+    Возвращает дневную статистику аккаунта за каждый день диапазона (включительно).
+    
+    Дни, уже находящиеся в кэше, берутся из него одним обращением,
+    остальные запрашиваются через get_daily_statistics.
+    
+    Args:
+        skip_dates: Дни диапазона, которые не нужно получать (например, уже сохраненные в БД)
+    
+    Returns:
+        dict: {дата YYYY-MM-DD: статистика за день}; при fallback=False дни
+              с ошибкой отсутствуют
+    """
+    date_from = _to_date(date_from)
+    date_to = _to_date(date_to)
+    skip_dates = {_to_date(date) for date in skip_dates}
+    
+    dates = []
+    date = date_from
+    while date <= date_to:
+        if date not in skip_dates:
+            dates.append(date.strftime("%Y-%m-%d"))
+        date += datetime.timedelta(days=1)
+    
+    result = cache_get_many("daily_stats", {date_str: (client_id, date_str) for date_str in dates})
+    
+    for date_str in dates:
+        if date_str in result:
+            continue
+        daily_stats = get_daily_statistics(client_id, client_secret, date_str, fallback=fallback)
+        if daily_stats is not None:
+            result[date_str] = daily_stats
+    
+    return {date_str: result[date_str] for date_str in dates if date_str in result}
+
+
+def _count_calls_by_day(access_token, period_start, period_end):
+    """Считает звонки и пропущенные звонки за период по дням (UTC) одним обходом списка звонков"""
+    calls = {}
+    for call in iter_user_calls(access_token, period_start, period_end):
+        call_time = call.get('callTime')
+        if not call_time:
+            continue
+        day = calls.setdefault(call_time[:10], {"total": 0, "missed": 0})
+        day["total"] += 1
+        if call.get('talkDuration', 0) == 0:
+            day["missed"] += 1
+    return calls
+
+
+def _count_chats_by_day(access_token, user_id, period_start, period_end):
+    """Считает чаты по объявлениям за период по дням последнего сообщения (UTC) одним обходом"""
+    from_date = datetime.datetime.fromisoformat(period_start.replace('Z', '+00:00'))
+    to_date = datetime.datetime.fromisoformat(period_end.replace('Z', '+00:00'))
+    chats = {}
+    with closing(iter_user_chats(access_token, user_id, {'chat_types': 'u2i'})) as chats_iter:
+        for chat in chats_iter:
+            last_message_time = chat.get('lastMessageTime')
+            if not last_message_time:
+                continue
+            message_time = datetime.datetime.fromisoformat(last_message_time.replace('Z', '+00:00'))
+            if message_time < from_date:
+                # Дальше только более старые чаты
+                break
+            if message_time <= to_date:
+                day = message_time.date().isoformat()
+                chats[day] = chats.get(day, 0) + 1
+    return chats
+
+
+def _count_reviews_by_day(access_token, date_from, date_to):
+    """Считает отзывы за период по дням одним обходом; возвращает (всего отзывов, {дата: отзывов})"""
+    meta = {"total": 0}
+    reviews = {}
+    with closing(iter_user_reviews(access_token, meta=meta)) as reviews_iter:
+        for review in reviews_iter:
+            created_at = review.get('createdAt', 0)
+            if not created_at:
+                continue
+            review_date = datetime.datetime.fromtimestamp(created_at).date()
+            if review_date < date_from:
+                # Дальше только более старые отзывы
+                break
+            if review_date <= date_to:
+                reviews[review_date.isoformat()] = reviews.get(review_date.isoformat(), 0) + 1
+    return meta["total"], reviews
+
+
+def _grouping_date(grouping):
+    """Дата группировки по дням из ответа API статистики v2 (строка YYYY-MM-DD или unix-время)"""
+    value = grouping.get('date', grouping.get('id'))
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, tz=ZoneInfo(settings.TIME_ZONE)).date()
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def get_daily_statistics_grouped(client_id, client_secret, date_from, date_to):
+    """
+    Возвращает дневную статистику аккаунта за каждый день диапазона (включительно),
+    используя запросы за весь диапазон вместо запросов за каждый день.
+    
+    Показатели API статистики v2 (просмотры, контакты, звонки, чаты, расходы,
+    объявления) запрашиваются с группировкой по дням окнами не длиннее
+    AVITO_STATS_MAX_DAYS. Пропущенные звонки, новые чаты и отзывы считаются
+    по дням одним обходом списков за весь диапазон, баланс и рейтинг
+    запрашиваются один раз (текущие значения, как и в get_daily_statistics).
+    Отдельно за каждый день запрашиваются только показы телефона: API
+    возвращает лишь их общее число за окно. Эти запросы независимы и идут
+    параллельно с остальными через run_concurrently.
+    Статистика каждого прошедшего дня кэшируется так же, как в get_daily_statistics.
+    Дни, для которых часть запросов завершилась ошибкой, в результат не попадают
+    и не кэшируются.
+    
+    Returns:
+        dict: {дата YYYY-MM-DD: статистика за день} или None, если статистика
+              с группировкой по дням недоступна
+    """
+    date_from = _to_date(date_from)
+    date_to = _to_date(date_to)
+    
     try:
-        # Получаем текущую дату и дату неделю назад
-        current_time = datetime.datetime.now()
-        week_ago = current_time - datetime.timedelta(days=7)
-        week_start = week_ago.replace(hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
-        week_end = current_time.strftime("%Y-%m-%dT%H:%M:%SZ")
-        
-        # Форматы дат для разных API
-        week_start_date = week_ago.strftime("%Y-%m-%d")
-        week_end_date = current_time.strftime("%Y-%m-%d")
-        
-        logger.info(f"Запрос недельной статистики с {week_start_date} по {week_end_date}")
-        
-        # Создаем ключ для кэша статистики
-        stats_cache_key = f"weekly_stats_{week_start_date}_{week_end_date}"
-        
-        # Проверяем, есть ли у нас кэшированные данные
-        if hasattr(get_weekly_statistics, '_stats_cache') and stats_cache_key in get_weekly_statistics._stats_cache:
-            cache_data, cache_time = get_weekly_statistics._stats_cache[stats_cache_key]
-            time_diff = (current_time - cache_time).total_seconds() / 60  # Разница в минутах
-            
-            # Используем кэш, если он не старше 60 минут
-            if time_diff < 60:
-                logger.info(f"Использование кэшированной недельной статистики ({time_diff:.1f} минут)")
-                return cache_data
-        
-        # Получаем токен доступа
         access_token = get_access_token(client_id, client_secret)
-        if not access_token:
-            logger.error("Не удалось получить токен доступа")
-            raise Exception("Не удалось получить токен доступа")
-            
-        user_id = get_avito_user_id(client_id, client_secret)
+        user_id = get_avito_user_id(client_id, client_secret) if access_token else None
         if not user_id:
-            logger.error("Не удалось получить ID пользователя")
-            raise Exception("Не удалось получить ID пользователя")
+            logger.error("Не удалось получить токен доступа или ID пользователя")
+            return None
         
-        # Инициализируем значения по умолчанию
-        total_calls = 0
-        missed_calls = 0
-        balance_info = {"balance_real": 0, "balance_bonus": 0, "advance": 0}
-        expenses_info = {"total": 0, "details": {}}
-        total_chats = 0
-        new_chats = 0
-        total_phones = 0
-        rating = 0
-        reviews_info = {"total_reviews": 0, "period_reviews": 0}
-        promotion_info = {"total_items": 0, "xl_promotion_count": 0}
-        items_stats = {"total_views": 0, "total_contacts": 0, "total_favorites": 0}
-        
-        # Пытаемся получить расширенную статистику профиля, только если не было ошибок ранее
-        use_profile_stats = True
-        if hasattr(get_daily_statistics, '_profile_stats_errors'):
-            # Проверяем, были ли ошибки в дневной статистике
-            last_error_time, error_count = get_daily_statistics._profile_stats_errors
-            if (current_time - last_error_time).total_seconds() < 3600 and error_count > 3:
-                logger.warning("Пропуск запроса к API статистики из-за предыдущих ошибок (Too Many Requests)")
-                use_profile_stats = False
-        
-        profile_stats = {}
-        if use_profile_stats:
-            # Получаем расширенную статистику профиля
-            profile_stats = get_profile_statistics(access_token, user_id, date_from=week_start_date, date_to=week_end_date)
-        
-        # Если статистика успешно получена, используем ее
-        if profile_stats:
-            # Используем статистику профиля для звонков и чатов
-            total_calls = profile_stats.get('calls', 0)
-            total_chats = profile_stats.get('chats', 0)
-            
-            # Обновляем статистику объявлений
-            items_stats = {
-                "total_views": profile_stats.get('views', 0),
-                "total_contacts": profile_stats.get('contacts', 0),
-                "total_favorites": profile_stats.get('favorites', 0)
+        # Статистика профиля по дням, окнами не длиннее AVITO_STATS_MAX_DAYS
+        profile_by_day = {}
+        window_start = date_from
+        while window_start <= date_to:
+            window_end = min(date_to, window_start + datetime.timedelta(days=settings.AVITO_STATS_MAX_DAYS - 1))
+            result = get_profile_statistics(
+                access_token, user_id, window_start.isoformat(), window_end.isoformat(), grouping="day"
+            )
+            if not result:
+                logger.warning(f"Статистика по дням за {window_start} - {window_end} недоступна")
+                return None
+            for grouping in result.get('groupings', []):
+                profile_by_day[_grouping_date(grouping).isoformat()] = parse_profile_metrics(grouping.get('metrics', []))
+            window_start = window_end + datetime.timedelta(days=1)
+        
+        dates = []
+        date = date_from
+        while date <= date_to:
+            dates.append(date.isoformat())
+            date += datetime.timedelta(days=1)
+        
+        period_start = f"{date_from.isoformat()}T00:00:00Z"
+        period_end = f"{date_to.isoformat()}T23:59:59Z"
+        tasks = {
+            "calls": (_count_calls_by_day, (access_token, period_start, period_end), {}),
+            "chats": (_count_chats_by_day, (access_token, user_id, period_start, period_end), {}),
+            "reviews": (_count_reviews_by_day, (access_token, date_from, date_to), (0, {})),
+            "balance": (get_user_balance_info, (access_token, user_id), {"balance_real": 0, "balance_bonus": 0, "advance": 0}),
+            "rating": (get_user_rating_info, (access_token,), 0),
+        }
+        for date_str in dates:
+            tasks[f"phones:{date_str}"] = (
+                get_all_numbers, (access_token, f"{date_str}T00:00:00Z", f"{date_str}T23:59:59Z"), 0
+            )
+        failed = set()
+        results = run_concurrently(tasks, failed=failed)
+        total_reviews, reviews_by_day = results["reviews"]
+        
+        reports = {}
+        incomplete = []
+        for date_str in dates:
+            if any(name in failed for name in ("calls", "chats", "reviews", "balance", "rating", f"phones:{date_str}")):
+                incomplete.append(date_str)
+                continue
+            calls = results["calls"].get(date_str, {"total": 0, "missed": 0})
+            stats = {
+                "total_calls": calls["total"],
+                "missed_calls": 0,
+                "total_chats": 0,
+                "new_chats": results["chats"].get(date_str, 0),
+                "total_phones": results[f"phones:{date_str}"],
+                "balance_info": results["balance"],
+                "rating": results["rating"],
+                "reviews_info": {"total_reviews": total_reviews, "period_reviews": reviews_by_day.get(date_str, 0)},
+                "expenses_info": {"total": 0, "details": {}},
+                "promotion_info": {"total_items": 0, "xl_promotion_count": 0},
+                "items_stats": {"total_views": 0, "total_contacts": 0, "total_favorites": 0},
             }
-            
-            # Обновляем расходы
-            spending = profile_stats.get('spending', {})
-            if spending:
-                expenses_info = {
-                    "total": spending.get('total', 0),
-                    "details": {
-                        "Размещение объявлений": {
-                            "amount": spending.get('presence', 0),
-                            "count": 1,
-                            "type": "размещение",
-                            "items": []
-                        },
-                        "Продвижение объявлений": {
-                            "amount": spending.get('promo', 0),
-                            "count": 1,
-                            "type": "продвижение",
-                            "items": []
-                        }
-                    }
-                }
-            
-            # Обновляем информацию о количестве объявлений
-            promotion_info["total_items"] = profile_stats.get('active_items', 0)
-        else:
-            # Если расширенная статистика недоступна, используем старые методы
-            try:
-                # Получаем статистику звонков
-                total_calls = get_total_calls(access_token, week_start, week_end)
-                missed_calls = get_missed_calls(access_token, week_start, week_end)
-            except Exception as e:
-                logger.error(f"Ошибка при получении статистики звонков: {e}")
-                
-            try:
-                # Получаем чаты
-                total_chats = get_user_chats(access_token, week_start, week_end)
-            except Exception as e:
-                logger.error(f"Ошибка при получении информации о чатах: {e}")
-                
-            try:
-                # Получаем информацию о объявлениях
-                item_ids = get_user_items_stats(access_token, user_id, date_from=week_start, date_to=week_end)
-                items_stats = get_items_statistics(access_token, user_id, item_ids, date_from=week_start, date_to=week_end)
-                promotion_info = get_item_promotion_info(access_token, user_id, item_ids)
-            except Exception as e:
-                logger.error(f"Ошибка при получении информации об объявлениях: {e}")
-                
-            try:
-                # Получаем информацию о расходах
-                expenses_info = get_operations_history(access_token, week_start, week_end)
-            except Exception as e:
-                logger.error(f"Ошибка при получении информации о расходах: {e}")
+            # Дни без группировки в ответе - дни без активности
+            apply_profile_stats(stats, profile_by_day.get(date_str) or parse_profile_metrics([]))
+            if stats["total_calls"] > 0:
+                stats["missed_calls"] = calls["missed"]
+            reports[date_str] = {"date": date_str, **build_statistics_report(stats, "today")}
+        
+        if incomplete:
+            logger.warning(
+                f"Неполная статистика за {len(incomplete)} дн. ({incomplete[0]} - {incomplete[-1]}), "
+                f"ошибки запросов: {sorted(failed)}"
+            )
+        
+        today = datetime.datetime.now().date()
+        cache_set_many(
+            "daily_stats",
+            {(client_id, date_str): report for date_str, report in reports.items() if date_str < today.isoformat()},
+            timeout=get_ttl("daily_stats_final")
+        )
         
-        # Дополняем данные, которые нельзя получить из расширенной статистики
-        try:
-            # Если статистика профиля не вернула пропущенные звонки, получаем их отдельно
-            if missed_calls == 0 and total_calls > 0:
-                missed_calls = get_missed_calls(access_token, week_start, week_end)
-        except Exception as e:
-            logger.error(f"Ошибка при получении информации о пропущенных звонках: {e}")
-            
-        try:
-            # Получаем новые чаты за период
-            new_chats = get_chats_by_time(access_token, week_start)
-            total_phones = get_all_numbers(access_token, week_start, week_end)
-        except Exception as e:
-            logger.error(f"Ошибка при получении дополнительной информации о чатах и телефонах: {e}")
+        logger.info(f"Дневная статистика за {date_from} - {date_to} получена запросами за весь период")
+        return reports
         
-        try:
-            # Получаем полную информацию о балансе
-            balance_info = get_user_balance_info(access_token, user_id)
-        except Exception as e:
-            logger.error(f"Ошибка при получении информации о балансе: {e}")
+    except Exception as e:
+        logger.error(f"Ошибка при получении дневной статистики за {date_from} - {date_to}: {e}")
+        return None
+
+
+def get_weekly_statistics(client_id, client_secret, date_from=None, date_to=None):
+    """
+    Возвращает статистику аккаунта за период (по умолчанию - 7 прошедших дней, по вчера
+    включительно, как и недельный отчет по сохраненной статистике).
+    
+    Args:
+        client_id: Client ID Авито
+        client_secret: Client Secret Авито
+        date_from: Начальная дата (date или строка YYYY-MM-DD)
+        date_to: Конечная дата включительно
+    """
+    today = datetime.datetime.now().date()
+    date_to = _to_date(date_to) if date_to is not None else today - datetime.timedelta(days=1)
+    date_from = _to_date(date_from) if date_from is not None else date_to - datetime.timedelta(days=6)
+    week_start_date = date_from.strftime("%Y-%m-%d")
+    week_end_date = date_to.strftime("%Y-%m-%d")
+    period = f"{week_start_date} - {week_end_date}"
+    
+    try:
+        logger.info(f"Запрос недельной статистики с {week_start_date} по {week_end_date}")
         
-        try:
-            # Получаем рейтинг и отзывы
-            rating = get_user_rating_info(access_token)
-            reviews_info = get_user_reviews(access_token, week_start, week_end)
-        except Exception as e:
-            logger.error(f"Ошибка при получении информации о рейтинге и отзывах: {e}")
+        # Проверяем, есть ли у нас кэшированные данные по этому аккаунту
+        cache_key_parts = (client_id, week_start_date, week_end_date)
+        cache_data = cache_get("weekly_stats", cache_key_parts)
+        if cache_data is not None:
+            logger.info(f"Использование кэшированной недельной статистики с {week_start_date} по {week_end_date}")
+            return cache_data
         
-        # Формируем и возвращаем полную статистику за неделю
-        result = {
-            "period": f"{week_ago.strftime('%Y-%m-%d')} - {current_time.strftime('%Y-%m-%d')}",
-            "calls": {
-                "total": total_calls,
-                "missed": missed_calls,
-                "answered": total_calls - missed_calls
-            },
-            "balance_real": balance_info["balance_real"],
-            "balance_bonus": balance_info["balance_bonus"],
-            "advance": balance_info["advance"],
-            "expenses": expenses_info,
-            "chats": {
-                "total": total_chats,
-                "new": new_chats
-            },
-            "phones_received": total_phones,
-            "rating": rating,
-            "reviews": {
-                "total": reviews_info["total_reviews"],
-                "weekly": reviews_info["period_reviews"]
-            },
-            "items": {
-                "total": promotion_info["total_items"],
-                "with_xl_promotion": promotion_info["xl_promotion_count"]
-            },
-            "statistics": {
-                "views": items_stats["total_views"],
-                "contacts": items_stats["total_contacts"],
-                "favorites": items_stats["total_favorites"]
-            }
-        }
+        stats = collect_statistics(client_id, client_secret, date_from, date_to)
+        result = {"period": period, **build_statistics_report(stats, "weekly")}
         
-        # Сохраняем результат в кэш
-        if not hasattr(get_weekly_statistics, '_stats_cache'):
-            get_weekly_statistics._stats_cache = {}
-        get_weekly_statistics._stats_cache[stats_cache_key] = (result, current_time)
+        # Сохраняем результат в кэш (неполную статистику - нет, чтобы следующий запрос повторил ее)
+        if stats["complete"]:
+            cache_set("weekly_stats", cache_key_parts, result)
         
         logger.info(f"Недельная статистика успешно получена")
         return result
@@ -1189,20 +1416,17 @@ def get_weekly_statistics(client_id, client_secret):
     except Exception as e:
         logger.error(f"Ошибка при получении недельной статистики: {e}")
         # Возвращаем структуру с нулевыми значениями в случае ошибки
-        return {
-            "period": f"{week_ago.strftime('%Y-%m-%d')} - {current_time.strftime('%Y-%m-%d')}",
-            "calls": {"total": 0, "missed": 0, "answered": 0},
-            "balance_real": 0,
-            "balance_bonus": 0,
-            "advance": 0,
-            "expenses": {"total": 0, "details": {}},
-            "chats": {"total": 0, "new": 0},
-            "phones_received": 0,
-            "rating": 0,
-            "reviews": {"total": 0, "weekly": 0},
-            "items": {"total": 0, "with_xl_promotion": 0},
-            "statistics": {"views": 0, "contacts": 0, "favorites": 0}
-        }
+        return {"period": period, **empty_statistics_report("weekly")}
+
+
+async def aget_daily_statistics(client_id, client_secret, date=None):
+    """Асинхронный вариант get_daily_statistics для вызова из асинхронного кода"""
+    return await sync_to_async(get_daily_statistics, thread_sensitive=False)(client_id, client_secret, date)
+
+
+async def aget_weekly_statistics(client_id, client_secret, date_from=None, date_to=None):
+    """Асинхронный вариант get_weekly_statistics для вызова из асинхронного кода"""
+    return await sync_to_async(get_weekly_statistics, thread_sensitive=False)(client_id, client_secret, date_from, date_to)
 
 def get_operations_history(access_token, date_from, date_to):
     """
@@ -1237,7 +1461,7 @@ def get_operations_history(access_token, date_from, date_to):
         logger.info(f"Запрос истории операций с {date_from} по {date_to}")
         
         # Выполняем запрос
-        response = requests.post(operations_url, headers=headers, json=data)
+        response = avito_client.post(operations_url, headers=headers, json=data)
         response.raise_for_status()
         
         # Проверяем, что ответ не пустой
@@ -1251,6 +1475,7 @@ def get_operations_history(access_token, date_from, date_to):
             logger.info(f"Получен ответ от API операций с {len(result.get('operations', []))} операциями")
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка декодирования JSON: {e}, содержимое ответа: {response.text}")
+            record_api_error()
             return {'total': 0, 'details': {}}
         
         # Инициализируем счетчики и структуру для детализации расходов
@@ -1324,6 +1549,7 @@ def get_operations_history(access_token, date_from, date_to):
         return result
     except Exception as e:
         logger.error(f"Ошибка при получении истории операций: {e}")
+        record_api_error()
         return {
             'total': 0,
             'details': {}
@@ -1353,6 +1579,32 @@ def get_weekly_expenses(access_token):
     # Получаем расходы
     return get_operations_history(access_token, week_start, current_iso)
 
+def parse_profile_metrics(metrics_data):
+    """
+    Преобразует список метрик группировки API статистики v2 ([{"slug": ..., "value": ...}])
+    в словарь показателей профиля
+    """
+    # Преобразуем список метрик в словарь {slug: value}
+    stats = {metric.get('slug'): metric.get('value', 0) for metric in metrics_data}
+    
+    # Формируем результат с основными и дополнительными показателями
+    return {
+        "views": stats.get('views', 0),
+        "contacts": stats.get('contacts', 0),
+        "calls": stats.get('contactsShowPhone', 0),
+        "chats": stats.get('contactsMessenger', 0),
+        "favorites": stats.get('favorites', 0),
+        "impressions": stats.get('impressions', 0),
+        "spending": {
+            "total": stats.get('allSpending', 0),
+            "ads": stats.get('spending', 0),
+            "presence": stats.get('presenceSpending', 0),
+            "promo": stats.get('promoSpending', 0)
+        },
+        "active_items": stats.get('activeItems', 0)
+    }
+
+
 def get_profile_statistics(access_token, user_id, date_from=None, date_to=None, grouping="totals"):
     """
     Получение расширенной статистики профиля пользователя с использованием API v2
@@ -1368,26 +1620,6 @@ def get_profile_statistics(access_token, user_id, date_from=None, date_to=None,
         dict: Словарь с показателями статистики
     """
     try:
-        # Сбрасываем код последней ошибки
-        get_profile_statistics.last_error_code = None
-        
-        # Создаем уникальный ключ для кэширования
-        cache_key = f"profile_stats_{user_id}_{date_from}_{date_to}_{grouping}"
-        
-        # Проверяем, есть ли кэш для этого запроса в глобальном хранилище
-        if not hasattr(get_profile_statistics, '_stats_cache'):
-            get_profile_statistics._stats_cache = {}
-            
-        # Проверяем наличие кэша и его актуальность (не старше 1 часа)
-        current_time = datetime.datetime.now()
-        if cache_key in get_profile_statistics._stats_cache:
-            cache_data, cache_time = get_profile_statistics._stats_cache[cache_key]
-            time_diff = (current_time - cache_time).total_seconds() / 3600  # Разница в часах
-            
-            if time_diff < 1:  # Кэш действителен в течение 1 часа
-                logger.info(f"Использование кэшированных данных статистики профиля ({time_diff:.2f} часов)")
-                return cache_data
-        
         # Если даты не указаны, используем текущий день/неделю
         if date_from is None:
             if grouping == "totals":
@@ -1404,6 +1636,14 @@ def get_profile_statistics(access_token, user_id, date_from=None, date_to=None,
         if date_to is None:
             date_to = datetime.datetime.now().strftime("%Y-%m-%d")
         
+        # Проверяем, есть ли кэш для этого запроса
+        cache_key_parts = (user_id, date_from, date_to, grouping)
+        if grouping == "totals":
+            cache_data = cache_get("profile_stats", cache_key_parts)
+            if cache_data is not None:
+                logger.info(f"Использование кэшированных данных статистики профиля за {date_from} - {date_to}")
+                return cache_data
+        
         # URL для получения статистики
         stats_url = f'https://api.avito.ru/stats/v2/accounts/{user_id}/items'
         
@@ -1441,11 +1681,10 @@ def get_profile_statistics(access_token, user_id, date_from=None, date_to=None,
         logger.info(f"Запрос расширенной статистики профиля за период {date_from} - {date_to}, группировка: {grouping}")
         
         # Выполняем запрос
-        response = requests.post(stats_url, headers=headers, json=data)
+        response = avito_client.post(stats_url, headers=headers, json=data)
         
-        # Проверяем код ответа. Если 429 (Too Many Requests), возвращаем пустой результат
+        # Повторы после 429 уже выполнены ограничителем частоты, возвращаем пустой результат
         if response.status_code == 429:
-            get_profile_statistics.last_error_code = 429
             logger.warning(f"Превышен лимит запросов к API статистики (429 Too Many Requests)")
             return {}
             
@@ -1469,36 +1708,12 @@ def get_profile_statistics(access_token, user_id, date_from=None, date_to=None,
                     return {}
                 
                 # Получаем метрики из первой группировки
-                metrics_data = groupings[0].get('metrics', [])
-                
-                # Преобразуем список метрик в словарь {slug: value}
-                stats = {metric.get('slug'): metric.get('value', 0) for metric in metrics_data}
-                
-                # Добавляем расчетные показатели
-                calls = stats.get('contactsShowPhone', 0)
-                chats = stats.get('contactsMessenger', 0)
-                
-                # Формируем результат с основными и дополнительными показателями
-                result_dict = {
-                    "views": stats.get('views', 0),
-                    "contacts": stats.get('contacts', 0),
-                    "calls": calls,
-                    "chats": chats,
-                    "favorites": stats.get('favorites', 0),
-                    "impressions": stats.get('impressions', 0),
-                    "spending": {
-                        "total": stats.get('allSpending', 0),
-                        "ads": stats.get('spending', 0),
-                        "presence": stats.get('presenceSpending', 0),
-                        "promo": stats.get('promoSpending', 0)
-                    },
-                    "active_items": stats.get('activeItems', 0)
-                }
+                result_dict = parse_profile_metrics(groupings[0].get('metrics', []))
                 
                 logger.info(f"Получена статистика: просмотры: {result_dict['views']}, контакты: {result_dict['contacts']}, звонки: {result_dict['calls']}, чаты: {result_dict['chats']}")
                 
                 # Сохраняем результат в кэш
-                get_profile_statistics._stats_cache[cache_key] = (result_dict, current_time)
+                cache_set("profile_stats", cache_key_parts, result_dict)
                 
                 return result_dict
                 
@@ -1511,13 +1726,6 @@ def get_profile_statistics(access_token, user_id, date_from=None, date_to=None,
             return {}
             
     except requests.exceptions.RequestException as e:
-        # Сохраняем код ошибки, если это 429
-        if hasattr(e, 'response') and e.response is not None:
-            status_code = e.response.status_code
-            if status_code == 429:
-                get_profile_statistics.last_error_code = 429
-                logger.warning(f"Превышен лимит запросов к API статистики (429 Too Many Requests) в RequestException")
-                
         logger.error(f"Ошибка запроса API статистики: {e}")
         return {}
     except Exception as e:
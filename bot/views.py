@@ -1,29 +1,49 @@
-from traceback import format_exc
-
 from asgiref.sync import sync_to_async
 from bot.handlers import *
 from bot.handlers.common import get_historical_stats, format_historical_stats_message
 from django.conf import settings
 from django.http import HttpRequest, JsonResponse
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
-from telebot.apihelper import ApiTelegramException
-from telebot.types import Update
 
-from bot import bot, logger
+from bot import bot, logger, setup_bot
+from bot.cache import get_cache_metrics
+from bot.jobs import enqueue_update, forget_update, mark_update_seen, parse_update_id, process_update
+from bot.ratelimit import get_rate_limit_metrics
+from bot.scheduler import get_scheduler_status
 
 
 @require_GET
 def set_webhook(request: HttpRequest) -> JsonResponse:
     """Setting webhook."""
+    setup_bot()
     bot.set_webhook(url=f"{settings.HOOK}/bot/{settings.BOT_TOKEN}")
     bot.send_message(settings.OWNER_ID, "webhook set")
     return JsonResponse({"message": "OK"}, status=200)
 
 
+def is_status_allowed(request: HttpRequest) -> bool:
+    """Метрики доступны сотрудникам (вход через админку) или по STATUS_TOKEN"""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = request.headers.get('X-Status-Token')
+    return bool(settings.STATUS_TOKEN and token) and constant_time_compare(token, settings.STATUS_TOKEN)
+
+
 @require_GET
 def status(request: HttpRequest) -> JsonResponse:
-    return JsonResponse({"message": "OK"}, status=200)
+    if not is_status_allowed(request):
+        return JsonResponse({"message": "Forbidden"}, status=403)
+    return JsonResponse(
+        {
+            "message": "OK",
+            "cache": get_cache_metrics(),
+            "rate_limits": get_rate_limit_metrics(),
+            "scheduler": get_scheduler_status(),
+        },
+        status=200
+    )
 
 
 @csrf_exempt
@@ -34,16 +54,27 @@ def index(request: HttpRequest) -> JsonResponse:
         return JsonResponse({"message": "Bad Request"}, status=403)
 
     json_string = request.body.decode("utf-8")
-    update = Update.de_json(json_string)
     try:
-        bot.process_new_updates([update])
-    except ApiTelegramException as e:
-        logger.error(f"Telegram exception. {e} {format_exc()}")
-    except ConnectionError as e:
-        logger.error(f"Connection error. {e} {format_exc()}")
-    except Exception as e:
-        bot.send_message(settings.OWNER_ID, f'Error from index: {e}')
-        logger.error(f"Unhandled exception. {e} {format_exc()}")
+        update_id = parse_update_id(json_string)
+    except ValueError as e:
+        logger.error(f"Bad update. {e}")
+        return JsonResponse({"message": "Bad Request"}, status=400)
+
+    # Telegram повторяет обновления, на которые не получил ответ вовремя
+    if not mark_update_seen(update_id):
+        logger.info(f"Повторная доставка обновления {update_id} пропущена")
+        return JsonResponse({"message": "OK"}, status=200)
+
+    if settings.TELEGRAM_UPDATE_QUEUE:
+        # Обновление обработает runworker, Telegram получает ответ сразу
+        try:
+            enqueue_update(update_id, json_string)
+        except Exception:
+            forget_update(update_id)
+            raise
+        return JsonResponse({"message": "OK"}, status=200)
+
+    process_update(json_string)
     return JsonResponse({"message": "OK"}, status=200)
 
 
@@ -0,0 +1,86 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def run_for_accounts(accounts, func, max_workers, timeout=None, task_name="задача"):
+    """
+    Выполняет func(account) для каждого аккаунта в ограниченном пуле потоков.
+
+    timeout ограничивает только ожидание: поток аккаунта, не уложившегося
+    в timeout, прервать нельзя, он продолжает работу в фоне после возврата
+    из функции. Защиту от наложения со следующим запуском для того же
+    аккаунта обеспечивает func (например, блокировкой в кэше, как
+    в track_user_expenses).
+
+    Args:
+        accounts: Итерируемый набор аккаунтов AvitoAccount
+        func: Функция обработки аккаунта; успех - только True, любое другое
+              значение (False, None) или исключение - ошибка
+        max_workers: Количество одновременно обрабатываемых аккаунтов
+        timeout: Сколько секунд ждать обработку одного аккаунта (None - без ограничения)
+        task_name: Название задачи для логов
+
+    Returns:
+        dict: Итоги выполнения {"success": [...], "failed": [...], "timeout": [...]}
+              со списками названий аккаунтов
+    """
+    summary = {"success": [], "failed": [], "timeout": []}
+    accounts = list(accounts)
+    if not accounts:
+        return summary
+
+    started_at = {}
+
+    def run(account):
+        started_at[account.pk] = time.monotonic()
+        try:
+            return func(account)
+        finally:
+            # Каждый поток открывает свое соединение с БД, закрываем его сразу
+            connection.close()
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(accounts)))
+    futures = {executor.submit(run, account): account for account in accounts}
+    pending = set(futures)
+
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                account = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"{task_name}: ошибка для аккаунта {account.name}: {e}")
+                    result = False
+                summary["success" if result is True else "failed"].append(account.name)
+
+            if timeout is None:
+                continue
+
+            # Перестаем ждать аккаунты, которые обрабатываются дольше timeout
+            now = time.monotonic()
+            for future in list(pending):
+                account = futures[future]
+                account_started_at = started_at.get(account.pk)
+                if account_started_at is not None and now - account_started_at > timeout:
+                    logger.error(
+                        f"{task_name}: превышено время ожидания ({timeout} с) для аккаунта {account.name}, "
+                        f"обработка продолжается в фоне"
+                    )
+                    summary["timeout"].append(account.name)
+                    pending.discard(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    logger.info(
+        f"{task_name}: успешно {len(summary['success'])}, с ошибкой {len(summary['failed'])}, "
+        f"превышено время {len(summary['timeout'])}"
+    )
+    return summary
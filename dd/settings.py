@@ -28,6 +28,119 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 OWNER_ID = os.getenv('OWNER_ID')
 BOT_NAME = os.getenv("BOT_NAME")
 HOOK = os.getenv('HOOK')
+# Токен для /bot/status/ (заголовок X-Status-Token); без него метрики видны только
+# сотрудникам, вошедшим в админку
+STATUS_TOKEN = os.getenv('STATUS_TOKEN')
+
+# Очередь обновлений Telegram: вебхук сохраняет обновление в БД и сразу отвечает,
+# обновления обрабатывает команда runworker (False - обработка прямо в вебхуке)
+TELEGRAM_UPDATE_QUEUE = os.getenv('TELEGRAM_UPDATE_QUEUE', 'True') == 'True'
+# Обработчик очереди: пауза при пустой очереди в секундах, через сколько секунд
+# обновление в обработке считается зависшим (обработчик остановился; должно быть
+# больше TELEGRAM_CHAT_LOCK_TIMEOUT плюс время самого долгого отчета) и сколько
+# раз такое обновление возвращать в очередь
+UPDATE_WORKER_POLL_INTERVAL = float(os.getenv('UPDATE_WORKER_POLL_INTERVAL', 0.5))
+UPDATE_JOB_TIMEOUT = int(os.getenv('UPDATE_JOB_TIMEOUT', 600))
+UPDATE_JOB_MAX_ATTEMPTS = int(os.getenv('UPDATE_JOB_MAX_ATTEMPTS', 3))
+# Повторы обновлений Telegram: сколько секунд помнить полученные update_id
+# (повторная доставка пропускается), сколько секунд после выполнения запроса
+# отчета такой же запрос из того же чата считается повтором и сколько максимум
+# ждать окончания обработки предыдущего обновления из того же чата
+TELEGRAM_UPDATE_DEDUP_TTL = int(os.getenv('TELEGRAM_UPDATE_DEDUP_TTL', 3600))
+TELEGRAM_COALESCE_WINDOW = int(os.getenv('TELEGRAM_COALESCE_WINDOW', 10))
+TELEGRAM_CHAT_LOCK_TIMEOUT = int(os.getenv('TELEGRAM_CHAT_LOCK_TIMEOUT', 300))
+
+# Планировщик (команда runscheduler): расписания задач bot.cron в формате cron
+# "минута час день месяц день_недели" по времени TIME_ZONE (пустое - не запускать),
+# случайная задержка запуска в секундах (меньше минуты, чтобы не пропускать
+# ежеминутные запуски) и максимальная пауза между проверками расписания
+SCHEDULER_TASKS = {
+    'minutely_task': os.getenv('SCHEDULE_MINUTELY', '* * * * *'),
+    'daily_task': os.getenv('SCHEDULE_DAILY', '0 9 * * *'),
+    'weekly_task': os.getenv('SCHEDULE_WEEKLY', '0 9 * * 1'),
+}
+SCHEDULER_JITTER = float(os.getenv('SCHEDULER_JITTER', 10))
+SCHEDULER_TICK = float(os.getenv('SCHEDULER_TICK', 1))
+
+# Avito API: таймауты (в секундах), пул соединений и повторы запросов
+AVITO_API_CONNECT_TIMEOUT = float(os.getenv('AVITO_API_CONNECT_TIMEOUT', 5))
+AVITO_API_TIMEOUT = float(os.getenv('AVITO_API_TIMEOUT', 30))
+AVITO_API_POOL_CONNECTIONS = int(os.getenv('AVITO_API_POOL_CONNECTIONS', 4))
+AVITO_API_POOL_MAXSIZE = int(os.getenv('AVITO_API_POOL_MAXSIZE', 20))
+AVITO_API_MAX_RETRIES = int(os.getenv('AVITO_API_MAX_RETRIES', 3))
+AVITO_API_BACKOFF_FACTOR = float(os.getenv('AVITO_API_BACKOFF_FACTOR', 0.5))
+# Максимум одновременных запросов к API при сборе статистики одного аккаунта
+AVITO_ACCOUNT_CONCURRENCY = int(os.getenv('AVITO_ACCOUNT_CONCURRENCY', 7))
+# Загрузка карточек объявлений (проверка продвижения): число одновременных
+# запросов и общее время на загрузку всех объявлений аккаунта в секундах
+AVITO_ITEM_CONCURRENCY = int(os.getenv('AVITO_ITEM_CONCURRENCY', 10))
+AVITO_ITEM_FETCH_BUDGET = float(os.getenv('AVITO_ITEM_FETCH_BUDGET', 60))
+# Постраничные ответы API: сколько следующих страниц запрашивать заранее
+# (0 - последовательно; обходы и так идут параллельно в пулах сбора статистики),
+# число потоков общего пула для таких запросов и предел числа страниц на один обход
+AVITO_PAGE_PREFETCH = int(os.getenv('AVITO_PAGE_PREFETCH', 0))
+AVITO_PAGE_PREFETCH_WORKERS = int(os.getenv('AVITO_PAGE_PREFETCH_WORKERS', 4))
+AVITO_MAX_PAGES = int(os.getenv('AVITO_MAX_PAGES', 100))
+# Максимальный период (в днях) одного запроса к API статистики v2
+# при заполнении истории с группировкой по дням
+AVITO_STATS_MAX_DAYS = int(os.getenv('AVITO_STATS_MAX_DAYS', 90))
+
+# Лимиты частоты запросов (запросов в секунду на процесс, 0 - без ограничения):
+# общий для API Авито, отдельно для каждого client_id Авито и для Telegram.
+# Каждый процесс (воркер веб-сервера, runworker, runscheduler) считает запросы
+# отдельно: при N процессах суммарная частота - до N x лимит
+AVITO_API_RATE_LIMIT = float(os.getenv('AVITO_API_RATE_LIMIT', 10))
+AVITO_CLIENT_RATE_LIMIT = float(os.getenv('AVITO_CLIENT_RATE_LIMIT', 5))
+TELEGRAM_RATE_LIMIT = float(os.getenv('TELEGRAM_RATE_LIMIT', 25))
+# До какой доли от исходной может снизиться частота после ответов 429
+RATE_LIMIT_MIN_FACTOR = float(os.getenv('RATE_LIMIT_MIN_FACTOR', 0.1))
+
+# Рассылка отчетов: число одновременно обрабатываемых аккаунтов
+# и максимальное время обработки одного аккаунта в секундах
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 5))
+REPORT_ACCOUNT_TIMEOUT = int(os.getenv('REPORT_ACCOUNT_TIMEOUT', 300))
+
+# Заполнение исторической статистики: число одновременных запросов статистики
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', 4))
+
+# Хранение ежедневной статистики: сколько дней хранить, сколько записей удалять
+# за один запрос, пауза между запросами в секундах и сворачивать ли удаляемые дни
+# в помесячные итоги (AvitoAccountMonthlyStats)
+STATS_RETENTION_DAYS = int(os.getenv('STATS_RETENTION_DAYS', 30))
+STATS_RETENTION_CHUNK_SIZE = int(os.getenv('STATS_RETENTION_CHUNK_SIZE', 1000))
+STATS_RETENTION_PAUSE = float(os.getenv('STATS_RETENTION_PAUSE', 0.5))
+STATS_MONTHLY_ROLLUP = os.getenv('STATS_MONTHLY_ROLLUP', 'True') == 'True'
+
+# Отслеживание расходов (каждую минуту): число одновременно опрашиваемых аккаунтов,
+# максимальное время опроса одного аккаунта и время жизни блокировки аккаунта
+# от наложения запусков, в секундах
+BALANCE_POLL_WORKERS = int(os.getenv('BALANCE_POLL_WORKERS', 10))
+BALANCE_POLL_TIMEOUT = int(os.getenv('BALANCE_POLL_TIMEOUT', 50))
+BALANCE_POLL_LOCK_TIMEOUT = int(os.getenv('BALANCE_POLL_LOCK_TIMEOUT', 120))
+
+# Сохранять расходы аккаунтов перед дневным/недельным сбросом в ExpenseResetHistory
+EXPENSE_RESET_HISTORY = os.getenv('EXPENSE_RESET_HISTORY', 'True') == 'True'
+
+# Обнаружение аномалий: размер окна скользящей нормы в днях и чувствительность
+# по показателям - на сколько робастных стандартных отклонений (MAD) значение
+# должно отклониться от нормы (больше - реже уведомления)
+ANOMALY_BASELINE_DAYS = int(os.getenv('ANOMALY_BASELINE_DAYS', 28))
+ANOMALY_SENSITIVITY = {
+    'total_calls': float(os.getenv('ANOMALY_SENSITIVITY_CALLS', 3)),
+    'views': float(os.getenv('ANOMALY_SENSITIVITY_VIEWS', 3)),
+    'contacts': float(os.getenv('ANOMALY_SENSITIVITY_CONTACTS', 3)),
+    'daily_expense': float(os.getenv('ANOMALY_SENSITIVITY_EXPENSE', 3)),
+    'conversion': float(os.getenv('ANOMALY_SENSITIVITY_CONVERSION', 3)),
+}
+
+# Строить отчеты по сохраненной статистике (AvitoAccountDailyStats),
+# обращаясь к API только при отсутствии или неполноте данных
+REPORTS_FROM_DB = os.getenv('REPORTS_FROM_DB', 'True') == 'True'
+
+# Токены доступа Авито: за сколько секунд до истечения обновлять токен
+# и сколько ждать, пока токен обновляет другой процесс
+AVITO_TOKEN_REFRESH_MARGIN = int(os.getenv('AVITO_TOKEN_REFRESH_MARGIN', 300))
+AVITO_TOKEN_LOCK_TIMEOUT = int(os.getenv('AVITO_TOKEN_LOCK_TIMEOUT', 30))
 
 # Application definition
 BOT_COMMANDS = [
@@ -90,9 +203,62 @@ else:
             "USER": os.getenv("NAME_DB"),
             "PASSWORD": os.getenv("PASS_DB"),
             "HOST": "127.0.0.1",
+            # Соединение переиспользуется между запросами и запусками задач
+            # планировщика не дольше DB_CONN_MAX_AGE секунд (0 - закрывать сразу)
+            "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+            "CONN_HEALTH_CHECKS": True,
         }
     }
 
+# Кэш общий для процессов веб-сервера и cron (токены Авито, статистика и т.п.)
+# CACHE_BACKEND: locmem - в памяти процесса (не общий для процессов; при
+# переполнении удаляются давно использованные записи), file - файлы на диске,
+# db - таблица в БД (создается командой manage.py createcachetable).
+# file и db при переполнении CACHE_MAX_ENTRIES удаляют записи без учета их
+# использования (file - случайные файлы, db - первые по ключу), а file при
+# каждой записи обходит каталог кэша, поэтому MAX_ENTRIES стоит держать небольшим
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'file')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'avito-reports',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'bot_cache',
+    },
+}
+CACHES = {
+    'default': {
+        **CACHE_BACKENDS[CACHE_BACKEND],
+        'OPTIONS': {
+            # При переполнении удаляется четверть записей (в locmem - самые давно использованные)
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+            'CULL_FREQUENCY': 4,
+        },
+    }
+}
+
+# Время жизни кэша ответов API Авито по типам запросов, в секундах
+AVITO_CACHE_TTLS = {
+    'daily_stats': 30 * 60,
+    # Статистика за прошедший день больше не меняется
+    'daily_stats_final': 24 * 60 * 60,
+    'weekly_stats': 60 * 60,
+    'profile_stats': 60 * 60,
+    # Услуги продвижения объявления меняются редко
+    'item_services': 12 * 60 * 60,
+    # ID пользователя Авито не меняется, хранится без срока действия
+    'user_id': None,
+    # Окна статистики для обнаружения аномалий продлеваются при каждой проверке;
+    # если проверка не запускалась неделю, окно строится заново из БД
+    'anomaly_baseline': 7 * 24 * 60 * 60,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 